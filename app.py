@@ -1,21 +1,23 @@
 import argparse
-import tempfile
 import time
 from pathlib import Path
 from typing import Optional, Tuple
 
 import gradio as gr
 import numpy as np
-import soundfile as sf
 import torch
 
-from dia.model import Dia
+from dia.model import DEFAULT_SAMPLE_RATE, Dia
+from dia.serving import BatchingWorker, GenerationRequest
 
 
 # --- Global Setup ---
 parser = argparse.ArgumentParser(description="Gradio interface for Nari TTS")
 parser.add_argument("--device", type=str, default=None, help="Force device (e.g., 'cuda', 'mps', 'cpu')")
 parser.add_argument("--share", action="store_true", help="Enable Gradio sharing")
+parser.add_argument("--max-batch-size", type=int, default=8, help="Maximum queued requests generated together")
+parser.add_argument("--max-wait-ms", type=float, default=20.0, help="How long to collect concurrent streams")
+parser.add_argument("--compile", action="store_true", help="Use torch.compile for batched generation")
 
 args = parser.parse_args()
 
@@ -44,7 +46,134 @@ except Exception as e:
     raise
 
 
-def run_inference(
+# All model work runs on this worker's thread: batched button clicks and streaming
+# requests share one model without running it from several threads at once.
+worker = BatchingWorker(model, max_batch_size=args.max_batch_size, max_wait_ms=args.max_wait_ms)
+
+
+def prepare_audio_prompt(audio_prompt_input: Optional[Tuple[int, np.ndarray]]) -> Optional[Tuple[int, np.ndarray]]:
+    """
+    Converts a Gradio numpy audio input into mono float32 in [-1, 1].
+    Returns None for a missing or silent prompt.
+    """
+    if audio_prompt_input is None:
+        return None
+    sr, audio_data = audio_prompt_input
+    # Check if audio_data is valid
+    if audio_data is None or audio_data.size == 0 or audio_data.max() == 0:  # Check for silence/empty
+        gr.Warning("Audio prompt seems empty or silent, ignoring prompt.")
+        return None
+
+    # Convert to float32 in [-1, 1] range if integer type
+    if np.issubdtype(audio_data.dtype, np.integer):
+        max_val = np.iinfo(audio_data.dtype).max
+        audio_data = audio_data.astype(np.float32) / max_val
+    elif not np.issubdtype(audio_data.dtype, np.floating):
+        gr.Warning(f"Unsupported audio prompt dtype {audio_data.dtype}, attempting conversion.")
+        try:
+            audio_data = audio_data.astype(np.float32)
+        except Exception as conv_e:
+            raise gr.Error(f"Failed to convert audio prompt to float32: {conv_e}")
+
+    # Ensure mono (average channels if stereo)
+    if audio_data.ndim > 1:
+        if audio_data.shape[0] == 2:  # Assume (2, N)
+            audio_data = np.mean(audio_data, axis=0)
+        elif audio_data.shape[1] == 2:  # Assume (N, 2)
+            audio_data = np.mean(audio_data, axis=1)
+        else:
+            gr.Warning(f"Audio prompt has unexpected shape {audio_data.shape}, taking first channel/axis.")
+            audio_data = audio_data[0] if audio_data.shape[0] < audio_data.shape[1] else audio_data[:, 0]
+    return sr, np.ascontiguousarray(audio_data, dtype=np.float32)
+
+
+def change_speed(audio: np.ndarray, speed_factor: float) -> np.ndarray:
+    """Resamples audio to play `speed_factor` times faster (slower if < 1)."""
+    # Ensure speed_factor is positive and not excessively small/large to avoid issues
+    speed_factor = max(0.1, min(speed_factor, 5.0))
+    original_len = len(audio)
+    target_len = int(original_len / speed_factor)  # Target length based on speed_factor
+    if target_len == original_len or target_len <= 0:
+        return audio
+    x_original = np.arange(original_len)
+    x_resampled = np.linspace(0, original_len - 1, target_len)
+    return np.interp(x_resampled, x_original, audio).astype(np.float32)
+
+
+def to_gradio_audio(audio: np.ndarray) -> np.ndarray:
+    """Converts float audio to int16 to prevent the Gradio conversion warning."""
+    return (np.clip(audio, -1.0, 1.0) * 32767).astype(np.int16)
+
+
+def _generate_group(texts, prompts, max_new_tokens, cfg_scale, temperature, top_p, cfg_filter_top_k):
+    """Runs one list-based generate call on the model thread."""
+    audio_prompts = [model.encode_audio(p[1], p[0]) if p is not None else None for p in prompts]
+    outputs = model.generate(
+        texts,
+        max_tokens=max_new_tokens,
+        cfg_scale=cfg_scale,
+        temperature=temperature,
+        top_p=top_p,
+        cfg_filter_top_k=cfg_filter_top_k,
+        use_torch_compile=args.compile,
+        audio_prompt=audio_prompts,
+    )
+    return outputs if len(texts) > 1 else [outputs]
+
+
+async def run_inference_batch(
+    text_inputs: list[str],
+    audio_prompt_inputs: list[Optional[Tuple[int, np.ndarray]]],
+    max_new_tokens: list[int],
+    cfg_scales: list[float],
+    temperatures: list[float],
+    top_ps: list[float],
+    cfg_filter_top_ks: list[int],
+):
+    """
+    Batched Gradio handler: Gradio passes up to `max_batch_size` queued requests as lists.
+    Requests with the same generation parameters run as one list-based `generate` call.
+    Returns the unmodified audio; the speed factor is applied in a separate event.
+    """
+    batch_size = len(text_inputs)
+    outputs = [None] * batch_size
+    groups = {}
+    for i in range(batch_size):
+        if not text_inputs[i] or text_inputs[i].isspace():
+            continue  # Raising would fail every request in the batch
+        params = (int(max_new_tokens[i]), cfg_scales[i], temperatures[i], top_ps[i], int(cfg_filter_top_ks[i]))
+        groups.setdefault(params, []).append(i)
+
+    start_time = time.time()
+    try:
+        for params, indices in groups.items():
+            texts = [text_inputs[i] for i in indices]
+            prompts = [prepare_audio_prompt(audio_prompt_inputs[i]) for i in indices]
+            results = await worker.run_in_model_thread(_generate_group, texts, prompts, *params)
+            for i, audio in zip(indices, results):
+                if audio is not None:
+                    outputs[i] = (DEFAULT_SAMPLE_RATE, audio.astype(np.float32))
+    except Exception as e:
+        print(f"Error during inference: {e}")
+        import traceback
+
+        traceback.print_exc()
+        # Re-raise as Gradio error to display nicely in the UI
+        raise gr.Error(f"Inference failed: {e}")
+    print(f"Generated batch of {batch_size} in {len(groups)} call(s), {time.time() - start_time:.2f} seconds.")
+
+    return [outputs, [apply_speed(out, 1.0) for out in outputs]]
+
+
+def apply_speed(raw_audio: Optional[Tuple[int, np.ndarray]], speed_factor: float):
+    """Applies the speed factor to the last generated audio. Runs outside the generation queue."""
+    if raw_audio is None:
+        return None
+    sr, audio = raw_audio
+    return sr, to_gradio_audio(change_speed(audio, speed_factor))
+
+
+async def stream_inference(
     text_input: str,
     audio_prompt_input: Optional[Tuple[int, np.ndarray]],
     max_new_tokens: int,
@@ -55,155 +184,32 @@ def run_inference(
     speed_factor: float,
 ):
     """
-    Runs Nari inference using the globally loaded model and provided inputs.
-    Uses temporary files for text and audio prompt compatibility with inference.generate.
+    Streams audio into the output component as it is decoded. Concurrent streams are
+    batched together by the shared worker.
     """
-    global model, device  # Access global model, config, device
-
     if not text_input or text_input.isspace():
         raise gr.Error("Text input cannot be empty.")
-
-    temp_txt_file_path = None
-    temp_audio_prompt_path = None
-    output_audio = (44100, np.zeros(1, dtype=np.float32))
-
+    prompt = prepare_audio_prompt(audio_prompt_input)
+    audio_prompt = None
+    if prompt is not None:
+        audio_prompt = await worker.run_in_model_thread(model.encode_audio, prompt[1], prompt[0])
+
+    request = GenerationRequest(
+        text=text_input,
+        audio_prompt=audio_prompt,
+        max_tokens=int(max_new_tokens),
+        cfg_scale=cfg_scale,
+        temperature=temperature,
+        top_p=top_p,
+        cfg_filter_top_k=int(cfg_filter_top_k),
+    )
     try:
-        prompt_path_for_generate = None
-        if audio_prompt_input is not None:
-            sr, audio_data = audio_prompt_input
-            # Check if audio_data is valid
-            if audio_data is None or audio_data.size == 0 or audio_data.max() == 0:  # Check for silence/empty
-                gr.Warning("Audio prompt seems empty or silent, ignoring prompt.")
-            else:
-                # Save prompt audio to a temporary WAV file
-                with tempfile.NamedTemporaryFile(mode="wb", suffix=".wav", delete=False) as f_audio:
-                    temp_audio_prompt_path = f_audio.name  # Store path for cleanup
-
-                    # Basic audio preprocessing for consistency
-                    # Convert to float32 in [-1, 1] range if integer type
-                    if np.issubdtype(audio_data.dtype, np.integer):
-                        max_val = np.iinfo(audio_data.dtype).max
-                        audio_data = audio_data.astype(np.float32) / max_val
-                    elif not np.issubdtype(audio_data.dtype, np.floating):
-                        gr.Warning(f"Unsupported audio prompt dtype {audio_data.dtype}, attempting conversion.")
-                        # Attempt conversion, might fail for complex types
-                        try:
-                            audio_data = audio_data.astype(np.float32)
-                        except Exception as conv_e:
-                            raise gr.Error(f"Failed to convert audio prompt to float32: {conv_e}")
-
-                    # Ensure mono (average channels if stereo)
-                    if audio_data.ndim > 1:
-                        if audio_data.shape[0] == 2:  # Assume (2, N)
-                            audio_data = np.mean(audio_data, axis=0)
-                        elif audio_data.shape[1] == 2:  # Assume (N, 2)
-                            audio_data = np.mean(audio_data, axis=1)
-                        else:
-                            gr.Warning(
-                                f"Audio prompt has unexpected shape {audio_data.shape}, taking first channel/axis."
-                            )
-                            audio_data = (
-                                audio_data[0] if audio_data.shape[0] < audio_data.shape[1] else audio_data[:, 0]
-                            )
-                        audio_data = np.ascontiguousarray(audio_data)  # Ensure contiguous after slicing/mean
-
-                    # Write using soundfile
-                    try:
-                        sf.write(
-                            temp_audio_prompt_path, audio_data, sr, subtype="FLOAT"
-                        )  # Explicitly use FLOAT subtype
-                        prompt_path_for_generate = temp_audio_prompt_path
-                        print(f"Created temporary audio prompt file: {temp_audio_prompt_path} (orig sr: {sr})")
-                    except Exception as write_e:
-                        print(f"Error writing temporary audio file: {write_e}")
-                        raise gr.Error(f"Failed to save audio prompt: {write_e}")
-
-        # 3. Run Generation
-
-        start_time = time.time()
-
-        # Use torch.inference_mode() context manager for the generation call
-        with torch.inference_mode():
-            output_audio_np = model.generate(
-                text_input,
-                max_tokens=max_new_tokens,
-                cfg_scale=cfg_scale,
-                temperature=temperature,
-                top_p=top_p,
-                cfg_filter_top_k=cfg_filter_top_k,  # Pass the value here
-                use_torch_compile=False,  # Keep False for Gradio stability
-                audio_prompt=prompt_path_for_generate,
-            )
-
-        end_time = time.time()
-        print(f"Generation finished in {end_time - start_time:.2f} seconds.")
-
-        # 4. Convert Codes to Audio
-        if output_audio_np is not None:
-            # Get sample rate from the loaded DAC model
-            output_sr = 44100
-
-            # --- Slow down audio ---
-            original_len = len(output_audio_np)
-            # Ensure speed_factor is positive and not excessively small/large to avoid issues
-            speed_factor = max(0.1, min(speed_factor, 5.0))
-            target_len = int(original_len / speed_factor)  # Target length based on speed_factor
-            if target_len != original_len and target_len > 0:  # Only interpolate if length changes and is valid
-                x_original = np.arange(original_len)
-                x_resampled = np.linspace(0, original_len - 1, target_len)
-                resampled_audio_np = np.interp(x_resampled, x_original, output_audio_np)
-                output_audio = (
-                    output_sr,
-                    resampled_audio_np.astype(np.float32),
-                )  # Use resampled audio
-                print(f"Resampled audio from {original_len} to {target_len} samples for {speed_factor:.2f}x speed.")
-            else:
-                output_audio = (
-                    output_sr,
-                    output_audio_np,
-                )  # Keep original if calculation fails or no change
-                print(f"Skipping audio speed adjustment (factor: {speed_factor:.2f}).")
-            # --- End slowdown ---
-
-            print(f"Audio conversion successful. Final shape: {output_audio[1].shape}, Sample Rate: {output_sr}")
-
-            # Explicitly convert to int16 to prevent Gradio warning
-            if output_audio[1].dtype == np.float32 or output_audio[1].dtype == np.float64:
-                audio_for_gradio = np.clip(output_audio[1], -1.0, 1.0)
-                audio_for_gradio = (audio_for_gradio * 32767).astype(np.int16)
-                output_audio = (output_sr, audio_for_gradio)
-                print("Converted audio to int16 for Gradio output.")
-
-        else:
-            print("\nGeneration finished, but no valid tokens were produced.")
-            # Return default silence
-            gr.Warning("Generation produced no output.")
-
+        async for chunk in worker.submit_stream(request):
+            yield DEFAULT_SAMPLE_RATE, to_gradio_audio(change_speed(chunk, speed_factor))
     except Exception as e:
-        print(f"Error during inference: {e}")
-        import traceback
-
-        traceback.print_exc()
-        # Re-raise as Gradio error to display nicely in the UI
+        print(f"Error during streaming inference: {e}")
         raise gr.Error(f"Inference failed: {e}")
 
-    finally:
-        # 5. Cleanup Temporary Files defensively
-        if temp_txt_file_path and Path(temp_txt_file_path).exists():
-            try:
-                Path(temp_txt_file_path).unlink()
-                print(f"Deleted temporary text file: {temp_txt_file_path}")
-            except OSError as e:
-                print(f"Warning: Error deleting temporary text file {temp_txt_file_path}: {e}")
-        if temp_audio_prompt_path and Path(temp_audio_prompt_path).exists():
-            try:
-                Path(temp_audio_prompt_path).unlink()
-                print(f"Deleted temporary audio prompt file: {temp_audio_prompt_path}")
-            except OSError as e:
-                print(f"Warning: Error deleting temporary audio prompt file {temp_audio_prompt_path}: {e}")
-
-    return output_audio
-
 
 # --- Create Gradio Interface ---
 css = """
@@ -289,7 +295,9 @@ with gr.Blocks(css=css) as demo:
                     info="Adjusts the speed of the generated audio (1.0 = original speed).",
                 )
 
-            run_button = gr.Button("Generate Audio", variant="primary")
+            with gr.Row():
+                run_button = gr.Button("Generate Audio", variant="primary")
+                stream_button = gr.Button("Stream Audio")
 
         with gr.Column(scale=1):
             audio_output = gr.Audio(
@@ -297,10 +305,17 @@ with gr.Blocks(css=css) as demo:
                 type="numpy",
                 autoplay=False,
             )
+            stream_output = gr.Audio(
+                label="Streamed Audio",
+                streaming=True,
+                autoplay=True,
+            )
+            # Unmodified output, so the speed factor can be re-applied without regenerating
+            raw_audio = gr.State(None)
 
-    # Link button click to function
+    # Queued clicks are processed in batches of up to `max_batch_size`
     run_button.click(
-        fn=run_inference,
+        fn=run_inference_batch,
         inputs=[
             text_input,
             audio_prompt_input,
@@ -309,10 +324,38 @@ with gr.Blocks(css=css) as demo:
             temperature,
             top_p,
             cfg_filter_top_k,
-            speed_factor_slider,
         ],
-        outputs=[audio_output],  # Add status_output here if using it
+        outputs=[raw_audio, audio_output],
+        batch=True,
+        max_batch_size=args.max_batch_size,
         api_name="generate_audio",
+    ).then(
+        # Speed adjustment happens after the batch has been returned, outside the queue
+        fn=apply_speed,
+        inputs=[raw_audio, speed_factor_slider],
+        outputs=[audio_output],
+        queue=False,
+    )
+    speed_factor_slider.release(
+        fn=apply_speed, inputs=[raw_audio, speed_factor_slider], outputs=[audio_output], queue=False
+    )
+
+    # Generators cannot be batched by Gradio; the shared worker batches concurrent streams instead
+    stream_button.click(
+        fn=stream_inference,
+        inputs=[
+            text_input,
+            audio_prompt_input,
+            max_new_tokens,
+            cfg_scale,
+            temperature,
+            top_p,
+            cfg_filter_top_k,
+            speed_factor_slider,
+        ],
+        outputs=[stream_output],
+        concurrency_limit=args.max_batch_size,
+        api_name="stream_audio",
     )
 
     # Add examples (ensure the prompt path is correct or remove it if example file doesn't exist)
@@ -353,8 +396,6 @@ with gr.Blocks(css=css) as demo:
                 cfg_filter_top_k,
                 speed_factor_slider,
             ],
-            outputs=[audio_output],
-            fn=run_inference,
             cache_examples=False,
             label="Examples (Click to Run)",
         )
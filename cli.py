@@ -7,6 +7,7 @@ import soundfile as sf
 import torch
 
 from dia.model import Dia
+from dia.profiling import ProfileConfig
 
 
 def set_seed(seed: int):
@@ -64,6 +65,12 @@ def main():
         "--temperature", type=float, default=1.3, help="Sampling temperature (higher is more random, default: 0.7)."
     )
     gen_group.add_argument("--top-p", type=float, default=0.95, help="Nucleus sampling probability (default: 0.95).")
+    gen_group.add_argument(
+        "--num-samples", type=int, default=1, help="Takes to generate; saved as <output>_<i>.<ext> (default: 1)."
+    )
+    gen_group.add_argument(
+        "--detect-runaway", action="store_true", help="End generation early if it loops on silence or repetition."
+    )
 
     infra_group = parser.add_argument_group("Infrastructure")
     infra_group.add_argument("--seed", type=int, default=None, help="Random seed for reproducibility.")
@@ -73,6 +80,18 @@ def main():
         default="cuda" if torch.cuda.is_available() else "cpu",
         help="Device to run inference on (e.g., 'cuda', 'cpu', default: auto).",
     )
+    infra_group.add_argument(
+        "--profile",
+        type=str,
+        nargs="?",
+        const="50:80",
+        default=None,
+        metavar="START:END",
+        help="Profile decode steps START to END with torch.profiler (default: 50:80; START: runs to the end).",
+    )
+    infra_group.add_argument(
+        "--profile-dir", type=str, default=".", help="Directory for the profiler trace and op table (default: .)."
+    )
 
     args = parser.parse_args()
 
@@ -87,6 +106,13 @@ def main():
         if not os.path.exists(args.checkpoint):
             parser.error(f"Checkpoint file not found: {args.checkpoint}")
 
+    profile = None
+    if args.profile is not None:
+        try:
+            profile = ProfileConfig.parse(args.profile, output_dir=args.profile_dir)
+        except ValueError as e:
+            parser.error(str(e))
+
     # Set seed if provided
     if args.seed is not None:
         set_seed(args.seed)
@@ -126,14 +152,22 @@ def main():
             cfg_scale=args.cfg_scale,
             temperature=args.temperature,
             top_p=args.top_p,
+            profile=profile,
+            runaway=args.detect_runaway,
+            num_samples=args.num_samples,
         )
         print("Audio generation complete.")
 
-        print(f"Saving audio to {args.output}...")
         os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
-
-        sf.write(args.output, output_audio, sample_rate)
-        print(f"Audio successfully saved to {args.output}")
+        if args.num_samples > 1:
+            stem, ext = os.path.splitext(args.output)
+            outputs = [(f"{stem}_{i}{ext}", audio) for i, audio in enumerate(output_audio)]
+        else:
+            outputs = [(args.output, output_audio)]
+        for path, audio in outputs:
+            print(f"Saving audio to {path}...")
+            sf.write(path, audio, sample_rate)
+            print(f"Audio successfully saved to {path}")
 
     except Exception as e:
         print(f"Error during audio generation or saving: {e}")
@@ -14,11 +14,33 @@ import numpy as np
 import sounddevice as sd
 from pathlib import Path
 
+from protocol import FrameDecoder, supported_formats
+
 # Default parameters
 DEFAULT_SERVER = "ws://localhost:8765"
 DEFAULT_TEXT = "[S1] Hello, this is a streaming audio test. [S2] The audio is being generated in real-time and streamed over WebSockets."
 
-async def stream_audio(server_url, text, audio_file=None, save_to=None):
+async def negotiate(websocket, formats):
+    """
+    Read the welcome message and negotiate binary audio frames if the server supports them
+
+    Returns:
+        The negotiated hello reply, or None if the server only speaks the legacy JSON protocol
+    """
+    welcome = json.loads(await websocket.recv())
+    if "protocol" not in welcome:
+        print("Server does not support binary frames; using base64 JSON audio")
+        return None
+
+    await websocket.send(json.dumps({"type": "hello", "protocol_version": 1, "formats": formats}))
+    reply = json.loads(await websocket.recv())
+    if "error" in reply:
+        print(f"Format negotiation failed ({reply['error']}); using base64 JSON audio")
+        return None
+    print(f"Negotiated {reply['format']} frames at {reply['sample_rate']}Hz")
+    return reply
+
+async def stream_audio(server_url, text, audio_file=None, save_to=None, formats=None):
     """
     Stream audio from the WebSocket server
     
@@ -27,6 +49,7 @@ async def stream_audio(server_url, text, audio_file=None, save_to=None):
         text: Text to convert to speech
         audio_file: Optional path to audio file for voice cloning
         save_to: Optional path to save the complete audio
+        formats: Preferred binary audio formats, in order (default: all supported locally)
     """
     print(f"Connecting to {server_url}...")
     
@@ -41,6 +64,8 @@ async def stream_audio(server_url, text, audio_file=None, save_to=None):
     # Connect to WebSocket server
     async with websockets.connect(server_url) as websocket:
         print("Connected to WebSocket server")
+        hello = await negotiate(websocket, formats or supported_formats())
+        decoder = FrameDecoder() if hello else None
         
         # Prepare request
         request = {"text": text}
@@ -52,7 +77,7 @@ async def stream_audio(server_url, text, audio_file=None, save_to=None):
         print(f"Sent text: {text[:50]}...")
         
         # Initialize variables for audio playback
-        sample_rate = 44100  # Default, will be updated from server
+        sample_rate = hello["sample_rate"] if hello else 44100  # Default, will be updated from server
         all_audio = np.array([], dtype=np.float32)
         stream = None
         
@@ -60,6 +85,19 @@ async def stream_audio(server_url, text, audio_file=None, save_to=None):
         while True:
             try:
                 response = await websocket.recv()
+
+                # Binary messages carry audio frames; text messages are JSON control messages
+                if isinstance(response, bytes):
+                    frame, audio_float32 = decoder.decode(response)
+                    sample_rate = frame.sample_rate
+                    if len(audio_float32):
+                        sd.play(audio_float32, sample_rate, blocking=False)
+                        all_audio = np.append(all_audio, audio_float32)
+                    if frame.is_final:
+                        print("Audio generation complete")
+                        break
+                    continue
+
                 data = json.loads(response)
                 
                 # Check for errors
@@ -127,6 +165,12 @@ def main():
     parser.add_argument("--text", default=DEFAULT_TEXT, help="Text to convert to speech")
     parser.add_argument("--voice", help="Path to audio file for voice cloning")
     parser.add_argument("--save", help="Path to save the complete audio")
+    parser.add_argument(
+        "--format",
+        nargs="+",
+        choices=["opus", "pcm16", "float32"],
+        help="Preferred binary audio formats, in order (default: opus if available, then pcm16)"
+    )
     args = parser.parse_args()
     
     try:
@@ -140,7 +184,7 @@ def main():
             pip.main(["install", "sounddevice", "soundfile"])
         
         # Run the async client
-        asyncio.run(stream_audio(args.server, args.text, args.voice, args.save))
+        asyncio.run(stream_audio(args.server, args.text, args.voice, args.save, args.format))
     
     except KeyboardInterrupt:
         print("\nClient stopped")
@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+"""
+Load generator for the Dia WebSocket server (real or mock).
+
+Each request opens its own connection, negotiates binary frames (or uses the legacy
+JSON protocol with --format legacy), sends one text and reads the stream until the
+final message. Requests arrive open-loop (Poisson or bursts, at scheduled times
+regardless of how the server keeps up) or closed-loop (each of --concurrency clients
+sends its next request as soon as the previous one finishes). Latencies are measured
+from the scheduled arrival time, so a saturated client pool shows up as latency
+instead of silently lowering the offered load.
+
+The JSON report contains time-to-first-audio and end-to-end latency percentiles,
+seconds of audio received per wall-clock second, and counts of dropped (error,
+timeout, disconnect) and stalled (a gap between messages above --stall-timeout)
+requests.
+
+Example:
+    python mock_server.py --rtf 2 --capacity 8 --quiet &
+    python load_test.py --server ws://localhost:8767 --requests 200 --arrival poisson --rate 4 \\
+        --concurrency 32 --text-length lognormal --mean-chars 120 --output report.json
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import random
+import time
+from dataclasses import asdict, dataclass, field
+
+import numpy as np
+import websockets
+from protocol import FrameDecoder, supported_formats
+
+
+SENTENCES = [
+    "Hello, this is a streaming audio test.",
+    "The audio is being generated in real-time and streamed over WebSockets.",
+    "How many seconds of speech can one GPU produce per second?",
+    "Batching concurrent requests keeps the decoder busy.",
+    "Oh, that is a great question! (laughs)",
+    "Let me think about it for a moment.",
+    "Every request opens its own connection.",
+    "The quick brown fox jumps over the lazy dog.",
+]
+
+
+@dataclass
+class RequestResult:
+    """Timings of one request, in seconds relative to its scheduled arrival"""
+
+    index: int
+    text_chars: int
+    scheduled_at: float
+    connected: float | None = None
+    first_audio: float | None = None
+    finished: float | None = None
+    audio_seconds: float = 0.0
+    chunks: int = 0
+    max_gap: float = 0.0
+    stalls: int = 0
+    error: str | None = None
+    gaps: list = field(default_factory=list, repr=False)
+
+    @property
+    def dropped(self):
+        return self.error is not None or self.finished is None
+
+
+def make_text(num_chars, rng):
+    """Builds a two-speaker dialogue of about `num_chars` characters"""
+    parts = []
+    length = 0
+    speaker = 1
+    while length < num_chars:
+        sentence = rng.choice(SENTENCES)
+        part = f"[S{speaker}] {sentence}"
+        parts.append(part)
+        length += len(part) + 1
+        speaker = 3 - speaker
+    return " ".join(parts)
+
+
+def sample_text_lengths(args, rng):
+    """Draws one text length per request from the configured distribution"""
+    n = args.requests
+    if args.text_length == "fixed":
+        lengths = np.full(n, args.mean_chars)
+    elif args.text_length == "uniform":
+        lengths = rng.uniform(args.min_chars, args.max_chars, n)
+    else:
+        # Lognormal with the requested mean and a coefficient of variation of --length-cv
+        sigma = np.sqrt(np.log1p(args.length_cv**2))
+        mu = np.log(args.mean_chars) - sigma**2 / 2
+        lengths = rng.lognormal(mu, sigma, n)
+    return np.clip(lengths, args.min_chars, args.max_chars).astype(int).tolist()
+
+
+def arrival_offsets(args, rng):
+    """Scheduled arrival times (seconds from start) of open-loop requests"""
+    n = args.requests
+    if args.arrival == "poisson":
+        return np.cumsum(rng.exponential(1.0 / args.rate, n)).tolist()
+    # Bursts of --burst-size requests every --burst-interval seconds
+    return [(i // args.burst_size) * args.burst_interval for i in range(n)]
+
+
+async def run_request(result, text, args, start_time):
+    """Sends one request and records its timings into `result`"""
+
+    def now():
+        return time.perf_counter() - start_time - result.scheduled_at
+
+    formats = None if args.format == "legacy" else ([args.format] if args.format else supported_formats())
+    sample_rate = 44100
+    last_message = None
+    try:
+        async with websockets.connect(args.server, max_size=None, open_timeout=args.timeout) as websocket:
+            result.connected = now()
+            welcome = json.loads(await asyncio.wait_for(websocket.recv(), args.timeout))
+            decoder = None
+            if formats and "protocol" in welcome:
+                await websocket.send(json.dumps({"type": "hello", "protocol_version": 1, "formats": formats}))
+                reply = json.loads(await asyncio.wait_for(websocket.recv(), args.timeout))
+                if "error" in reply:
+                    raise RuntimeError(f"Negotiation failed: {reply['error']}")
+                decoder = FrameDecoder()
+                sample_rate = reply["sample_rate"]
+
+            await websocket.send(json.dumps({"text": text}))
+            last_message = now()
+            while True:
+                message = await asyncio.wait_for(websocket.recv(), args.timeout)
+                received = now()
+                if isinstance(message, bytes):
+                    frame, audio = decoder.decode(message)
+                    num_samples, rate, final = len(audio), frame.sample_rate, frame.is_final
+                else:
+                    data = json.loads(message)
+                    if "error" in data:
+                        raise RuntimeError(data["error"])
+                    if "audio" not in data:
+                        continue  # status message
+                    num_samples = len(base64.b64decode(data["audio"])) // 2 if data["audio"] else 0
+                    rate, final = data.get("sample_rate", sample_rate), data.get("finished", False)
+
+                gap = received - last_message
+                last_message = received
+                if result.chunks:
+                    # Gaps after the first audio; waiting for the first chunk is measured as TTFA
+                    result.gaps.append(gap)
+                    result.max_gap = max(result.max_gap, gap)
+                    if gap > args.stall_timeout:
+                        result.stalls += 1
+                if num_samples:
+                    if result.first_audio is None:
+                        result.first_audio = received
+                    result.audio_seconds += num_samples / rate
+                    result.chunks += 1
+                if final:
+                    result.finished = received
+                    return
+    except asyncio.TimeoutError:
+        result.error = f"timeout after {args.timeout}s without a message"
+    except websockets.exceptions.ConnectionClosed as e:
+        result.error = f"connection closed: {e}"
+    except Exception as e:
+        result.error = f"{type(e).__name__}: {e}"
+
+
+async def run_load(args):
+    rng = np.random.default_rng(args.seed)
+    text_rng = random.Random(args.seed)
+    lengths = sample_text_lengths(args, rng)
+    texts = [make_text(n, text_rng) for n in lengths]
+    results = [RequestResult(index=i, text_chars=len(t), scheduled_at=0.0) for i, t in enumerate(texts)]
+    start_time = time.perf_counter()
+
+    if args.arrival == "closed":
+        # Each client sends its next request as soon as the previous one completes
+        next_index = iter(range(args.requests))
+
+        async def client():
+            for i in next_index:
+                results[i].scheduled_at = time.perf_counter() - start_time
+                await run_request(results[i], texts[i], args, start_time)
+
+        await asyncio.gather(*(client() for _ in range(args.concurrency)))
+    else:
+        semaphore = asyncio.Semaphore(args.concurrency)
+
+        async def scheduled(i, offset):
+            results[i].scheduled_at = offset
+            await asyncio.sleep(max(0.0, start_time + offset - time.perf_counter()))
+            async with semaphore:
+                await run_request(results[i], texts[i], args, start_time)
+
+        await asyncio.gather(*(scheduled(i, t) for i, t in enumerate(arrival_offsets(args, rng))))
+
+    wall_seconds = time.perf_counter() - start_time
+    return build_report(args, results, wall_seconds)
+
+
+def percentiles(values):
+    if not values:
+        return None
+    values = np.asarray(values, dtype=np.float64)
+    summary = {f"p{p}": float(np.percentile(values, p)) for p in (50, 90, 95, 99)}
+    summary.update(mean=float(values.mean()), max=float(values.max()), count=int(len(values)))
+    return summary
+
+
+def build_report(args, results, wall_seconds):
+    completed = [r for r in results if not r.dropped]
+    audio_seconds = sum(r.audio_seconds for r in results)
+    errors = {}
+    for r in results:
+        if r.error:
+            kind = r.error.split(":")[0]
+            errors[kind] = errors.get(kind, 0) + 1
+    report = {
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "include_requests")},
+        "requests": {
+            "sent": len(results),
+            "completed": len(completed),
+            "dropped": len(results) - len(completed),
+            "stalled": sum(1 for r in results if r.stalls),
+            "errors": errors,
+        },
+        "wall_seconds": wall_seconds,
+        "audio_seconds": audio_seconds,
+        "audio_seconds_per_wall_second": audio_seconds / wall_seconds if wall_seconds > 0 else 0.0,
+        "completed_per_second": len(completed) / wall_seconds if wall_seconds > 0 else 0.0,
+        "time_to_first_audio": percentiles([r.first_audio for r in results if r.first_audio is not None]),
+        "latency": percentiles([r.finished for r in completed]),
+        # Real-time factor of each stream: audio received per second between request and final message
+        "stream_rtf": percentiles([r.audio_seconds / r.finished for r in completed if r.finished > 0]),
+        "chunk_gap": percentiles([g for r in results for g in r.gaps]),
+    }
+    if args.include_requests:
+        report["per_request"] = [{k: v for k, v in asdict(r).items() if k != "gaps"} for r in results]
+    return report
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the Dia WebSocket streaming server")
+    parser.add_argument("--server", default="ws://localhost:8767", help="WebSocket server URL")
+    parser.add_argument("--requests", type=int, default=100, help="Total number of requests")
+    parser.add_argument("--concurrency", type=int, default=16, help="Maximum simultaneous connections")
+    parser.add_argument(
+        "--arrival",
+        choices=["poisson", "burst", "closed"],
+        default="poisson",
+        help="Open-loop Poisson or burst arrivals, or closed-loop clients",
+    )
+    parser.add_argument("--rate", type=float, default=2.0, help="Poisson arrival rate (requests per second)")
+    parser.add_argument("--burst-size", type=int, default=8, help="Requests per burst")
+    parser.add_argument("--burst-interval", type=float, default=5.0, help="Seconds between bursts")
+    parser.add_argument(
+        "--text-length",
+        choices=["fixed", "uniform", "lognormal"],
+        default="lognormal",
+        help="Distribution of text lengths in characters",
+    )
+    parser.add_argument("--mean-chars", type=float, default=120, help="Mean text length (fixed/lognormal)")
+    parser.add_argument("--length-cv", type=float, default=0.5, help="Coefficient of variation (lognormal)")
+    parser.add_argument("--min-chars", type=int, default=20)
+    parser.add_argument("--max-chars", type=int, default=600)
+    parser.add_argument(
+        "--format",
+        default=None,
+        help="Binary audio format to request (pcm16, float32, opus) or 'legacy' for base64 JSON "
+        "(default: every locally supported format)",
+    )
+    parser.add_argument(
+        "--stall-timeout", type=float, default=2.0, help="A gap between messages longer than this counts as a stall"
+    )
+    parser.add_argument(
+        "--timeout", type=float, default=60.0, help="Drop a request after this long without any message"
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Seed for arrivals and texts")
+    parser.add_argument("--output", default=None, help="Write the JSON report here (default: stdout)")
+    parser.add_argument("--include-requests", action="store_true", help="Include per-request timings")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    report = asyncio.run(run_load(args))
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+        print(
+            f"{report['requests']['completed']}/{report['requests']['sent']} completed, "
+            f"{report['audio_seconds_per_wall_second']:.2f} audio s per wall s; report written to {args.output}"
+        )
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,106 +2,141 @@
 """
 Simple WebSocket server that can respond to pings and simulate audio streaming
 for testing the web client connection without requiring the Dia model
+
+Audio is a sine wave whose length follows the request text, produced at a pace set by
+a configurable latency/throughput model, so `load_test.py` can be exercised with no
+model and no GPU. Like the real server it speaks both the binary frame protocol
+(after a hello) and the legacy base64 JSON messages.
 """
 
+import argparse
 import asyncio
+import random
 import websockets
 import json
 import logging
 import numpy as np
 import base64
 import time
-import os
-import sys
-from pathlib import Path
+from dataclasses import dataclass
+
+from protocol import PROTOCOL_VERSION, FrameEncoder, negotiate_format, supported_formats
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+
+@dataclass
+class LatencyModel:
+    """How long the mock server takes to "generate" audio
+
+    Attributes:
+        startup_ms: Time before the first chunk can be produced (encoder, prefill, queueing).
+        rtf: Seconds of audio one stream produces per wall-clock second when it runs alone.
+        capacity: Total seconds of audio per wall-clock second shared by all active streams,
+            like a batched model on one GPU. Each stream gets min(rtf, capacity / active).
+        chunk_ms: Audio per streamed chunk (43 DAC frames is ~500 ms).
+        chars_per_second: Text characters per second of generated audio.
+        max_audio_s: Upper bound on the audio generated for one request.
+        jitter: Relative random variation of the startup and each chunk's generation time.
+        failure_rate: Probability that a request fails partway through.
+    """
+
+    startup_ms: float = 300.0
+    rtf: float = 2.0
+    capacity: float = 8.0
+    chunk_ms: float = 500.0
+    chars_per_second: float = 15.0
+    max_audio_s: float = 30.0
+    jitter: float = 0.1
+    failure_rate: float = 0.0
+
+    def audio_seconds(self, text):
+        """Length of the audio generated for `text`"""
+        return min(max(len(text) / self.chars_per_second, self.chunk_ms / 1000), self.max_audio_s)
+
+    def stream_rate(self, active_streams):
+        """Audio seconds per wall second for one of `active_streams` concurrent streams"""
+        return min(self.rtf, self.capacity / max(active_streams, 1))
+
+    def jittered(self, seconds):
+        return max(seconds * (1 + random.uniform(-self.jitter, self.jitter)), 0.0)
+
+
 class MockAudioStreamer:
     """Mock audio streamer that generates sine waves"""
-    
-    def __init__(self):
-        self.sample_rate = 24000  # Same as Dia's sample rate
-    
+
+    def __init__(self, latency_model=None):
+        self.sample_rate = 44100  # Same as Dia's (DAC) sample rate
+        self.latency_model = latency_model or LatencyModel()
+        self.active_streams = 0
+
+    def _sine(self, start_sample, num_samples, total_samples):
+        """A 440 Hz tone with 0.1 s fades at both ends of the whole clip"""
+        n = np.arange(start_sample, start_sample + num_samples)
+        audio = 0.5 * np.sin(2 * np.pi * 440.0 * n / self.sample_rate)
+        fade_samples = int(0.1 * self.sample_rate)
+        envelope = np.minimum(1.0, np.minimum(n, total_samples - n) / fade_samples)
+        return (audio * envelope).astype(np.float32)
+
     async def generate_streaming(self, text, audio_prompt=None, callback=None):
         """
-        Generate a simple sine wave audio as a mock
-        
+        Generate a simple sine wave audio as a mock, paced by the latency model
+
         Args:
-            text: Input text (not used for mock)
+            text: Input text (only its length is used)
             audio_prompt: Optional audio for voice cloning (not used for mock)
-            callback: Async function to call with each audio chunk
+            callback: Async function to call with status messages and each audio chunk
+                (float32 numpy array under "audio"); serialization is up to the caller
         """
+        model = self.latency_model
+        self.active_streams += 1
         try:
             logger.info(f"Mock generating audio for text: {text[:50]}...")
-            
+
             # Send a preliminary message to let the client know the server is processing
             if callback:
                 await callback({
                     "status": "Generating mock audio...",
                     "finished": False
                 })
-            
-            # Generate a simple sine wave
-            duration = 3.0  # 3 seconds of audio
-            t = np.linspace(0, duration, int(self.sample_rate * duration), endpoint=False)
-            frequency = 440.0  # A4 note
-            amplitude = 0.5
-            
-            # Generate a sine wave with a slight fade-in and fade-out
-            audio = amplitude * np.sin(2 * np.pi * frequency * t)
-            
-            # Apply fade-in and fade-out (first and last 0.1 seconds)
-            fade_samples = int(0.1 * self.sample_rate)
-            fade_in = np.linspace(0, 1, fade_samples)
-            fade_out = np.linspace(1, 0, fade_samples)
-            
-            audio[:fade_samples] *= fade_in
-            audio[-fade_samples:] *= fade_out
-            
-            # If no callback, just return the output
-            if callback is None:
-                return audio
-            
-            # Define chunk size (about 50ms of audio)
-            chunk_size = int(self.sample_rate * 0.05)  # 50ms chunks
-            total_chunks = (len(audio) + chunk_size - 1) // chunk_size
-            
-            logger.info(f"Streaming {total_chunks} chunks of mock audio")
-            
-            # Stream chunks
-            for i in range(0, len(audio), chunk_size):
-                chunk = audio[i:i+chunk_size]
-                
-                # Convert to int16
-                int16_audio = (chunk * 32767).astype(np.int16)
-                
-                # Send the chunk
+
+            total_samples = int(model.audio_seconds(text) * self.sample_rate)
+            chunk_size = max(int(self.sample_rate * model.chunk_ms / 1000), 1)
+            fail_at = random.randrange(total_samples) if random.random() < model.failure_rate else None
+
+            await asyncio.sleep(model.jittered(model.startup_ms / 1000))
+
+            pieces = []
+            for start in range(0, total_samples, chunk_size):
+                num_samples = min(chunk_size, total_samples - start)
+                if start > 0:
+                    # The first chunk is covered by the startup time
+                    rate = model.stream_rate(self.active_streams)
+                    await asyncio.sleep(model.jittered(num_samples / self.sample_rate / rate))
+                if fail_at is not None and start + num_samples > fail_at:
+                    raise RuntimeError("Simulated generation failure")
+
+                chunk = self._sine(start, num_samples, total_samples)
+                pieces.append(chunk)
+                if callback:
+                    await callback({
+                        "audio": chunk,
+                        "finished": False,
+                        "sample_rate": self.sample_rate
+                    })
+
+            # Send final completion message
+            if callback:
                 await callback({
-                    "audio": base64.b64encode(int16_audio.tobytes()).decode('ascii'),
-                    "finished": False,
+                    "audio": np.zeros(0, dtype=np.float32),
+                    "finished": True,
                     "sample_rate": self.sample_rate
                 })
-                
-                # Progress indicator
-                current_chunk = i // chunk_size + 1
-                if current_chunk % 10 == 0 or current_chunk == 1:
-                    logger.info(f"Streamed chunk {current_chunk}/{total_chunks}")
-                
-                # Very minimal delay
-                await asyncio.sleep(0.01)
-            
-            # Send final completion message
-            await callback({
-                "audio": "",
-                "finished": True,
-                "sample_rate": self.sample_rate
-            })
-            logger.info("Mock audio streaming completed")
-            
-            return audio
+            logger.info(f"Mock audio streaming completed ({total_samples / self.sample_rate:.2f}s of audio)")
+
+            return np.concatenate(pieces) if pieces else np.zeros(0, dtype=np.float32)
         except Exception as e:
             logger.error(f"Error during mock audio generation: {e}")
             if callback:
@@ -110,28 +145,74 @@ class MockAudioStreamer:
                     "finished": True
                 })
             raise
+        finally:
+            self.active_streams -= 1
 
 # Global mock audio streamer instance
 audio_streamer = MockAudioStreamer()
 
+def encode_legacy_chunk(chunk_data):
+    """Serialize a message for clients that did not negotiate binary frames (base64 int16 in JSON)"""
+    if "audio" not in chunk_data:
+        return json.dumps(chunk_data)
+    int16_audio = (np.clip(chunk_data["audio"], -1.0, 1.0) * 32767).astype(np.int16)
+    return json.dumps({**chunk_data, "audio": base64.b64encode(int16_audio.tobytes()).decode('ascii')})
+
+async def handle_generation(websocket, client_address, text, audio_format=None):
+    """Run one mock generation and stream it back as binary frames or legacy JSON"""
+    encoder = FrameEncoder(audio_format, audio_streamer.sample_rate) if audio_format is not None else None
+
+    # Callback to send audio chunks back to client
+    async def send_chunk(chunk_data):
+        if encoder is not None and "audio" in chunk_data:
+            await websocket.send(encoder.encode(chunk_data["audio"], is_final=chunk_data["finished"]))
+        elif encoder is not None:
+            await websocket.send(json.dumps(chunk_data))
+        else:
+            await websocket.send(encode_legacy_chunk(chunk_data))
+
+    # Send a message that we're starting processing
+    await websocket.send(json.dumps({
+        "status": "Processing request with mock audio generator...",
+        "processing": True
+    }))
+
+    try:
+        await audio_streamer.generate_streaming(
+            text=text,
+            audio_prompt=None,  # No voice cloning in mock
+            callback=send_chunk
+        )
+        logger.info(f"Mock generation completed successfully for {client_address}")
+    except websockets.exceptions.ConnectionClosed:
+        logger.info(f"Client {client_address} disconnected during generation")
+    except Exception as e:
+        logger.error(f"Error during mock generation for {client_address}: {e}")
+
 async def websocket_handler(websocket):
     """Handle WebSocket connections"""
     client_address = websocket.remote_address
     logger.info(f"New connection from {client_address}")
-    
-    # Send immediate welcome message
+    generation_tasks = set()
+    audio_format = None
+
+    # Send immediate welcome message, advertising the binary protocol
     try:
-        await websocket.send(json.dumps({"status": "Connected to mock server", "ready": True}))
+        await websocket.send(json.dumps({
+            "status": "Connected to mock server",
+            "ready": True,
+            "protocol": {"version": PROTOCOL_VERSION, "formats": supported_formats()}
+        }))
         logger.info(f"Sent welcome message to {client_address}")
     except Exception as e:
         logger.error(f"Error sending welcome message: {e}")
-    
+
     try:
         async for message in websocket:
             try:
                 # Parse the incoming message
                 data = json.loads(message)
-                
+
                 # Handle ping requests
                 if data.get("type") == "ping":
                     logger.info(f"Received ping from {client_address}")
@@ -141,54 +222,49 @@ async def websocket_handler(websocket):
                         "message": "Mock server is running"
                     }))
                     continue
-                
+
+                # Negotiate binary audio frames
+                if data.get("type") == "hello":
+                    try:
+                        audio_format = negotiate_format(data.get("formats", ["pcm16"]))
+                    except ValueError as e:
+                        await websocket.send(json.dumps({"type": "hello", "error": str(e)}))
+                        continue
+                    encoder = FrameEncoder(audio_format, audio_streamer.sample_rate)
+                    await websocket.send(json.dumps({
+                        "type": "hello",
+                        "protocol_version": PROTOCOL_VERSION,
+                        "format": audio_format.name.lower(),
+                        "sample_rate": encoder.sample_rate
+                    }))
+                    continue
+
                 if "text" not in data:
                     logger.warning(f"Received request without text field from {client_address}")
                     await websocket.send(json.dumps({"error": "Missing 'text' field"}))
                     continue
-                
+
                 text = data.get("text")
                 logger.info(f"Received generation request from {client_address}: {text[:50]}...")
-                
-                # Callback to send audio chunks back to client
-                async def send_chunk(chunk_data):
-                    try:
-                        await websocket.send(json.dumps(chunk_data))
-                    except Exception as e:
-                        logger.error(f"Error sending chunk to {client_address}: {e}")
-                
-                # Send a message that we're starting processing
-                await websocket.send(json.dumps({
-                    "status": "Processing request with mock audio generator...",
-                    "processing": True
-                }))
-                
-                # Generate audio with streaming
-                try:
-                    await audio_streamer.generate_streaming(
-                        text=text,
-                        audio_prompt=None,  # No voice cloning in mock
-                        callback=send_chunk
-                    )
-                    logger.info(f"Mock generation completed successfully for {client_address}")
-                except Exception as e:
-                    logger.error(f"Error during mock generation for {client_address}: {e}")
-                    await websocket.send(json.dumps({
-                        "error": f"Mock generation error: {str(e)}",
-                        "finished": True
-                    }))
-                
+
+                task = asyncio.create_task(handle_generation(websocket, client_address, text, audio_format))
+                generation_tasks.add(task)
+                task.add_done_callback(generation_tasks.discard)
+
             except json.JSONDecodeError:
                 logger.error(f"Invalid JSON received from {client_address}")
                 await websocket.send(json.dumps({"error": "Invalid JSON"}))
             except Exception as e:
                 logger.error(f"Error processing message from {client_address}: {e}")
                 await websocket.send(json.dumps({"error": f"Processing error: {str(e)}"}))
-    
+
     except websockets.exceptions.ConnectionClosed as e:
         logger.info(f"Connection closed with {client_address}: {e}")
     except Exception as e:
         logger.error(f"Unexpected error with connection {client_address}: {e}")
+    finally:
+        for task in generation_tasks:
+            task.cancel()
 
 async def start_server(host="0.0.0.0", port=8767):
     """Start the WebSocket server"""
@@ -196,10 +272,46 @@ async def start_server(host="0.0.0.0", port=8767):
     logger.info(f"Mock WebSocket server running at ws://{host}:{port}")
     return server
 
+def parse_args(argv=None):
+    defaults = LatencyModel()
+    parser = argparse.ArgumentParser(description="Mock Dia WebSocket server with a latency/throughput model")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8767)
+    parser.add_argument("--startup-ms", type=float, default=defaults.startup_ms,
+                        help="Time before the first chunk of each request")
+    parser.add_argument("--rtf", type=float, default=defaults.rtf,
+                        help="Audio seconds per wall second for a single stream")
+    parser.add_argument("--capacity", type=float, default=defaults.capacity,
+                        help="Audio seconds per wall second shared by all concurrent streams")
+    parser.add_argument("--chunk-ms", type=float, default=defaults.chunk_ms, help="Audio per streamed chunk")
+    parser.add_argument("--chars-per-second", type=float, default=defaults.chars_per_second,
+                        help="Text characters per second of generated audio")
+    parser.add_argument("--max-audio-s", type=float, default=defaults.max_audio_s)
+    parser.add_argument("--jitter", type=float, default=defaults.jitter,
+                        help="Relative random variation of generation times")
+    parser.add_argument("--failure-rate", type=float, default=defaults.failure_rate,
+                        help="Probability that a request fails partway through")
+    parser.add_argument("--quiet", action="store_true", help="Only log warnings (useful under load)")
+    return parser.parse_args(argv)
+
 if __name__ == "__main__":
+    args = parse_args()
+    if args.quiet:
+        logger.setLevel(logging.WARNING)
+    audio_streamer.latency_model = LatencyModel(
+        startup_ms=args.startup_ms,
+        rtf=args.rtf,
+        capacity=args.capacity,
+        chunk_ms=args.chunk_ms,
+        chars_per_second=args.chars_per_second,
+        max_audio_s=args.max_audio_s,
+        jitter=args.jitter,
+        failure_rate=args.failure_rate,
+    )
+
     # Start the server with proper asyncio handling
     async def main():
-        server = await start_server()
+        server = await start_server(args.host, args.port)
         try:
             # Keep the server running until Ctrl+C
             await asyncio.Future()
@@ -208,7 +320,7 @@ if __name__ == "__main__":
         finally:
             server.close()
             await server.wait_closed()
-    
+
     try:
         asyncio.run(main())
     except KeyboardInterrupt:
@@ -0,0 +1,248 @@
+"""
+Binary audio framing shared by the Dia WebSocket server and the Python clients.
+
+Audio travels in binary WebSocket messages; JSON text messages are only used for
+control (hello/negotiation, status, errors, ping/pong). Each binary message is one
+frame: an 18-byte little-endian header followed by the payload.
+
+    offset  size  field
+    0       2     magic b"DA"
+    2       1     protocol version
+    3       1     payload format (1 = pcm16, 2 = float32, 3 = opus)
+    4       1     flags (bit 0: final frame of the stream)
+    5       1     reserved
+    6       4     sequence number (per stream, starting at 0)
+    10      4     sample rate of the decoded audio
+    14      4     number of decoded samples in this frame
+
+PCM16 and float32 payloads are raw little-endian mono samples. Opus payloads are a
+sequence of packets, each prefixed with its uint16 length; every packet decodes to
+20 ms of audio. Opus support needs the optional `opuslib` package on both sides.
+
+Negotiation: after the server's welcome message the client sends
+    {"type": "hello", "protocol_version": 1, "formats": ["opus", "pcm16"]}
+listing formats in order of preference. The server answers with
+    {"type": "hello", "protocol_version": 1, "format": "pcm16", "sample_rate": 44100}
+and from then on streams binary frames. Clients that never send a hello keep
+receiving the legacy base64 JSON messages.
+"""
+
+import struct
+from dataclasses import dataclass
+from enum import IntEnum
+
+import numpy as np
+
+
+PROTOCOL_VERSION = 1
+MAGIC = b"DA"
+FLAG_FINAL = 0x01
+HEADER = struct.Struct("<2sBBBxIII")
+
+# Opus only supports these sample rates; audio is resampled to 48 kHz before encoding.
+OPUS_SAMPLE_RATE = 48000
+OPUS_FRAME_MS = 20
+_PACKET_LENGTH = struct.Struct("<H")
+
+
+class AudioFormat(IntEnum):
+    PCM16 = 1
+    FLOAT32 = 2
+    OPUS = 3
+
+    @classmethod
+    def from_name(cls, name):
+        try:
+            return cls[name.upper()]
+        except KeyError:
+            raise ValueError(f"Unknown audio format '{name}'") from None
+
+
+@dataclass
+class AudioFrame:
+    """A decoded frame header plus its raw payload"""
+
+    sequence: int
+    sample_rate: int
+    format: AudioFormat
+    is_final: bool
+    num_samples: int
+    payload: bytes
+
+
+def opus_available():
+    """Returns True if the optional `opuslib` package can be imported"""
+    try:
+        import opuslib  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def supported_formats():
+    """Format names this process can encode and decode, most compact first"""
+    names = ["pcm16", "float32"]
+    if opus_available():
+        names.insert(0, "opus")
+    return names
+
+
+def negotiate_format(requested, available=None):
+    """Picks the first of the client's requested formats that is available here
+
+    Raises:
+        ValueError: If none of the requested formats is supported.
+    """
+    available = supported_formats() if available is None else available
+    for name in requested:
+        if name.lower() in available:
+            return AudioFormat.from_name(name)
+    raise ValueError(f"None of the requested formats {list(requested)} is supported (available: {available})")
+
+
+def pack_frame(sequence, sample_rate, audio_format, payload, num_samples, is_final=False):
+    """Builds one binary frame"""
+    flags = FLAG_FINAL if is_final else 0
+    header = HEADER.pack(MAGIC, PROTOCOL_VERSION, int(audio_format), flags, sequence, sample_rate, num_samples)
+    return header + payload
+
+
+def unpack_frame(data):
+    """Parses one binary frame
+
+    Raises:
+        ValueError: If the data is not a frame of a supported protocol version.
+    """
+    if len(data) < HEADER.size:
+        raise ValueError(f"Frame too short ({len(data)} bytes)")
+    magic, version, audio_format, flags, sequence, sample_rate, num_samples = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError("Not a Dia audio frame")
+    if version > PROTOCOL_VERSION:
+        raise ValueError(f"Unsupported protocol version {version} (max {PROTOCOL_VERSION})")
+    return AudioFrame(
+        sequence=sequence,
+        sample_rate=sample_rate,
+        format=AudioFormat(audio_format),
+        is_final=bool(flags & FLAG_FINAL),
+        num_samples=num_samples,
+        payload=bytes(data[HEADER.size :]),
+    )
+
+
+class _LinearResampler:
+    """Streaming linear-interpolation resampler that stays continuous across chunks"""
+
+    def __init__(self, input_rate, output_rate):
+        self.step = input_rate / output_rate
+        self._tail = np.zeros(0, dtype=np.float32)
+        self._position = 0.0
+
+    def __call__(self, audio):
+        buffer = np.concatenate([self._tail, audio])
+        if len(buffer) < 2:
+            self._tail = buffer
+            return np.zeros(0, dtype=np.float32)
+        positions = np.arange(self._position, len(buffer) - 1, self.step)
+        out = np.interp(positions, np.arange(len(buffer)), buffer).astype(np.float32)
+        next_position = positions[-1] + self.step if len(positions) else self._position
+        # Keep the last input sample so the next chunk interpolates from it.
+        self._position = next_position - (len(buffer) - 1)
+        self._tail = buffer[-1:]
+        return out
+
+
+class FrameEncoder:
+    """Turns float32 audio chunks of one stream into binary frames
+
+    Args:
+        audio_format: Payload format.
+        sample_rate: Sample rate of the input audio. Opus output is always 48 kHz.
+    """
+
+    def __init__(self, audio_format, sample_rate):
+        self.format = AudioFormat(audio_format)
+        self.input_rate = sample_rate
+        self.sample_rate = sample_rate
+        self.sequence = 0
+        if self.format == AudioFormat.OPUS:
+            import opuslib
+
+            self.sample_rate = OPUS_SAMPLE_RATE
+            self._opus = opuslib.Encoder(OPUS_SAMPLE_RATE, 1, opuslib.APPLICATION_AUDIO)
+            self._frame_size = OPUS_SAMPLE_RATE * OPUS_FRAME_MS // 1000
+            self._resample = _LinearResampler(sample_rate, OPUS_SAMPLE_RATE)
+            self._pending = np.zeros(0, dtype=np.float32)
+
+    def encode(self, audio, is_final=False):
+        """Encodes one chunk (may be empty) and returns the frame bytes"""
+        audio = np.asarray(audio, dtype=np.float32)
+        if self.format == AudioFormat.PCM16:
+            payload = (np.clip(audio, -1.0, 1.0) * 32767).astype("<i2").tobytes()
+            num_samples = len(audio)
+        elif self.format == AudioFormat.FLOAT32:
+            payload = audio.astype("<f4").tobytes()
+            num_samples = len(audio)
+        else:
+            payload, num_samples = self._encode_opus(audio, is_final)
+        frame = pack_frame(self.sequence, self.sample_rate, self.format, payload, num_samples, is_final)
+        self.sequence += 1
+        return frame
+
+    def _encode_opus(self, audio, is_final):
+        pending = np.concatenate([self._pending, self._resample(audio)])
+        if is_final and len(pending) % self._frame_size:
+            pending = np.pad(pending, (0, self._frame_size - len(pending) % self._frame_size))
+        num_packets = len(pending) // self._frame_size
+        pcm = (np.clip(pending[: num_packets * self._frame_size], -1.0, 1.0) * 32767).astype("<i2")
+        self._pending = pending[num_packets * self._frame_size :]
+
+        packets = []
+        for i in range(num_packets):
+            samples = pcm[i * self._frame_size : (i + 1) * self._frame_size]
+            packet = self._opus.encode(samples.tobytes(), self._frame_size)
+            packets.append(_PACKET_LENGTH.pack(len(packet)) + packet)
+        return b"".join(packets), num_packets * self._frame_size
+
+
+class FrameDecoder:
+    """Decodes the binary frames of one stream back to float32 audio"""
+
+    def __init__(self):
+        self._opus = None
+        self.expected_sequence = 0
+
+    def decode(self, data):
+        """Returns `(frame, audio)` for one binary message
+
+        Raises:
+            ValueError: If the frame is malformed or arrives out of order.
+        """
+        frame = unpack_frame(data)
+        if frame.sequence != self.expected_sequence:
+            raise ValueError(f"Expected frame {self.expected_sequence}, got {frame.sequence}")
+        self.expected_sequence += 1
+
+        if frame.format == AudioFormat.PCM16:
+            audio = np.frombuffer(frame.payload, dtype="<i2").astype(np.float32) / 32767.0
+        elif frame.format == AudioFormat.FLOAT32:
+            audio = np.frombuffer(frame.payload, dtype="<f4").astype(np.float32)
+        else:
+            audio = self._decode_opus(frame)
+        return frame, audio
+
+    def _decode_opus(self, frame):
+        if self._opus is None:
+            import opuslib
+
+            self._opus = opuslib.Decoder(frame.sample_rate, 1)
+        frame_size = frame.sample_rate * OPUS_FRAME_MS // 1000
+        pieces = []
+        offset = 0
+        while offset < len(frame.payload):
+            (length,) = _PACKET_LENGTH.unpack_from(frame.payload, offset)
+            offset += _PACKET_LENGTH.size
+            pcm = self._opus.decode(frame.payload[offset : offset + length], frame_size)
+            pieces.append(np.frombuffer(pcm, dtype="<i2").astype(np.float32) / 32767.0)
+            offset += length
+        return np.concatenate(pieces) if pieces else np.zeros(0, dtype=np.float32)
@@ -3,123 +3,125 @@ import websockets
 import json
 import logging
 import numpy as np
-import torch
 import base64
 import os
 import time
 import sys
 from pathlib import Path
 
-# Add the parent directory to the Python path to find the dia module
+# Add the parent directories to the Python path to find the dia module and the shared protocol
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../../../..")))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../../..")))
 
-from dia.model import Dia
+from dia import metrics
+from dia.model import DEFAULT_SAMPLE_RATE, Dia
+from dia.serving import BatchingWorker, GenerationRequest
+from protocol import PROTOCOL_VERSION, FrameEncoder, negotiate_format, supported_formats
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Prometheus metrics are served over plain HTTP on a separate port
+METRICS_PORT = int(os.environ.get("DIA_METRICS_PORT", "8768"))
+
 class AudioStreamer:
-    """Handles streaming audio generation from Dia model"""
-    
-    def __init__(self):
+    """Handles streaming audio generation from Dia model
+
+    Generation runs on the model thread of a shared BatchingWorker, so the event loop
+    stays responsive and concurrent connections are batched into one generate call.
+    Audio is sent as soon as each window is DAC-decoded, not after generation ends.
+    """
+
+    def __init__(self, max_batch_size=8, max_wait_ms=20.0):
         self.model = None
-        self.sample_rate = 24000  # Dia's default sample rate is 24kHz
-    
-    def load_model(self):
-        """Lazy loading of the model"""
-        if self.model is None:
-            logger.info("Loading Dia model...")
-            self.model = Dia.from_pretrained("nari-labs/Dia-1.6B", compute_dtype="float16")
-            logger.info("Model loaded successfully")
-            # Dia model uses 24kHz not 44.1kHz
-            self.sample_rate = 24000
-    
-    async def generate_streaming(self, text, audio_prompt=None, callback=None):
+        self.worker = None
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.sample_rate = DEFAULT_SAMPLE_RATE  # DAC output is 44.1kHz
+        self._load_lock = asyncio.Lock()
+
+    async def load_model(self):
+        """Lazy loading of the model, off the event loop"""
+        async with self._load_lock:
+            if self.worker is None:
+                logger.info("Loading Dia model...")
+                self.model = await asyncio.to_thread(
+                    Dia.from_pretrained, "nari-labs/Dia-1.6B", compute_dtype="float16"
+                )
+                self.worker = BatchingWorker(
+                    self.model, max_batch_size=self.max_batch_size, max_wait_ms=self.max_wait_ms
+                )
+                await self.worker.start()
+                logger.info("Model loaded successfully")
+
+    async def generate_streaming(self, text, audio_prompt=None, callback=None, seed=None, timeout=None):
         """
-        Generate audio from text with streaming capability
-        
+        Generate audio from text, streaming each decoded window as soon as it exists
+
         Args:
             text: Input text to convert to speech
-            audio_prompt: Optional audio for voice cloning (file path or array)
-            callback: Async function to call with each audio chunk
+            audio_prompt: Optional audio for voice cloning (file path or encoded audio file bytes)
+            callback: Async function to call with status messages and each audio chunk
+                (float32 numpy array under "audio"); serialization is up to the caller
+            seed: Optional random seed; identical seeded requests in flight share one generation
+            timeout: Optional limit in seconds; generation stops there and the audio so far is kept
+
+        Returns:
+            The full generated audio as a float32 numpy array
         """
-        self.load_model()
-        
+        await self.load_model()
+
         try:
             logger.info(f"Generating audio for text: {text[:50]}...")
-            
+
             # Send a preliminary message to let the client know the server is processing
             if callback:
                 await callback({
                     "status": "Generating audio...",
                     "finished": False
                 })
-            
-            # Generate audio (Dia doesn't support callbacks, so we need to generate the full audio first)
-            logger.info("Starting audio generation")
+
+            # Queue the request on the shared model worker; other connections keep being served
+            logger.info(f"Queueing audio generation (queue depth: {self.worker.queue_depth})")
             generate_start_time = time.time()
-            output = self.model.generate(
-                text,
-                audio_prompt=audio_prompt,
-                use_torch_compile=False,  # Try without compilation to avoid issues
-                verbose=True
-            )
+            first_chunk_time = None
+            pieces = []
+
+            # If this task is cancelled (client disconnect or cancel message), closing the stream
+            # stops the row on the model thread at its next decode step.
+            request = GenerationRequest(text=text, audio_prompt=audio_prompt, seed=seed, timeout=timeout)
+            async for chunk in self.worker.submit_stream(request):
+                if first_chunk_time is None:
+                    first_chunk_time = time.time() - generate_start_time
+                    logger.info(f"Time to first chunk: {first_chunk_time:.2f} seconds")
+                pieces.append(chunk)
+
+                if callback:
+                    await callback({
+                        "audio": chunk,
+                        "finished": False,
+                        "sample_rate": self.sample_rate
+                    })
+
+            output = np.concatenate(pieces) if pieces else np.zeros(0, dtype=np.float32)
             generate_time = time.time() - generate_start_time
-            logger.info(f"Audio generation completed in {generate_time:.2f} seconds")
-            
-            # If no callback, just return the output
-            if callback is None:
-                return output
-            
-            # We need to manually stream the audio in chunks
-            # Convert to numpy if it's a torch tensor
-            if isinstance(output, torch.Tensor):
-                logger.info("Converting torch tensor to numpy array")
-                audio = output.squeeze().cpu().numpy()
-            else:
-                logger.info(f"Output is type: {type(output)}")
-                audio = output
-            
-            logger.info(f"Audio shape: {audio.shape}, dtype: {audio.dtype}")
-            
-            # Define chunk size (about 50ms of audio at 24000Hz)
-            chunk_size = int(self.sample_rate * 0.05)  # 50ms chunks
-            total_chunks = (len(audio) + chunk_size - 1) // chunk_size
-            
-            logger.info(f"Streaming {total_chunks} chunks of audio")
-            
-            # Stream chunks immediately with minimal delay
-            for i in range(0, len(audio), chunk_size):
-                chunk = audio[i:i+chunk_size]
-                
-                # Convert to int16
-                int16_audio = (chunk * 32767).astype(np.int16)
-                
-                # Send the chunk
+            logger.info(
+                f"Audio generation completed in {generate_time:.2f} seconds "
+                f"({len(pieces)} chunks, {len(output) / self.sample_rate:.2f}s of audio)"
+            )
+            coalescing = self.worker.coalescing_stats()
+            logger.info(f"Coalescing: {coalescing['hits']}/{coalescing['lookups']} hits ({coalescing['hit_rate']:.1%})")
+
+            # Send final completion message
+            if callback:
                 await callback({
-                    "audio": base64.b64encode(int16_audio.tobytes()).decode('ascii'),
-                    "finished": False,
+                    "audio": np.zeros(0, dtype=np.float32),
+                    "finished": True,
                     "sample_rate": self.sample_rate
                 })
-                
-                # Progress indicator
-                current_chunk = i // chunk_size + 1
-                if current_chunk % 10 == 0 or current_chunk == 1:
-                    logger.info(f"Streamed chunk {current_chunk}/{total_chunks}")
-                
-                # Very minimal delay to prevent overwhelming the connection
-                # For faster streaming, we're using a much smaller delay
-                await asyncio.sleep(0.01)
-            
-            # Send final completion message
-            await callback({
-                "audio": "",
-                "finished": True,
-                "sample_rate": self.sample_rate
-            })
             logger.info("Audio streaming completed")
-            
+
             return output
         except Exception as e:
             logger.error(f"Error during audio generation: {e}")
@@ -133,24 +135,89 @@ class AudioStreamer:
 # Global audio streamer instance
 audio_streamer = AudioStreamer()
 
+def encode_legacy_chunk(chunk_data):
+    """Serialize a message for clients that did not negotiate binary frames (base64 int16 in JSON)"""
+    if "audio" not in chunk_data:
+        return json.dumps(chunk_data)
+    int16_audio = (np.clip(chunk_data["audio"], -1.0, 1.0) * 32767).astype(np.int16)
+    return json.dumps({**chunk_data, "audio": base64.b64encode(int16_audio.tobytes()).decode('ascii')})
+
+async def handle_generation(websocket, client_address, text, audio_prompt, audio_format=None, seed=None, timeout=None):
+    """Run one generation request for a connection and stream the result back
+
+    Audio is sent as binary frames in `audio_format` if the client negotiated one,
+    otherwise as legacy base64 JSON messages.
+    """
+    encoder = FrameEncoder(audio_format, audio_streamer.sample_rate) if audio_format is not None else None
+
+    # Callback to send audio chunks back to client
+    async def send_chunk(chunk_data):
+        try:
+            if encoder is not None and "audio" in chunk_data:
+                await websocket.send(encoder.encode(chunk_data["audio"], is_final=chunk_data["finished"]))
+            elif encoder is not None:
+                await websocket.send(json.dumps(chunk_data))
+            else:
+                await websocket.send(encode_legacy_chunk(chunk_data))
+        except Exception as e:
+            logger.error(f"Error sending chunk to {client_address}: {e}")
+
+    # Send a message that we're starting processing
+    await websocket.send(json.dumps({
+        "status": "Processing request... This may take a moment for the first request.",
+        "processing": True
+    }))
+
+    # Generate audio with streaming
+    try:
+        await audio_streamer.generate_streaming(
+            text=text,
+            audio_prompt=audio_prompt,
+            callback=send_chunk,
+            seed=seed,
+            timeout=timeout
+        )
+        logger.info(f"Generation completed successfully for {client_address}")
+    except asyncio.CancelledError:
+        logger.info(f"Generation cancelled for {client_address}")
+        raise
+    except Exception as e:
+        logger.error(f"Error during generation for {client_address}: {e}", exc_info=True)
+        try:
+            await websocket.send(json.dumps({
+                "error": f"Generation error: {str(e)}",
+                "finished": True
+            }))
+        except websockets.exceptions.ConnectionClosed:
+            pass
+
 async def websocket_handler(websocket):
     """Handle WebSocket connections"""
     client_address = websocket.remote_address
     logger.info(f"New connection from {client_address}")
-    
-    # Send immediate welcome message
+    # Generation runs in a background task so this connection keeps answering pings. Frames
+    # carry no request id, so only one generation may run per connection at a time.
+    generation_task = None
+    # Binary payload format, once the client has negotiated one with a hello message
+    audio_format = None
+
+    # Send immediate welcome message, advertising the binary protocol
     try:
-        await websocket.send(json.dumps({"status": "Connected to server", "ready": True}))
+        await websocket.send(json.dumps({
+            "status": "Connected to server",
+            "ready": True,
+            "protocol": {"version": PROTOCOL_VERSION, "formats": supported_formats()}
+        }))
         logger.info(f"Sent welcome message to {client_address}")
     except Exception as e:
         logger.error(f"Error sending welcome message: {e}")
-    
+
     try:
         async for message in websocket:
             try:
                 # Parse the incoming message
                 data = json.loads(message)
-                
+
                 # Handle ping requests
                 if data.get("type") == "ping":
                     logger.info(f"Received ping from {client_address}")
@@ -160,67 +227,87 @@ async def websocket_handler(websocket):
                         "message": "Server is running"
                     }))
                     continue
-                
+
+                # Stop this connection's generation; its batch row is freed at the next step
+                if data.get("type") == "cancel":
+                    cancelled = generation_task is not None and not generation_task.done()
+                    if cancelled:
+                        logger.info(f"Cancelling the generation for {client_address}")
+                        generation_task.cancel()
+                    generation_task = None
+                    await websocket.send(json.dumps({"type": "cancel", "cancelled": int(cancelled)}))
+                    continue
+
+                # Negotiate binary audio frames
+                if data.get("type") == "hello":
+                    try:
+                        audio_format = negotiate_format(data.get("formats", ["pcm16"]))
+                    except ValueError as e:
+                        await websocket.send(json.dumps({"type": "hello", "error": str(e)}))
+                        continue
+                    encoder = FrameEncoder(audio_format, audio_streamer.sample_rate)
+                    logger.info(f"Client {client_address} negotiated {audio_format.name.lower()} frames")
+                    await websocket.send(json.dumps({
+                        "type": "hello",
+                        "protocol_version": PROTOCOL_VERSION,
+                        "format": audio_format.name.lower(),
+                        "sample_rate": encoder.sample_rate
+                    }))
+                    continue
+
                 if "text" not in data:
                     logger.warning(f"Received request without text field from {client_address}")
                     await websocket.send(json.dumps({"error": "Missing 'text' field"}))
                     continue
-                
+
+                if generation_task is not None and not generation_task.done():
+                    logger.warning(f"Rejected a request from {client_address}: a generation is already running")
+                    await websocket.send(json.dumps({
+                        "type": "busy",
+                        "error": "A generation is already running on this connection; "
+                                 "wait for it to finish or send a cancel message first"
+                    }))
+                    continue
+
                 text = data.get("text")
                 logger.info(f"Received generation request from {client_address}: {text[:50]}...")
-                
+
                 # Handle voice cloning
                 audio_prompt = None
                 if "audio_prompt" in data and data["audio_prompt"]:
                     logger.info(f"Processing voice prompt from {client_address}...")
-                    audio_data = base64.b64decode(data["audio_prompt"])
-                    # Convert to numpy array
-                    audio_prompt = np.frombuffer(audio_data, dtype=np.float32)
-                
-                # Callback to send audio chunks back to client
-                async def send_chunk(chunk_data):
-                    try:
-                        await websocket.send(json.dumps(chunk_data))
-                    except Exception as e:
-                        logger.error(f"Error sending chunk to {client_address}: {e}")
-                
-                # Send a message that we're starting processing
-                await websocket.send(json.dumps({
-                    "status": "Processing request... This may take a moment for the first request.",
-                    "processing": True
-                }))
-                
-                # Generate audio with streaming
-                try:
-                    await audio_streamer.generate_streaming(
-                        text=text,
-                        audio_prompt=audio_prompt,
-                        callback=send_chunk
+                    # Clients send the encoded audio file; it is decoded and DAC-encoded on the model thread
+                    audio_prompt = base64.b64decode(data["audio_prompt"])
+
+                generation_task = asyncio.create_task(
+                    handle_generation(
+                        websocket, client_address, text, audio_prompt, audio_format,
+                        seed=data.get("seed"), timeout=data.get("timeout")
                     )
-                    logger.info(f"Generation completed successfully for {client_address}")
-                except Exception as e:
-                    logger.error(f"Error during generation for {client_address}: {e}", exc_info=True)
-                    await websocket.send(json.dumps({
-                        "error": f"Generation error: {str(e)}",
-                        "finished": True
-                    }))
-                
+                )
+
             except json.JSONDecodeError:
                 logger.error(f"Invalid JSON received from {client_address}")
                 await websocket.send(json.dumps({"error": "Invalid JSON"}))
             except Exception as e:
                 logger.error(f"Error processing message from {client_address}: {e}", exc_info=True)
                 await websocket.send(json.dumps({"error": f"Processing error: {str(e)}"}))
-    
+
     except websockets.exceptions.ConnectionClosed as e:
         logger.info(f"Connection closed with {client_address}: {e}")
     except Exception as e:
         logger.error(f"Unexpected error with connection {client_address}: {e}", exc_info=True)
+    finally:
+        if generation_task is not None:
+            generation_task.cancel()
 
-async def start_server(host="0.0.0.0", port=8767):
-    """Start the WebSocket server"""
+async def start_server(host="0.0.0.0", port=8767, metrics_port=METRICS_PORT):
+    """Start the WebSocket server, plus the metrics endpoint unless metrics_port is None"""
     server = await websockets.serve(websocket_handler, host, port)
     logger.info(f"WebSocket server running at ws://{host}:{port}")
+    if metrics_port is not None:
+        metrics.start_http_server(metrics_port, host)
+        logger.info(f"Metrics available at http://{host}:{metrics_port}/metrics")
     return server
 
 if __name__ == "__main__":
@@ -235,7 +322,7 @@ if __name__ == "__main__":
         finally:
             server.close()
             await server.wait_closed()
-    
+
     try:
         asyncio.run(main())
     except KeyboardInterrupt:
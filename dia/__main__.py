@@ -0,0 +1,35 @@
+"""Command-line entry point for the `dia` package.
+
+Usage:
+    dia <command> [options]
+    python -m dia <command> [options]
+"""
+
+import importlib
+import sys
+
+
+COMMANDS = {
+    "convert": ("dia.convert", "Convert a checkpoint into an inference-optimized bundle."),
+    "batch": ("dia.batch", "Generate audio for every row of a JSONL/CSV manifest."),
+    "pipeline": ("dia.pipeline", "Generate a manifest with several CPU worker processes sharing mmap'd weights."),
+    "bench": ("dia.bench", "Run reproducible generation benchmarks and compare reports."),
+    "serve": ("dia.server", "Serve an OpenAI-style /v1/audio/speech HTTP endpoint."),
+}
+
+
+def main(argv: list[str] | None = None) -> int:
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] not in COMMANDS:
+        print("usage: dia <command> [options]\n\ncommands:")
+        for name, (_, help_text) in COMMANDS.items():
+            print(f"  {name:<12} {help_text}")
+        return 0 if argv and argv[0] in ("-h", "--help") else 2
+
+    module_name, _ = COMMANDS[argv[0]]
+    module = importlib.import_module(module_name)
+    return module.main(argv[1:])
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,366 @@
+"""Offline batch synthesis from JSONL or CSV manifests.
+
+Each manifest row describes one output: `text` (required), and optionally `id`,
+`output`, `audio_prompt`, `seed`, `max_tokens`, `cfg_scale`, `temperature`, `top_p` and
+`cfg_filter_top_k`. Rows are grouped by their sampling parameters, sorted by expected
+audio length and generated in batches, so rows of a batch finish at about the same
+step. Audio files are written by a background thread pool while the next batch runs.
+
+Every finished or failed row is appended to a progress file (JSONL). Rerunning the same
+command skips rows already written, so an interrupted run resumes where it stopped.
+
+Usage:
+    dia batch script.jsonl --output-dir ./out --batch-size 16
+    dia batch lines.csv --output-dir ./out --seed 42 --writers 4
+
+A row's seed drives only that row's sampling, so a seeded row renders the same audio
+whatever it is batched with, including after a resume.
+"""
+
+import argparse
+import csv
+import json
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from itertools import groupby
+from typing import Iterator
+
+import numpy as np
+import torch
+
+from .length import LengthPredictor
+from .model import DEFAULT_SAMPLE_RATE, Dia
+
+
+PARAM_FIELDS = ("max_tokens", "cfg_scale", "temperature", "top_p", "cfg_filter_top_k", "seed")
+# Seeds are per row (see `Dia.generate`), so they do not split batches.
+BATCH_FIELDS = PARAM_FIELDS[:-1]
+FLOAT_FIELDS = ("cfg_scale", "temperature", "top_p")
+
+
+@dataclass
+class ManifestEntry:
+    """One row of a manifest, with defaults filled in from the command line."""
+
+    id: str
+    text: str
+    output: str
+    audio_prompt: str | None = None
+    seed: int | None = None
+    max_tokens: int | None = None
+    cfg_scale: float = 3.0
+    temperature: float = 1.3
+    top_p: float = 0.95
+    cfg_filter_top_k: int = 45
+    expected_frames: int = field(default=0, compare=False)
+
+    def batch_key(self) -> tuple:
+        """Rows with equal keys can share one `Dia.generate` call."""
+        return tuple(getattr(self, name) for name in BATCH_FIELDS)
+
+
+def read_manifest(path: str, output_dir: str, defaults: dict, audio_format: str = "wav") -> list[ManifestEntry]:
+    """Reads a `.jsonl` or `.csv` manifest.
+
+    Args:
+        path: The manifest path. CSV files need a header row.
+        output_dir: Directory for rows without an `output` path; relative outputs are resolved against it.
+        defaults: Default values for the sampling parameters.
+        audio_format: File extension used for rows without an `output` path.
+
+    Returns:
+        The entries, in manifest order.
+
+    Raises:
+        ValueError: If a row has no text or two rows share an id.
+    """
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.endswith(".csv"):
+            rows = list(csv.DictReader(f))
+        else:
+            rows = [json.loads(line) for line in f if line.strip()]
+
+    entries = []
+    seen = set()
+    for i, row in enumerate(rows):
+        if not row.get("text"):
+            raise ValueError(f"{path}: row {i} has no text")
+        entry_id = str(row.get("id") or i)
+        if entry_id in seen:
+            raise ValueError(f"{path}: duplicate id {entry_id!r}")
+        seen.add(entry_id)
+        output = row.get("output") or f"{entry_id}.{audio_format}"
+        params = dict(defaults)
+        for name in PARAM_FIELDS:
+            value = row.get(name)
+            if value not in (None, ""):
+                params[name] = float(value) if name in FLOAT_FIELDS else int(value)
+        entries.append(
+            ManifestEntry(
+                id=entry_id,
+                text=row["text"],
+                output=os.path.join(output_dir, output),
+                audio_prompt=row.get("audio_prompt") or None,
+                **params,
+            )
+        )
+    return entries
+
+
+def expected_frames(entry: ManifestEntry, max_frames: int, predictor: LengthPredictor | None = None) -> int:
+    """An estimate of the audio frames a row will generate, used to sort rows (see `dia.length`)."""
+    estimate = round((predictor or LengthPredictor()).schedule_key(entry.text))
+    return min(estimate, entry.max_tokens or max_frames, max_frames)
+
+
+def plan_batches(
+    entries: list[ManifestEntry], batch_size: int, max_frames: int, predictor: LengthPredictor | None = None
+) -> list[list[ManifestEntry]]:
+    """Groups entries by sampling parameters, sorts each group by expected length and splits it into batches.
+
+    Batches are returned longest first, so the slowest work is not left for the end.
+    """
+    for entry in entries:
+        entry.expected_frames = expected_frames(entry, max_frames, predictor)
+    ordered = sorted(entries, key=lambda e: (repr(e.batch_key()), -e.expected_frames))
+    batches = []
+    for _, group in groupby(ordered, key=lambda e: repr(e.batch_key())):
+        group = list(group)
+        batches.extend(group[i : i + batch_size] for i in range(0, len(group), batch_size))
+    batches.sort(key=lambda b: -b[0].expected_frames)
+    return batches
+
+
+class ProgressLog:
+    """Append-only JSONL record of finished rows, used to resume a run."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self.done: set[str] = set()
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # a line cut short by an interrupted run
+                    if record.get("status") == "ok":
+                        self.done.add(record["id"])
+
+    def is_done(self, entry: ManifestEntry) -> bool:
+        return entry.id in self.done and os.path.exists(entry.output)
+
+    def record(self, entry_id: str, status: str, **fields) -> None:
+        line = json.dumps({"id": entry_id, "status": status, **fields})
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+            if status == "ok":
+                self.done.add(entry_id)
+
+
+def write_audio(path: str, audio: np.ndarray) -> None:
+    """Writes 44.1 kHz audio, creating the parent directory. The format follows the extension."""
+    import soundfile as sf
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    sf.write(path, audio, DEFAULT_SAMPLE_RATE)
+
+
+class AudioWriter:
+    """Writes audio files on a thread pool and records each result in the progress log."""
+
+    def __init__(self, progress: ProgressLog, num_workers: int = 2):
+        self.progress = progress
+        self._executor = ThreadPoolExecutor(max_workers=num_workers, thread_name_prefix="dia-writer")
+        self._futures: list[Future] = []
+        self.failed = 0
+
+    def submit(self, entry: ManifestEntry, audio: np.ndarray) -> None:
+        self._futures.append(self._executor.submit(self._write, entry, audio))
+
+    def _write(self, entry: ManifestEntry, audio: np.ndarray) -> None:
+        try:
+            write_audio(entry.output, audio)
+        except Exception as e:
+            self.failed += 1
+            self.progress.record(entry.id, "error", error=f"write failed: {e}")
+            return
+        self.progress.record(entry.id, "ok", output=entry.output, seconds=round(len(audio) / DEFAULT_SAMPLE_RATE, 3))
+
+    def close(self) -> None:
+        """Waits for all pending writes."""
+        for future in self._futures:
+            future.result()
+        self._executor.shutdown()
+
+
+def generate_batch(model: Dia, batch: list[ManifestEntry], use_torch_compile: bool = False) -> list[np.ndarray | None]:
+    """Runs one batched generation for entries that share a batch key."""
+    first = batch[0]
+    outputs = model.generate(
+        [e.text for e in batch],
+        max_tokens=first.max_tokens,
+        cfg_scale=first.cfg_scale,
+        temperature=first.temperature,
+        top_p=first.top_p,
+        cfg_filter_top_k=first.cfg_filter_top_k,
+        audio_prompt=[e.audio_prompt for e in batch],
+        use_torch_compile=use_torch_compile,
+        seed=[e.seed for e in batch],
+    )
+    return outputs if len(batch) > 1 else [outputs]
+
+
+@dataclass
+class RunStats:
+    """Throughput counters of a batch run."""
+
+    rows: int = 0
+    failed: int = 0
+    audio_seconds: float = 0.0
+    started_at: float = field(default_factory=time.perf_counter)
+
+    def summary(self) -> str:
+        wall = time.perf_counter() - self.started_at
+        rtf = self.audio_seconds / wall if wall > 0 else 0.0
+        return (
+            f"{self.rows} rows ({self.failed} failed), {self.audio_seconds:.1f}s of audio in {wall:.1f}s: "
+            f"{self.rows / wall if wall > 0 else 0.0:.2f} rows/s, realtime factor={rtf:.2f}x"
+        )
+
+
+def run_batches(
+    model: Dia,
+    batches: list[list[ManifestEntry]],
+    writer: AudioWriter,
+    stats: RunStats,
+    use_torch_compile: bool = False,
+) -> Iterator[list[ManifestEntry]]:
+    """Generates each batch, hands its audio to `writer` and yields the batch once queued."""
+    for batch in batches:
+        try:
+            outputs = generate_batch(model, batch, use_torch_compile)
+        except Exception as e:
+            print(f"Warning: batch of {len(batch)} failed: {e}")
+            for entry in batch:
+                writer.progress.record(entry.id, "error", error=str(e))
+            stats.failed += len(batch)
+            yield batch
+            continue
+        for entry, audio in zip(batch, outputs):
+            if audio is None:
+                writer.progress.record(entry.id, "error", error="no audio generated")
+                stats.failed += 1
+                continue
+            writer.submit(entry, audio)
+            stats.audio_seconds += len(audio) / DEFAULT_SAMPLE_RATE
+        stats.rows += len(batch)
+        yield batch
+
+
+def add_model_arguments(parser: argparse.ArgumentParser) -> None:
+    """Adds the model loading options shared by the offline commands."""
+    parser.add_argument("--repo-id", type=str, default="nari-labs/Dia-1.6B", help="Hugging Face repository ID.")
+    parser.add_argument("--config", type=str, help="Path to a local config.json or inference bundle.")
+    parser.add_argument("--checkpoint", type=str, help="Path to a local checkpoint or inference bundle.")
+    parser.add_argument(
+        "--dtype", type=str, default=None, help="Compute dtype (default: float16 on CUDA, float32 otherwise)."
+    )
+    parser.add_argument("--device", type=str, default=None, help="Device to run on (default: auto).")
+    parser.add_argument("--weight-quant", type=str, default=None, help="Weight-only quantization mode.")
+    parser.add_argument(
+        "--tiny", action="store_true", help="Use a tiny random-weight model and a stub codec (offline testing)."
+    )
+    parser.add_argument(
+        "--length-model", type=str, default=None, help="Length predictor JSON (from `dia bench calibrate`)."
+    )
+    parser.add_argument(
+        "--detect-runaway", action="store_true", help="End rows that loop on silence or repetition early."
+    )
+
+
+def load_model(args: argparse.Namespace) -> Dia:
+    """Loads the model described by the options of `add_model_arguments`."""
+    device = torch.device(args.device) if args.device else None
+    if args.tiny:
+        device = device or torch.device("cpu")
+    # Half precision is slow (or unsupported) on CPU, so default to it only on CUDA.
+    on_cuda = device.type == "cuda" if device is not None else torch.cuda.is_available()
+    dtype = args.dtype or ("float16" if on_cuda else "float32")
+    if args.tiny:
+        from .testing import tiny_dia
+
+        model = tiny_dia(compute_dtype=dtype, device=device)
+    elif args.checkpoint:
+        model = Dia.from_local(
+            args.config, args.checkpoint, compute_dtype=dtype, device=device, weight_quant=args.weight_quant
+        )
+    else:
+        model = Dia.from_pretrained(args.repo_id, compute_dtype=dtype, device=device, weight_quant=args.weight_quant)
+    if getattr(args, "length_model", None):
+        model.set_length_predictor(LengthPredictor.load(args.length_model))
+    if getattr(args, "detect_runaway", False):
+        model.set_runaway_detection(True)
+    return model
+
+
+def add_generation_arguments(parser: argparse.ArgumentParser) -> None:
+    """Adds the default sampling parameters for manifest rows."""
+    group = parser.add_argument_group("Generation defaults (overridden by manifest columns)")
+    group.add_argument("--max-tokens", type=int, default=None, help="Maximum audio tokens per row.")
+    group.add_argument("--cfg-scale", type=float, default=3.0)
+    group.add_argument("--temperature", type=float, default=1.3)
+    group.add_argument("--top-p", type=float, default=0.95)
+    group.add_argument("--cfg-filter-top-k", type=int, default=45)
+    group.add_argument("--seed", type=int, default=None, help="Sampling seed of every row.")
+
+
+def generation_defaults(args: argparse.Namespace) -> dict:
+    return {name: getattr(args, name) for name in PARAM_FIELDS}
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="dia batch", description="Generate audio for every row of a manifest.")
+    parser.add_argument("manifest", type=str, help="JSONL or CSV manifest (columns: text, id, output, ...).")
+    parser.add_argument("--output-dir", type=str, default=".", help="Directory for outputs (default: .).")
+    parser.add_argument("--format", type=str, default="wav", help="Extension for rows without an output path.")
+    parser.add_argument("--progress", type=str, default=None, help="Progress file (default: <manifest>.progress).")
+    parser.add_argument("--batch-size", type=int, default=16, help="Rows per batched generation.")
+    parser.add_argument("--writers", type=int, default=2, help="Background threads writing audio files.")
+    parser.add_argument("--memory-budget-gb", type=float, default=None, help="Split batches to fit this memory.")
+    parser.add_argument("--compile", action="store_true", help="Use torch.compile for the decoder step.")
+    add_model_arguments(parser)
+    add_generation_arguments(parser)
+    args = parser.parse_args(argv)
+
+    entries = read_manifest(args.manifest, args.output_dir, generation_defaults(args), args.format)
+    progress = ProgressLog(args.progress or args.manifest + ".progress")
+    pending = [e for e in entries if not progress.is_done(e)]
+    print(f"{len(entries)} rows, {len(entries) - len(pending)} already done, {len(pending)} to generate")
+    if not pending:
+        return 0
+
+    model = load_model(args)
+    if args.memory_budget_gb:
+        model.set_memory_budget(int(args.memory_budget_gb * 2**30))
+    batches = plan_batches(pending, args.batch_size, model.config.data.audio_length, model.length_predictor)
+
+    writer = AudioWriter(progress, args.writers)
+    stats = RunStats()
+    try:
+        for i, _ in enumerate(run_batches(model, batches, writer, stats, args.compile)):
+            print(f"batch {i + 1}/{len(batches)}: {stats.summary()}")
+    finally:
+        writer.close()
+    stats.failed += writer.failed
+    print(f"done: {stats.summary()}")
+    return 1 if stats.failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,498 @@
+"""Reproducible generation benchmarks with JSON reports and regression checks.
+
+Scenarios are named `<text>[-voice][-b<batch>][-compile]`: a short or long text, with or
+without a voice prompt, batch size 1, 4 or 16, eager or `torch.compile`. Every scenario
+runs once per requested dtype, with warmup runs first and the same seed before every
+run, so two reports taken on the same machine differ only by the code under test.
+
+Timings come from the `dia.metrics` histograms (captured raw with `metrics.capture()`):
+decoder step latency percentiles, encoder, prefill and DAC time, plus tokens (frames)
+per second, the real-time factor and peak memory (allocated CUDA memory on GPU,
+resident set size on CPU).
+
+The voice prompt is a fixed pseudo-random sequence of DAC codes rather than an audio
+file, so prompted scenarios need no audio file and measure the prefill cost only.
+
+Usage:
+    dia bench list
+    dia bench run --device cpu --scenarios short short-voice short-b4 --output base.json
+    dia bench run --scenarios "short*" "long" --dtypes float16 bfloat16 --output new.json
+    dia bench compare base.json new.json --threshold 0.05
+    dia bench run --tiny --scenarios "*" --output tiny.json  # offline, random weights (see dia.testing)
+    dia bench calibrate script.jsonl --output length.json  # fit a length predictor (see dia.length)
+"""
+
+import argparse
+import fnmatch
+import gc
+import json
+import os
+import platform
+import threading
+import time
+from dataclasses import asdict, dataclass
+
+import numpy as np
+import torch
+
+from . import metrics
+from .batch import add_model_arguments, load_model, read_manifest
+from .length import LengthPredictor
+from .model import DEFAULT_SAMPLE_RATE, SAMPLE_RATE_RATIO, Dia
+from .pipeline import memory_usage
+
+
+TEXTS = {
+    "short": "[S1] Dia is an open weights text to dialogue model.",
+    "long": (
+        "[S1] Dia is an open weights text to dialogue model. [S2] You get full control over scripts and voices. "
+        "[S1] Wow. Amazing. (laughs) [S2] Try it now on GitHub or Hugging Face. [S1] torch.compile can speed up "
+        "generation once the first steps have been compiled. [S2] And batching keeps the decoder busy."
+    ),
+}
+# Audio tokens per text: ~86 per second of audio.
+MAX_TOKENS = {"short": 172, "long": 688}
+BATCH_SIZES = (1, 4, 16)
+PROMPT_FRAMES = 172
+DEFAULT_SCENARIOS = ("short", "long", "short-voice", "long-voice", "short-b4", "short-b16")
+
+
+@dataclass(frozen=True)
+class Scenario:
+    """One benchmarked generation setup."""
+
+    name: str
+    text: str
+    batch_size: int = 1
+    voice_prompt: bool = False
+    compile: bool = False
+
+
+def _scenario_name(text: str, batch_size: int, voice_prompt: bool, compile: bool) -> str:
+    name = text + ("-voice" if voice_prompt else "") + (f"-b{batch_size}" if batch_size > 1 else "")
+    return name + ("-compile" if compile else "")
+
+
+SCENARIOS = {
+    scenario.name: scenario
+    for scenario in (
+        Scenario(_scenario_name(text, batch_size, voice, compile), text, batch_size, voice, compile)
+        for compile in (False, True)
+        for text in TEXTS
+        for voice in (False, True)
+        for batch_size in BATCH_SIZES
+    )
+}
+
+
+def scenario_texts(scenario: Scenario) -> list[str]:
+    """The texts of a batched scenario, one per row.
+
+    Every row gets its own line number so the texts differ: `Dia.generate` encodes
+    identical texts once, which would leave batched encoding unmeasured.
+    """
+    base = TEXTS[scenario.text]
+    return [f"{base} [S{1 + row % 2}] Line {row + 1}." for row in range(scenario.batch_size)]
+
+
+def select_scenarios(patterns: list[str]) -> list[Scenario]:
+    """Returns the scenarios matching any of the names or glob patterns, in definition order.
+
+    Raises:
+        ValueError: If a pattern matches no scenario.
+    """
+    for pattern in patterns:
+        if not fnmatch.filter(SCENARIOS, pattern):
+            raise ValueError(f"No scenario matches {pattern!r}; see `dia bench list`")
+    return [s for name, s in SCENARIOS.items() if any(fnmatch.fnmatchcase(name, p) for p in patterns)]
+
+
+class PeakMemory:
+    """Measures peak memory inside a `with` block.
+
+    On CUDA this is the peak of `torch.cuda.memory_allocated`; elsewhere the resident set
+    size of the process is sampled from a background thread every `interval` seconds.
+    """
+
+    def __init__(self, device: torch.device, interval: float = 0.01):
+        self.device = device
+        self.interval = interval
+        self.peak_bytes: int | None = None
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def _sample(self) -> None:
+        while True:
+            rss = memory_usage().get("VmRSS")
+            if rss is not None:
+                self.peak_bytes = max(self.peak_bytes or 0, rss)
+            if self._stop.wait(self.interval):
+                return
+
+    def __enter__(self) -> "PeakMemory":
+        if self.device.type == "cuda":
+            torch.cuda.synchronize(self.device)
+            torch.cuda.reset_peak_memory_stats(self.device)
+        else:
+            self._thread = threading.Thread(target=self._sample, name="dia-bench-memory", daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        if self.device.type == "cuda":
+            torch.cuda.synchronize(self.device)
+            self.peak_bytes = torch.cuda.max_memory_allocated(self.device)
+        else:
+            self._stop.set()
+            self._thread.join()
+
+
+def _summary(values: list[float], scale: float = 1.0) -> dict | None:
+    if not values:
+        return None
+    values = np.asarray(values, dtype=np.float64) * scale
+    return {
+        "p50": float(np.percentile(values, 50)),
+        "p95": float(np.percentile(values, 95)),
+        "mean": float(values.mean()),
+        "count": int(len(values)),
+    }
+
+
+def _mean_ms(values: list[float], runs: int | None = None) -> float | None:
+    """Mean of `values` in milliseconds, or their total per run if `runs` is given."""
+    if not values:
+        return None
+    return sum(values) * 1000 / (runs or len(values))
+
+
+def _seed(seed: int) -> None:
+    torch.manual_seed(seed)
+    np.random.seed(seed)
+
+
+def voice_prompt(model: Dia, seed: int) -> torch.Tensor:
+    """A fixed sequence of DAC codes ([PROMPT_FRAMES, C]) standing in for an encoded voice prompt."""
+    generator = torch.Generator().manual_seed(seed)
+    codes = torch.randint(0, 1024, (PROMPT_FRAMES, model.config.data.channels), generator=generator)
+    return codes.to(model.device)
+
+
+def run_scenario(
+    model: Dia,
+    scenario: Scenario,
+    dtype: str,
+    warmup: int = 1,
+    repeats: int = 3,
+    seed: int = 0,
+    max_tokens: int | None = None,
+) -> dict:
+    """Runs one scenario and returns its report entry.
+
+    Args:
+        model: The loaded model (in `dtype`).
+        scenario: What to generate.
+        dtype: The model's compute dtype, recorded in the report.
+        warmup: Unmeasured runs first (at least 2 with `torch.compile`).
+        repeats: Measured runs; every run uses the same seed.
+        seed: Seed applied before every run and used for the voice prompt.
+        max_tokens: Overrides the scenario's audio token budget (capped at the model's `audio_length`).
+
+    Returns:
+        A JSON-serializable dictionary of timings, throughput and memory.
+    """
+    batched = scenario.batch_size > 1
+    text = scenario_texts(scenario) if batched else TEXTS[scenario.text]
+    prompt = voice_prompt(model, seed) if scenario.voice_prompt else None
+    kwargs = {
+        "max_tokens": min(max_tokens or MAX_TOKENS[scenario.text], model.config.data.audio_length),
+        "use_torch_compile": scenario.compile,
+        "audio_prompt": [prompt] * scenario.batch_size if batched else prompt,
+        "return_codes": model.dac_model is None,
+    }
+
+    def generate() -> list:
+        _seed(seed)
+        outputs = model.generate(text, **kwargs)
+        return outputs if batched else [outputs]
+
+    for _ in range(max(warmup, 2) if scenario.compile else warmup):
+        generate()
+
+    walls, frames = [], 0
+    with PeakMemory(model.device) as memory, metrics.capture() as samples:
+        for _ in range(repeats):
+            started_at = time.perf_counter()
+            outputs = generate()
+            walls.append(time.perf_counter() - started_at)
+            for output in outputs:
+                if output is not None:
+                    frames += output.shape[0] if kwargs["return_codes"] else len(output) // SAMPLE_RATE_RATIO
+
+    total_wall = sum(walls)
+    audio_seconds = frames * SAMPLE_RATE_RATIO / DEFAULT_SAMPLE_RATE
+    return {
+        "name": f"{scenario.name}/{dtype}",
+        "scenario": asdict(scenario),
+        "dtype": dtype,
+        "max_tokens": kwargs["max_tokens"],
+        "repeats": repeats,
+        "frames_per_run": frames / repeats,
+        "step_ms": _summary(samples["dia_decode_step_seconds"], 1000),
+        "sampling_ms": _summary(samples["dia_sampling_seconds"], 1000),
+        "encoder_ms": _mean_ms(samples["dia_encoder_seconds"]),
+        "prefill_ms": _mean_ms(samples["dia_prefill_seconds"]),
+        # DAC time is observed per row, so report the total per run.
+        "dac_ms": _mean_ms(samples["dia_dac_decode_seconds"], repeats),
+        "wall_seconds": _summary(walls),
+        "tokens_per_second": frames / total_wall if total_wall > 0 else 0.0,
+        "real_time_factor": audio_seconds / total_wall if total_wall > 0 else 0.0,
+        "peak_memory_mb": memory.peak_bytes / 2**20 if memory.peak_bytes is not None else None,
+    }
+
+
+def environment(device: torch.device) -> dict:
+    """Describes the machine and software versions a report was taken with."""
+    info = {
+        "torch": torch.__version__,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+        "torch_threads": torch.get_num_threads(),
+        "device": str(device),
+    }
+    if device.type == "cuda":
+        info["gpu"] = torch.cuda.get_device_name(device)
+    return info
+
+
+def run_benchmarks(args: argparse.Namespace) -> dict:
+    """Loads the model once per dtype and runs every selected scenario with it."""
+    scenarios = select_scenarios(args.scenarios)
+    settings = {
+        "scenarios": [s.name for s in scenarios],
+        "dtypes": args.dtypes,
+        "warmup": args.warmup,
+        "repeats": args.repeats,
+        "seed": args.seed,
+        "max_tokens": args.max_tokens,
+    }
+    report = {"environment": None, "settings": settings, "results": []}
+    for dtype in args.dtypes:
+        model = load_model(argparse.Namespace(**{**vars(args), "dtype": dtype}))
+        report["environment"] = report["environment"] or environment(model.device)
+        for scenario in scenarios:
+            result = run_scenario(model, scenario, dtype, args.warmup, args.repeats, args.seed, args.max_tokens)
+            report["results"].append(result)
+            step = result["step_ms"] or {}
+            print(
+                f"{result['name']:<28} step p50={step.get('p50', 0):7.2f}ms p95={step.get('p95', 0):7.2f}ms "
+                f"{result['tokens_per_second']:8.1f} tokens/s  RTF={result['real_time_factor']:.2f}x"
+            )
+        del model
+        gc.collect()
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+    return report
+
+
+# Compared metrics and whether a higher value is better.
+COMPARED_METRICS = {
+    "step_ms.p50": False,
+    "step_ms.p95": False,
+    "encoder_ms": False,
+    "prefill_ms": False,
+    "dac_ms": False,
+    "tokens_per_second": True,
+    "real_time_factor": True,
+    "peak_memory_mb": False,
+}
+
+
+def _lookup(result: dict, path: str) -> float | None:
+    value = result
+    for key in path.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(key)
+    return value
+
+
+def compare_reports(base: dict, new: dict, threshold: float = 0.05) -> tuple[list[dict], list[dict]]:
+    """Compares the scenarios present in both reports.
+
+    Args:
+        base: The reference report.
+        new: The report under test.
+        threshold: Relative change beyond which a worse value counts as a regression.
+
+    Returns:
+        `(changes, regressions)`: one entry per compared metric, and the subset that got
+        worse by more than `threshold`.
+    """
+    base_results = {r["name"]: r for r in base["results"]}
+    changes = []
+    for result in new["results"]:
+        reference = base_results.get(result["name"])
+        if reference is None:
+            continue
+        for path, higher_is_better in COMPARED_METRICS.items():
+            old, current = _lookup(reference, path), _lookup(result, path)
+            if not old or current is None:
+                continue
+            change = (current - old) / old
+            worse = -change if higher_is_better else change
+            changes.append(
+                {
+                    "scenario": result["name"],
+                    "metric": path,
+                    "base": old,
+                    "new": current,
+                    "change": change,
+                    "regression": worse > threshold,
+                }
+            )
+    return changes, [c for c in changes if c["regression"]]
+
+
+def _load_report(path: str) -> dict:
+    with open(path) as f:
+        return json.load(f)
+
+
+def _list(args: argparse.Namespace) -> int:
+    for name in SCENARIOS:
+        print(f"{name}{'  (default)' if name in DEFAULT_SCENARIOS else ''}")
+    return 0
+
+
+def _run(args: argparse.Namespace) -> int:
+    if args.dtypes is None:
+        on_cpu = (args.device or ("cuda" if torch.cuda.is_available() else "cpu")) == "cpu"
+        args.dtypes = [args.dtype] if args.dtype else ["float32"] if on_cpu else ["float16"]
+    try:
+        report = run_benchmarks(args)
+    except ValueError as e:
+        print(f"Error: {e}")
+        return 2
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote report to {args.output}")
+    else:
+        print(json.dumps(report, indent=2))
+    return 0
+
+
+def calibrate_lengths(
+    model: Dia, texts: list[str], batch_size: int = 8, seed: int = 0, max_tokens: int | None = None
+) -> tuple[LengthPredictor, dict]:
+    """Generates every text and fits a `LengthPredictor` to the lengths that ended with EOS.
+
+    Returns:
+        The fitted predictor and a summary: sample count, mean absolute error of the
+        prediction, the fraction of lengths within the allocation, and the number of
+        texts that hit `max_tokens` (left out of the fit).
+    """
+    finished, lengths, capped = [], [], 0
+    for start in range(0, len(texts), batch_size):
+        batch = texts[start : start + batch_size]
+        _seed(seed)
+        results = model.generate(batch, max_tokens=max_tokens, return_codes=True, return_result=True)
+        for text, result in zip(batch, results if len(batch) > 1 else [results]):
+            if result.finish_reason == "eos":
+                finished.append(text)
+                lengths.append(result.length)
+            else:
+                capped += 1
+        print(f"calibrate: {min(start + batch_size, len(texts))}/{len(texts)} texts")
+
+    predictor = LengthPredictor.fit(finished, lengths)
+    predicted = np.array([predictor.predict(text) for text in finished])
+    allocated = predictor.margin * predicted + predictor.headroom
+    summary = {
+        "samples": len(finished),
+        "capped": capped,
+        "mean_abs_error_frames": float(np.mean(np.abs(predicted - np.asarray(lengths)))),
+        "coverage": float(np.mean(np.asarray(lengths) <= allocated)),
+    }
+    return predictor, summary
+
+
+def _calibrate(args: argparse.Namespace) -> int:
+    if args.texts.endswith((".jsonl", ".csv")):
+        texts = [entry.text for entry in read_manifest(args.texts, ".", {})]
+    else:
+        with open(args.texts, encoding="utf-8") as f:
+            texts = [line.strip() for line in f if line.strip()]
+    model = load_model(args)
+    try:
+        predictor, summary = calibrate_lengths(model, texts, args.batch_size, args.seed, args.max_tokens)
+    except ValueError as e:
+        print(f"Error: {e}")
+        return 2
+    predictor.save(args.output)
+    print(json.dumps(summary, indent=2))
+    print(f"Wrote length predictor to {args.output}")
+    return 0
+
+
+def _compare(args: argparse.Namespace) -> int:
+    base, new = _load_report(args.base), _load_report(args.new)
+    if base.get("environment") != new.get("environment"):
+        print("Warning: the reports were taken in different environments; differences may not be regressions.")
+    changes, regressions = compare_reports(base, new, args.threshold)
+    if not changes:
+        print("No scenarios in common.")
+        return 0
+    for c in changes:
+        flag = "  REGRESSION" if c["regression"] else ""
+        values = f"{c['base']:10.2f} -> {c['new']:10.2f} ({c['change']:+.1%})"
+        print(f"{c['scenario']:<28} {c['metric']:<18} {values}{flag}")
+    print(f"{len(regressions)} regression(s) beyond {args.threshold:.0%}")
+    return 1 if regressions else 0
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="dia bench", description="Benchmark generation and compare reports.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    commands.add_parser("list", help="List the available scenarios.").set_defaults(handler=_list)
+
+    run = commands.add_parser("run", help="Run scenarios and write a JSON report.")
+    run.add_argument(
+        "--scenarios", nargs="+", default=list(DEFAULT_SCENARIOS), help="Scenario names or glob patterns."
+    )
+    run.add_argument(
+        "--dtypes", nargs="+", default=None, help="Compute dtypes (default: --dtype, else float32 on CPU, float16)."
+    )
+    run.add_argument("--warmup", type=int, default=1, help="Unmeasured runs per scenario (2+ with compile).")
+    run.add_argument("--repeats", type=int, default=3, help="Measured runs per scenario.")
+    run.add_argument("--seed", type=int, default=0, help="Seed applied before every run.")
+    run.add_argument("--max-tokens", type=int, default=None, help="Override the audio tokens of every scenario.")
+    run.add_argument("--output", type=str, default=None, help="Write the JSON report here (default: stdout).")
+    add_model_arguments(run)
+    run.set_defaults(handler=_run, dtype=None)
+
+    compare = commands.add_parser("compare", help="Compare two reports and flag regressions.")
+    compare.add_argument("base", type=str, help="Reference report.")
+    compare.add_argument("new", type=str, help="Report under test.")
+    compare.add_argument("--threshold", type=float, default=0.05, help="Relative change that counts (default: 5%%).")
+    compare.set_defaults(handler=_compare)
+
+    calibrate = commands.add_parser("calibrate", help="Fit a length predictor to generated lengths.")
+    calibrate.add_argument("texts", type=str, help="Texts to generate: a .txt file (one per line), .jsonl or .csv.")
+    calibrate.add_argument("--output", type=str, default="length.json", help="Predictor JSON to write.")
+    calibrate.add_argument("--batch-size", type=int, default=8, help="Texts per batched generation.")
+    calibrate.add_argument("--seed", type=int, default=0, help="Seed applied before every batch.")
+    calibrate.add_argument("--max-tokens", type=int, default=None, help="Audio token budget per text.")
+    add_model_arguments(calibrate)
+    calibrate.set_defaults(handler=_calibrate)
+
+    args = parser.parse_args(argv)
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
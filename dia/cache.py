@@ -0,0 +1,257 @@
+"""Bounded caches used to skip repeated work during generation.
+
+`LRUCache` keeps arbitrary values in memory. `CodesStore` keeps generated DAC codebooks
+on disk, and `ResultCache` combines the two so that a repeated request can skip
+generation entirely: decoded audio is served from memory, and codes found on disk only
+need a DAC decode.
+"""
+
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Any, Hashable
+
+import numpy as np
+import torch
+
+
+def tensor_nbytes(*tensors: torch.Tensor) -> int:
+    """Returns the total storage size of `tensors` in bytes."""
+    return sum(t.numel() * t.element_size() for t in tensors)
+
+
+class LRUCache:
+    """Thread-safe least-recently-used cache bounded by total value size in bytes.
+
+    Each entry is stored with its size; inserting an entry evicts the least recently
+    used entries until the total fits in `max_bytes`. Entries larger than `max_bytes`
+    are not stored.
+
+    Attributes:
+        max_bytes: The size budget in bytes.
+        current_bytes: The total size of the stored entries.
+        hits: Number of successful lookups.
+        misses: Number of failed lookups.
+        evictions: Number of entries evicted to make room.
+    """
+
+    def __init__(self, max_bytes: int):
+        if max_bytes <= 0:
+            raise ValueError(f"max_bytes must be positive, got {max_bytes}")
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: OrderedDict[Hashable, tuple[Any, int]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._entries
+
+    def get(self, key: Hashable) -> Any | None:
+        """Returns the value for `key` and marks it most recently used, or None on a miss."""
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def put(self, key: Hashable, value: Any, nbytes: int) -> bool:
+        """Stores `value` under `key`, evicting old entries as needed.
+
+        Returns:
+            True if the value was stored, False if it is larger than the whole budget.
+        """
+        if nbytes > self.max_bytes:
+            return False
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.current_bytes -= old[1]
+            while self._entries and self.current_bytes + nbytes > self.max_bytes:
+                _, (_, evicted_bytes) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted_bytes
+                self.evictions += 1
+            self._entries[key] = (value, nbytes)
+            self.current_bytes += nbytes
+            return True
+
+    def pop(self, key: Hashable) -> Any | None:
+        """Removes and returns the value for `key`, or None if absent."""
+        with self._lock:
+            item = self._entries.pop(key, None)
+            if item is None:
+                return None
+            self.current_bytes -= item[1]
+            return item[0]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def stats(self) -> dict[str, float]:
+        """Returns counters and the hit rate as a plain dict."""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.current_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+class CodesStore:
+    """Size-bounded on-disk store of generated codebooks.
+
+    Each entry is a `[T, C]` uint16 `.npy` file named after its key (e.g. a request hash).
+    Entries are read back with `mmap_mode="r"`, so a hit costs no copy until the codes
+    are used. When the total file size exceeds `max_bytes`, the least recently used
+    files are deleted; recency survives restarts through file modification times.
+
+    Attributes:
+        directory: Where the `.npy` files are kept.
+        max_bytes: The size budget in bytes.
+        current_bytes: The total size of the stored files.
+        hits: Number of successful lookups.
+        misses: Number of failed lookups.
+        evictions: Number of files deleted to make room.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        if max_bytes <= 0:
+            raise ValueError(f"max_bytes must be positive, got {max_bytes}")
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+        files = []
+        for name in os.listdir(directory):
+            if name.endswith(".npy"):
+                stat = os.stat(os.path.join(directory, name))
+                files.append((stat.st_mtime, name[: -len(".npy")], stat.st_size))
+        self._entries: OrderedDict[str, int] = OrderedDict((key, size) for _, key, size in sorted(files))
+        self.current_bytes = sum(self._entries.values())
+        with self._lock:
+            self._evict(0)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._entries
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.npy")
+
+    def get(self, key: str) -> np.ndarray | None:
+        """Returns a read-only memory map of the codes for `key`, or None on a miss."""
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            try:
+                codes = np.load(self._path(key), mmap_mode="r")
+                os.utime(self._path(key))
+            except (FileNotFoundError, ValueError):
+                self.current_bytes -= self._entries.pop(key)
+                self.misses += 1
+                return None
+            self.hits += 1
+            return codes
+
+    def put(self, key: str, codes: np.ndarray | torch.Tensor) -> bool:
+        """Stores codes under `key`, evicting old files as needed.
+
+        Returns:
+            True if the codes were stored, False if they are larger than the whole budget.
+        """
+        if isinstance(codes, torch.Tensor):
+            codes = codes.cpu().numpy()
+        codes = np.ascontiguousarray(codes, dtype=np.uint16)
+        # Write to a temporary file first so readers never see a partial entry.
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            np.save(f, codes)
+        nbytes = os.path.getsize(tmp_path)
+        if nbytes > self.max_bytes:
+            os.remove(tmp_path)
+            return False
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.current_bytes -= old
+            self._evict(nbytes)
+            os.replace(tmp_path, self._path(key))
+            self._entries[key] = nbytes
+            self.current_bytes += nbytes
+        return True
+
+    def _evict(self, incoming_bytes: int) -> None:
+        while self._entries and self.current_bytes + incoming_bytes > self.max_bytes:
+            key, size = self._entries.popitem(last=False)
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+            self.current_bytes -= size
+            self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._evict(self.max_bytes + 1)
+
+    def stats(self) -> dict[str, float]:
+        """Returns counters and the hit rate as a plain dict."""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.current_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+class ResultCache:
+    """Two-tier cache of generation results keyed by a canonical request hash.
+
+    Codes (~1.5 KB per second of audio) are kept on disk in a `CodesStore`; decoded
+    waveforms (~176 KB per second) are kept in a smaller in-memory `LRUCache`.
+
+    Args:
+        directory: Directory of the codes store.
+        max_codes_bytes: Disk budget for codes.
+        max_audio_bytes: Memory budget for decoded audio.
+    """
+
+    def __init__(self, directory: str, max_codes_bytes: int = 2**30, max_audio_bytes: int = 256 * 2**20):
+        self.codes = CodesStore(directory, max_codes_bytes)
+        self.audio = LRUCache(max_audio_bytes)
+
+    def put(self, key: str, codes: np.ndarray | torch.Tensor, audio: np.ndarray | None = None) -> None:
+        """Stores the codes of a result and, if given, its decoded audio."""
+        self.codes.put(key, codes)
+        if audio is not None:
+            self.audio.put(key, audio, audio.nbytes)
+
+    def stats(self) -> dict[str, dict[str, float]]:
+        return {"codes": self.codes.stats(), "audio": self.audio.stats()}
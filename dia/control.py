@@ -0,0 +1,141 @@
+"""Per-step control of a running generation: step callbacks, cancellation and deadlines.
+
+`Dia.generate(..., on_step=callback)` and `Dia.generate_stream` call `callback(info)`
+after every decode step with a `StepInfo`. The callback may return a stop signal: True
+stops every row, a per-row sequence of bools (or a bool tensor) stops the marked rows,
+and None or False lets generation continue. A stopped row ends immediately with the
+frames it has completed so far (finish reason "stopped"), and once every row has ended
+the decode loop returns, so the batch slot is freed without running to `max_tokens`.
+
+`CancellationToken` is a thread-safe flag with an optional wall-clock deadline;
+`cancel_rows` turns one token per row into an `on_step` callback. Callbacks run on the
+generating thread between steps, so they should be cheap and avoid reading the tensors
+back from the device unless they need them.
+
+Example:
+    token = CancellationToken.with_timeout(10.0)
+    audio = model.generate(texts, on_step=cancel_rows([token] * len(texts)))
+
+    # From any other thread:
+    token.cancel()
+"""
+
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Sequence
+
+import torch
+
+
+@dataclass
+class StepInfo:
+    """What an `on_step` callback sees after a decode step.
+
+    Attributes:
+        step: Index of the decode step that just ran, counting from 0.
+        tokens: The (still delayed) codes written at this step, shape [B, C], on the model's device.
+        finished: Rows that have ended (they may still be flushing delayed channels), shape [B].
+        rows: Index of each of the B rows in the batch passed to `generate`; differs from
+            `range(B)` when the batch was split to fit the memory budget, or when every text
+            has several rows (`num_samples`).
+    """
+
+    step: int
+    tokens: torch.Tensor
+    finished: torch.Tensor
+    rows: list[int]
+
+
+StopSignal = bool | Sequence[bool] | torch.Tensor | None
+StepCallback = Callable[[StepInfo], StopSignal]
+
+
+def stop_mask(signal: StopSignal, batch_size: int, device: torch.device) -> torch.Tensor | None:
+    """Converts a callback's return value into a [B] bool tensor, or None if nothing stops.
+
+    Raises:
+        ValueError: If a per-row signal does not have one entry per row.
+    """
+    if signal is None or signal is False:
+        return None
+    if signal is True:
+        return torch.ones((batch_size,), dtype=torch.bool, device=device)
+    mask = torch.as_tensor(signal, dtype=torch.bool, device=device).reshape(-1)
+    if mask.shape[0] != batch_size:
+        raise ValueError(f"on_step returned {mask.shape[0]} stop flags for a batch of {batch_size}")
+    return mask
+
+
+class CancellationToken:
+    """A flag that another thread can set to stop a generation, with an optional deadline.
+
+    Args:
+        deadline: `time.perf_counter()` value after which the token counts as cancelled.
+    """
+
+    def __init__(self, deadline: float | None = None):
+        self.deadline = deadline
+        self._event = threading.Event()
+
+    @classmethod
+    def with_timeout(cls, seconds: float | None) -> "CancellationToken":
+        """A token that expires `seconds` from now (never if None)."""
+        return cls(None if seconds is None else time.perf_counter() + seconds)
+
+    def cancel(self) -> None:
+        """Cancels the token. Safe to call from any thread, and more than once."""
+        self._event.set()
+
+    @property
+    def expired(self) -> bool:
+        """Whether the deadline has passed."""
+        return self.deadline is not None and time.perf_counter() >= self.deadline
+
+    @property
+    def cancelled(self) -> bool:
+        """Whether `cancel` was called or the deadline has passed."""
+        return self._event.is_set() or self.expired
+
+
+def cancel_rows(tokens: Sequence[CancellationToken | None]) -> StepCallback:
+    """An `on_step` callback that stops row i once `tokens[i]` is cancelled.
+
+    Reads no tensors, so it adds no device synchronization to the decode loop.
+
+    Args:
+        tokens: One token (or None) per row of the batch passed to `generate`.
+    """
+
+    def on_step(info: StepInfo) -> StopSignal:
+        stop = [tokens[row] is not None and tokens[row].cancelled for row in info.rows]
+        return stop if any(stop) else None
+
+    return on_step
+
+
+def combine(*callbacks: StepCallback | None) -> StepCallback | None:
+    """Runs several `on_step` callbacks; a row stops if any of them stops it."""
+    callbacks = [callback for callback in callbacks if callback is not None]
+    if len(callbacks) <= 1:
+        return callbacks[0] if callbacks else None
+
+    def on_step(info: StepInfo) -> StopSignal:
+        masks = [stop_mask(callback(info), len(info.rows), info.tokens.device) for callback in callbacks]
+        masks = [mask for mask in masks if mask is not None]
+        if not masks:
+            return None
+        return torch.stack(masks).any(dim=0)
+
+    return on_step
+
+
+def remap_rows(callback: StepCallback | None, rows: Sequence[int]) -> StepCallback | None:
+    """Wraps a callback for a sub-batch holding rows `rows` of the original batch."""
+    if callback is None:
+        return None
+
+    def on_step(info: StepInfo) -> StopSignal:
+        return callback(StepInfo(info.step, info.tokens, info.finished, [rows[row] for row in info.rows]))
+
+    return on_step
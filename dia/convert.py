@@ -0,0 +1,344 @@
+"""Conversion of Dia checkpoints into inference-optimized bundles.
+
+A bundle is a directory holding the model config, a safetensors file with weights
+that are already cast to the target dtype, fused and laid out for inference, and a
+manifest describing those transformations. `Dia.from_local` detects bundles and loads
+them without repeating any of that work.
+
+Usage:
+    dia convert --output ./dia-bf16 --dtype bfloat16
+    dia convert --config config.json --checkpoint dia-v0_1.pth --output ./dia-int8 --weight-quant int8
+    dia convert --output ./dia-int4 --weight-quant int4 --group-size 128 --quantize-embeddings
+"""
+
+import argparse
+import json
+import os
+import struct
+import time
+
+import torch
+
+from .config import DiaConfig
+from .layers import DenseGeneral, DiaModel
+from .model import ComputeDtype
+from .quantization import DEFAULT_GROUP_SIZE, WEIGHT_QUANT_MODES, quantize_dense_layers, quantize_embeddings
+
+
+BUNDLE_FORMAT = "dia-inference-bundle"
+BUNDLE_VERSION = 1
+MANIFEST_FILENAME = "manifest.json"
+CONFIG_FILENAME = "config.json"
+WEIGHTS_FILENAME = "model.safetensors"
+SAFETENSORS_DTYPES = {
+    "F64": torch.float64,
+    "F32": torch.float32,
+    "F16": torch.float16,
+    "BF16": torch.bfloat16,
+    "I64": torch.int64,
+    "I32": torch.int32,
+    "I16": torch.int16,
+    "I8": torch.int8,
+    "U8": torch.uint8,
+    "BOOL": torch.bool,
+}
+
+
+def optimize_model(
+    model: DiaModel,
+    fuse_qkv: bool = True,
+    matmul_layout: bool = True,
+    weight_quant: str | None = None,
+    transform_weights: bool = True,
+    group_size: int = DEFAULT_GROUP_SIZE,
+    quantize_embedding_tables: bool = False,
+) -> DiaModel:
+    """Applies the inference-time structural transformations to a model, in place.
+
+    Args:
+        model: The model to transform.
+        fuse_qkv: Fuse the self-attention Q/K/V projections into one matmul.
+        matmul_layout: Re-lay `DenseGeneral` kernels out as 2D `[out, in]` matrices.
+        weight_quant: Optional weight-only quantization mode (implies matmul layout).
+        transform_weights: If False, only parameter shapes are changed so that already
+            converted weights can be loaded directly.
+        group_size: Input channels per scale for int4 quantization.
+        quantize_embedding_tables: Also store the text and audio embeddings as int8.
+
+    Returns:
+        The same model instance.
+    """
+    if fuse_qkv:
+        for layer in [*model.encoder.layers, *model.decoder.layers]:
+            layer.self_attention.fuse_qkv(transform_weights)
+    if weight_quant is not None:
+        quantize_dense_layers(model, weight_quant, transform_weights, group_size)
+        if quantize_embedding_tables:
+            quantize_embeddings(model, transform_weights)
+    elif matmul_layout:
+        for module in model.modules():
+            if isinstance(module, DenseGeneral):
+                module.to_matmul_layout(transform_weights)
+    return model
+
+
+def find_bundle_dir(path: str | None) -> str | None:
+    """Returns the bundle directory for `path`, or None if `path` is not part of a bundle.
+
+    `path` may be the bundle directory itself, or its weights or manifest file. Any other
+    file is not redirected, even next to a bundle manifest (e.g. a `.pth` checkpoint in a
+    directory that `dia convert --output` also wrote to), and neither is a directory whose
+    `manifest.json` is not a Dia bundle manifest.
+    """
+    if not path:
+        return None
+    is_dir = os.path.isdir(path)
+    bundle_dir = path if is_dir else os.path.dirname(os.path.abspath(path))
+    try:
+        with open(os.path.join(bundle_dir, MANIFEST_FILENAME), "r") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(manifest, dict) or manifest.get("format") != BUNDLE_FORMAT:
+        return None
+    if not is_dir and os.path.basename(path) not in (manifest.get("weights", WEIGHTS_FILENAME), MANIFEST_FILENAME):
+        return None
+    return bundle_dir
+
+
+def read_manifest(bundle_dir: str) -> dict:
+    """Reads and validates a bundle manifest.
+
+    Raises:
+        ValueError: If the manifest is not a supported Dia bundle manifest.
+    """
+    with open(os.path.join(bundle_dir, MANIFEST_FILENAME), "r") as f:
+        manifest = json.load(f)
+    if manifest.get("format") != BUNDLE_FORMAT:
+        raise ValueError(f"{bundle_dir} is not a Dia inference bundle")
+    if manifest.get("version", 0) > BUNDLE_VERSION:
+        raise ValueError(f"Unsupported bundle version {manifest.get('version')} (max {BUNDLE_VERSION})")
+    return manifest
+
+
+def load_file_mmap(path: str) -> dict[str, torch.Tensor]:
+    """Loads a safetensors file as CPU tensors that alias a private memory map of the file.
+
+    Nothing is read up front: pages are faulted in from the page cache on first use, and
+    pages that are never written stay shared with every other process mapping the same
+    file. Writing to a tensor copies only the touched pages and never modifies the file.
+
+    Raises:
+        ValueError: If the file uses a dtype that torch cannot represent.
+    """
+    with open(path, "rb") as f:
+        (header_len,) = struct.unpack("<Q", f.read(8))
+        header = json.loads(f.read(header_len))
+    storage = torch.UntypedStorage.from_file(path, shared=False, nbytes=os.path.getsize(path))
+    data = torch.empty(0, dtype=torch.uint8).set_(storage)
+    base = 8 + header_len
+
+    tensors = {}
+    for name, info in header.items():
+        if name == "__metadata__":
+            continue
+        if info["dtype"] not in SAFETENSORS_DTYPES:
+            raise ValueError(f"Unsupported safetensors dtype {info['dtype']} for {name}")
+        dtype = SAFETENSORS_DTYPES[info["dtype"]]
+        start, end = info["data_offsets"]
+        raw = data[base + start : base + end]
+        if (base + start) % dtype.itemsize:
+            raw = raw.clone()  # misaligned for a zero-copy view
+        tensors[name] = raw.view(dtype).reshape(info["shape"])
+    return tensors
+
+
+def load_bundle(
+    bundle_dir: str, device: torch.device | str = "cpu", mmap: bool = False
+) -> tuple[DiaConfig, DiaModel, dict]:
+    """Loads a converted bundle without any weight transformation.
+
+    Args:
+        bundle_dir: Path to the bundle directory.
+        device: Device to place the loaded tensors on.
+        mmap: Memory-map the weights instead of reading them (CPU only), so that several
+            processes loading the same bundle share one copy in the page cache.
+
+    Returns:
+        A tuple `(config, model, manifest)`.
+
+    Raises:
+        FileNotFoundError: If the bundle config or weights are missing.
+        ValueError: If the manifest is invalid.
+    """
+    from safetensors.torch import load_file
+
+    manifest = read_manifest(bundle_dir)
+    config_path = os.path.join(bundle_dir, manifest.get("config", CONFIG_FILENAME))
+    weights_path = os.path.join(bundle_dir, manifest.get("weights", WEIGHTS_FILENAME))
+
+    config = DiaConfig.load(config_path)
+    if config is None:
+        raise FileNotFoundError(f"Config file not found at {config_path}")
+    if not os.path.isfile(weights_path):
+        raise FileNotFoundError(f"Bundle weights not found at {weights_path}")
+
+    compute_dtype = ComputeDtype(manifest["compute_dtype"]).to_dtype()
+    model = DiaModel(config, compute_dtype)
+    optimize_model(
+        model,
+        fuse_qkv=manifest.get("fuse_qkv", False),
+        matmul_layout=manifest.get("matmul_layout", False),
+        weight_quant=manifest.get("weight_quant"),
+        transform_weights=False,
+        group_size=manifest.get("group_size", DEFAULT_GROUP_SIZE),
+        quantize_embedding_tables=manifest.get("quantize_embeddings", False),
+    )
+    if mmap and torch.device(device).type == "cpu":
+        state_dict = load_file_mmap(weights_path)
+    else:
+        state_dict = load_file(weights_path, device=str(device))
+    model.load_state_dict(state_dict, assign=True)
+    return config, model, manifest
+
+
+def convert_checkpoint(
+    output_dir: str,
+    compute_dtype: str | ComputeDtype = ComputeDtype.FLOAT32,
+    repo_id: str | None = None,
+    config_path: str | None = None,
+    checkpoint_path: str | None = None,
+    fuse_qkv: bool = True,
+    matmul_layout: bool = True,
+    weight_quant: str | None = None,
+    group_size: int = DEFAULT_GROUP_SIZE,
+    quantize_embedding_tables: bool = False,
+) -> str:
+    """Converts a Hugging Face or local `.pth` checkpoint into an inference bundle.
+
+    Args:
+        output_dir: Directory to write the bundle to. Created if missing.
+        compute_dtype: Target dtype for the stored weights.
+        repo_id: Hugging Face Hub repository ID. Used if `checkpoint_path` is None.
+        config_path: Path to the config JSON for a local checkpoint.
+        checkpoint_path: Path to a local `.pth` checkpoint.
+        fuse_qkv: Store fused self-attention Q/K/V projections.
+        matmul_layout: Store `DenseGeneral` kernels as 2D `[out, in]` matrices.
+        weight_quant: Optional weight-only quantization mode.
+        group_size: Input channels per scale for int4 quantization.
+        quantize_embedding_tables: Also store the embeddings as int8 (requires `weight_quant`).
+
+    Returns:
+        The bundle directory.
+
+    Raises:
+        FileNotFoundError: If the local config is not found.
+        ValueError: If neither a repository ID nor a local checkpoint is given.
+    """
+    from safetensors.torch import save_file
+
+    if isinstance(compute_dtype, str):
+        compute_dtype = ComputeDtype(compute_dtype)
+    dtype = compute_dtype.to_dtype()
+
+    if checkpoint_path is not None:
+        config = DiaConfig.load(config_path) if config_path else None
+        if config is None:
+            raise FileNotFoundError(f"Config file not found at {config_path}")
+        model = DiaModel(config, dtype)
+        model.load_state_dict(torch.load(checkpoint_path, map_location="cpu"))
+        source = os.path.abspath(checkpoint_path)
+    elif repo_id is not None:
+        model = DiaModel.from_pretrained(repo_id, compute_dtype=dtype)
+        config = model.config
+        source = repo_id
+    else:
+        raise ValueError("Either repo_id or checkpoint_path must be provided")
+
+    model.eval()
+    with torch.no_grad():
+        optimize_model(
+            model,
+            fuse_qkv=fuse_qkv,
+            matmul_layout=matmul_layout,
+            weight_quant=weight_quant,
+            group_size=group_size,
+            quantize_embedding_tables=quantize_embedding_tables,
+        )
+
+    os.makedirs(output_dir, exist_ok=True)
+    state_dict = {name: tensor.contiguous() for name, tensor in model.state_dict().items()}
+    save_file(state_dict, os.path.join(output_dir, WEIGHTS_FILENAME), metadata={"format": "pt"})
+    config.save(os.path.join(output_dir, CONFIG_FILENAME))
+
+    manifest = {
+        "format": BUNDLE_FORMAT,
+        "version": BUNDLE_VERSION,
+        "source": source,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "compute_dtype": compute_dtype.value,
+        "fuse_qkv": fuse_qkv,
+        "matmul_layout": matmul_layout or weight_quant is not None,
+        "weight_quant": weight_quant,
+        "group_size": group_size,
+        "quantize_embeddings": weight_quant is not None and quantize_embedding_tables,
+        "config": CONFIG_FILENAME,
+        "weights": WEIGHTS_FILENAME,
+    }
+    with open(os.path.join(output_dir, MANIFEST_FILENAME), "w") as f:
+        json.dump(manifest, f, indent=2)
+    return output_dir
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="dia convert", description="Convert a Dia checkpoint into an inference bundle."
+    )
+    parser.add_argument("--output", type=str, required=True, help="Directory to write the bundle to.")
+    parser.add_argument(
+        "--repo-id", type=str, default="nari-labs/Dia-1.6B", help="Hugging Face repository ID to convert."
+    )
+    parser.add_argument("--config", type=str, help="Path to a local config.json (used with --checkpoint).")
+    parser.add_argument("--checkpoint", type=str, help="Path to a local .pth checkpoint.")
+    parser.add_argument(
+        "--dtype",
+        type=str,
+        default=ComputeDtype.FLOAT32.value,
+        choices=[d.value for d in ComputeDtype],
+        help="Target weight dtype (default: float32).",
+    )
+    parser.add_argument("--no-fuse-qkv", action="store_true", help="Keep separate Q/K/V projections.")
+    parser.add_argument("--no-matmul-layout", action="store_true", help="Keep the Jax kernel layout.")
+    parser.add_argument(
+        "--weight-quant", type=str, default=None, choices=WEIGHT_QUANT_MODES, help="Weight-only quantization mode."
+    )
+    parser.add_argument(
+        "--group-size", type=int, default=DEFAULT_GROUP_SIZE, help="Input channels per scale for int4 (default: 128)."
+    )
+    parser.add_argument(
+        "--quantize-embeddings", action="store_true", help="Also store embeddings as int8 (with --weight-quant)."
+    )
+    args = parser.parse_args(argv)
+
+    if args.checkpoint and not args.config:
+        parser.error("--config is required when --checkpoint is set.")
+
+    start_time = time.time()
+    output_dir = convert_checkpoint(
+        args.output,
+        compute_dtype=args.dtype,
+        repo_id=None if args.checkpoint else args.repo_id,
+        config_path=args.config,
+        checkpoint_path=args.checkpoint,
+        fuse_qkv=not args.no_fuse_qkv,
+        matmul_layout=not args.no_matmul_layout,
+        weight_quant=args.weight_quant,
+        group_size=args.group_size,
+        quantize_embedding_tables=args.quantize_embeddings,
+    )
+    print(f"Wrote bundle to {output_dir} in {time.time() - start_time:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
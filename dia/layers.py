@@ -1,3 +1,5 @@
+import math
+
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
@@ -6,6 +8,7 @@ from torch import Tensor
 from torch.nn import RMSNorm
 
 from .config import DiaConfig
+from .profiling import record
 from .state import DecoderInferenceState, EncoderInferenceState, KVCache
 
 
@@ -29,6 +32,7 @@ class DenseGeneral(nn.Module):
         use_bias (bool): Whether to add a bias term.
         weight (nn.Parameter): The kernel parameter.
         bias (Optional[nn.Parameter]): The bias parameter (if use_bias=True).
+        matmul_layout (bool): Whether `weight` has been re-laid out as a 2D `[out, in]` matrix.
     """
 
     def __init__(
@@ -45,10 +49,41 @@ class DenseGeneral(nn.Module):
         self.axis = axis
         self.kernel_shape = self.in_shapes + self.out_features
 
+        self.matmul_layout = False
+
         factory_kwargs = {"device": device, "dtype": weight_dtype}
         self.weight = nn.Parameter(torch.empty(self.kernel_shape, **factory_kwargs))
 
+    def to_matmul_layout(self, transform_weights: bool = True) -> None:
+        """Re-lays the kernel out as a 2D `[out, in]` matrix so `forward` is a single `F.linear`.
+
+        Only supported when the contracted axes are the trailing input axes, which holds for
+        every projection in the model.
+
+        Args:
+            transform_weights: If False, only the parameter shape is changed. Used when the
+                weights about to be loaded were already converted.
+        """
+        if self.matmul_layout:
+            return
+        if tuple(self.axis) != tuple(range(-len(self.in_shapes), 0)):
+            raise ValueError(f"Matmul layout requires contracting the trailing input axes, got axis={self.axis}")
+
+        in_flat = math.prod(self.in_shapes)
+        out_flat = math.prod(self.out_features)
+        if transform_weights:
+            weight = self.weight.data.reshape(in_flat, out_flat).t().contiguous()
+        else:
+            weight = torch.empty((out_flat, in_flat), dtype=self.weight.dtype, device=self.weight.device)
+        self.weight = nn.Parameter(weight)
+        self.matmul_layout = True
+
     def forward(self, inputs: Tensor) -> Tensor:
+        if self.matmul_layout:
+            x = inputs.flatten(inputs.ndim - len(self.in_shapes))
+            output = F.linear(x.to(self.weight.dtype), self.weight)
+            return output.unflatten(-1, self.out_features).to(inputs.dtype)
+
         norm_axis = _normalize_axes(self.axis, inputs.ndim)
         kernel_contract_axes = tuple(range(len(norm_axis)))
 
@@ -174,6 +209,7 @@ class Attention(nn.Module):
             axis=(-1,),
             weight_dtype=compute_dtype,
         )
+        self.qkv_proj: DenseGeneral | None = None
         self.o_proj = DenseGeneral(
             in_shapes=(num_query_heads, head_dim),
             out_features=(self.output_dim,),
@@ -189,6 +225,40 @@ class Attention(nn.Module):
             dtype=compute_dtype,
         )
 
+    def fuse_qkv(self, transform_weights: bool = True) -> None:
+        """Replaces `q_proj`, `k_proj` and `v_proj` with a single `qkv_proj` projection.
+
+        Only valid for self-attention, where queries and keys/values share the same input.
+
+        Args:
+            transform_weights: If False, only the fused parameter is allocated. Used when the
+                weights about to be loaded were already fused.
+        """
+        if self.is_cross_attn:
+            raise ValueError("QKV fusion is only supported for self-attention")
+        if self.qkv_proj is not None:
+            return
+        projections = (self.q_proj, self.k_proj, self.v_proj)
+        if any(proj.matmul_layout for proj in projections):
+            raise ValueError("QKV fusion must be applied before converting to matmul layout")
+
+        in_shapes = self.q_proj.in_shapes
+        q_dim = self.num_query_heads * self.head_dim
+        kv_dim = self.num_kv_heads * self.head_dim
+        qkv_proj = DenseGeneral(
+            in_shapes=in_shapes,
+            out_features=(q_dim + 2 * kv_dim,),
+            axis=(-1,),
+            weight_dtype=self.q_proj.weight.dtype,
+            device=self.q_proj.weight.device,
+        )
+        if transform_weights:
+            fused = torch.cat([proj.weight.data.reshape(*in_shapes, -1) for proj in projections], dim=-1)
+            qkv_proj.weight.data.copy_(fused)
+
+        del self.q_proj, self.k_proj, self.v_proj
+        self.qkv_proj = qkv_proj
+
     def forward(
         self,
         Xq: torch.Tensor,  # (B, T, D) T = 1 in AR generation
@@ -222,7 +292,14 @@ class Attention(nn.Module):
             kv_positions = q_positions
         original_dtype = Xq.dtype
 
-        Xq_BxTxNxH = self.q_proj(Xq)
+        if self.qkv_proj is not None:
+            # Fused projection: Xkv is Xq for self-attention.
+            q_dim = self.num_query_heads * self.head_dim
+            kv_dim = self.num_kv_heads * self.head_dim
+            Xq_BxTxQ, Xk_BxSxKH, Xv_BxSxKH = self.qkv_proj(Xq).split([q_dim, kv_dim, kv_dim], dim=-1)
+            Xq_BxTxNxH = Xq_BxTxQ.unflatten(-1, (self.num_query_heads, self.head_dim))
+        else:
+            Xq_BxTxNxH = self.q_proj(Xq)
         Xq_BxTxNxH = self.rotary_emb(Xq_BxTxNxH, position=q_positions)
         Xq_BxNxTxH = Xq_BxTxNxH.transpose(1, 2)
 
@@ -232,8 +309,12 @@ class Attention(nn.Module):
         if self.is_cross_attn:
             attn_k, attn_v = cache.k, cache.v
         else:
-            Xk_BxSxKxH = self.k_proj(Xkv)  # (B, S, K, H)
-            Xv_BxSxKxH = self.v_proj(Xkv)  # (B, S, K, H)
+            if self.qkv_proj is not None:
+                Xk_BxSxKxH = Xk_BxSxKH.unflatten(-1, (self.num_kv_heads, self.head_dim))
+                Xv_BxSxKxH = Xv_BxSxKH.unflatten(-1, (self.num_kv_heads, self.head_dim))
+            else:
+                Xk_BxSxKxH = self.k_proj(Xkv)  # (B, S, K, H)
+                Xv_BxSxKxH = self.v_proj(Xkv)  # (B, S, K, H)
             Xk_BxSxKxH = self.rotary_emb(Xk_BxSxKxH, position=kv_positions)  # (B, S, K, H)
 
             Xk_BxKxSxH = Xk_BxSxKxH.transpose(1, 2)  # (B, K, S, H)
@@ -339,6 +420,7 @@ class Encoder(nn.Module):
             dtype=compute_dtype,
         )
         self.layers = nn.ModuleList([EncoderLayer(config, compute_dtype) for _ in range(enc_config.n_layer)])
+        self._labels = [f"encoder.layer{i}" for i in range(enc_config.n_layer)]
         self.norm = RMSNorm(
             enc_config.n_embd,
             eps=model_config.normalization_layer_epsilon,
@@ -352,8 +434,9 @@ class Encoder(nn.Module):
     ) -> torch.Tensor:
         x = self.embedding(x_ids)
 
-        for layer in self.layers:
-            x = layer(x, state)
+        for label, layer in zip(self._labels, self.layers):
+            with record(label):
+                x = layer(x, state)
 
         x = self.norm(x).to(self.compute_dtype)
         return x
@@ -429,41 +512,45 @@ class DecoderLayer(nn.Module):
         prefill: bool = False,
         current_idx: int = 0,
     ) -> torch.Tensor:
-        residual = x
-        x_norm = self.pre_sa_norm(x).to(self.compute_dtype)
-
-        self_attn_mask = state.casual_attn_mask[None, None, current_idx]
-
-        sa_out = self.self_attention(
-            Xq=x_norm,  # (2, 1, D)
-            Xkv=x_norm,  # (2, 1, D)
-            q_positions=state.dec_positions,  # (2, 1)
-            kv_positions=state.dec_positions,  # (2, 1)
-            attn_mask=self_attn_mask,
-            cache=self_attn_cache,
-            prefill=prefill,
-            is_causal=prefill,
-            current_idx=current_idx,
-        )
-
-        x = residual + sa_out
+        with record("decoder.self_attn"):
+            residual = x
+            x_norm = self.pre_sa_norm(x).to(self.compute_dtype)
+
+            self_attn_mask = state.casual_attn_mask[None, None, current_idx]
+
+            sa_out = self.self_attention(
+                Xq=x_norm,  # (2, 1, D)
+                Xkv=x_norm,  # (2, 1, D)
+                q_positions=state.dec_positions,  # (2, 1)
+                kv_positions=state.dec_positions,  # (2, 1)
+                attn_mask=self_attn_mask,
+                cache=self_attn_cache,
+                prefill=prefill,
+                is_causal=prefill,
+                current_idx=current_idx,
+            )
 
-        residual = x
-        x_norm = self.pre_ca_norm(x).to(self.compute_dtype)
-        ca_out = self.cross_attention(
-            Xq=x_norm,
-            Xkv=state.enc_out,
-            q_positions=state.dec_positions,
-            kv_positions=state.enc_positions,
-            cache=cross_attn_cache,
-            current_idx=current_idx,
-        )
-        x = residual + ca_out
+            x = residual + sa_out
+
+        with record("decoder.cross_attn"):
+            residual = x
+            x_norm = self.pre_ca_norm(x).to(self.compute_dtype)
+            ca_out = self.cross_attention(
+                Xq=x_norm,
+                Xkv=state.enc_out,
+                q_positions=state.dec_positions,
+                kv_positions=state.enc_positions,
+                attn_mask=state.cross_attn_mask,
+                cache=cross_attn_cache,
+                current_idx=current_idx,
+            )
+            x = residual + ca_out
 
-        residual = x
-        x_norm = self.pre_mlp_norm(x).to(self.compute_dtype)
-        mlp_out = self.mlp(x_norm)
-        x = residual + mlp_out
+        with record("decoder.mlp"):
+            residual = x
+            x_norm = self.pre_mlp_norm(x).to(self.compute_dtype)
+            mlp_out = self.mlp(x_norm)
+            x = residual + mlp_out
 
         return x
 
@@ -489,6 +576,7 @@ class Decoder(nn.Module):
         self.layers = nn.ModuleList(
             [DecoderLayer(config=config, compute_dtype=compute_dtype) for _ in range(self.num_layers)]
         )
+        self._labels = [f"decoder.layer{i}" for i in range(self.num_layers)]
 
         self.norm = RMSNorm(
             dec_config.n_embd,
@@ -552,16 +640,18 @@ class Decoder(nn.Module):
         for i, layer in enumerate(self.layers):
             self_cache = state.self_attn_cache[i]
             cross_cache = state.cross_attn_cache[i]
-            x = layer(
-                x,  # (2, 1, D)
-                state,
-                self_attn_cache=self_cache,
-                cross_attn_cache=cross_cache,
-                current_idx=current_idx,
-            )
-
-        x = self.norm(x)
-        logits_Bx1xCxV = self.logits_dense(x)
+            with record(self._labels[i]):
+                x = layer(
+                    x,  # (2, 1, D)
+                    state,
+                    self_attn_cache=self_cache,
+                    cross_attn_cache=cross_cache,
+                    current_idx=current_idx,
+                )
+
+        with record("decoder.logits"):
+            x = self.norm(x)
+            logits_Bx1xCxV = self.logits_dense(x)
 
         return logits_Bx1xCxV.to(torch.float32)
 
@@ -602,7 +692,8 @@ class Decoder(nn.Module):
         for i, layer in enumerate(self.layers):
             self_cache = state.self_attn_cache[i]
             cross_cache = state.cross_attn_cache[i]
-            x = layer(x, state, self_attn_cache=self_cache, cross_attn_cache=cross_cache, prefill=True)
+            with record(self._labels[i]):
+                x = layer(x, state, self_attn_cache=self_cache, cross_attn_cache=cross_cache, prefill=True)
 
         # Final Norm
         x = self.norm(x)
@@ -0,0 +1,145 @@
+"""Output-length prediction, for sizing decoder buffers and scheduling short jobs first.
+
+Dia speaks at a fairly steady rate (~86 DAC frames per second of audio), so the number
+of frames a text produces is well predicted by its byte length and its number of
+speaker turns. `LengthPredictor` is a linear model of both, with a relative margin and
+an absolute headroom on top so that nearly every generation fits:
+
+    frames ~= intercept + frames_per_byte * bytes + frames_per_turn * turns
+    allocation = prompt + margin * frames + headroom   (in steps, rounded up to 128)
+
+With a predictor set (`Dia.set_length_predictor`), `generate` allocates the self-attention
+KV caches, the generated-token buffer and the causal mask for the predicted length
+instead of the full `max_tokens` budget, which saves memory and attention work over the
+padded cache. A row that runs past the allocation grows the buffers (to double the size,
+capped at the budget) and continues unchanged. Without a predictor, buffers are sized
+to `max_tokens`.
+
+The default coefficients come from the rule of thumb of ~15 text bytes per second of
+speech. `dia bench calibrate` fits them to the lengths the loaded model actually
+generates and writes a JSON file for `LengthPredictor.load` (and `dia serve
+--length-model`). `schedule_key` gives the predicted length in frames, which
+`dia batch` uses to sort rows and `BatchingWorker(shortest_first=True)` uses to run
+short requests first and group requests of similar length.
+
+Example:
+    predictor = LengthPredictor.load("length.json")
+    model.set_length_predictor(predictor)
+    predictor.predict("[S1] Hello there. [S2] Hi!")  # expected frames
+"""
+
+import json
+import math
+from dataclasses import asdict, dataclass
+from typing import Sequence
+
+import numpy as np
+
+from .tokenizer import SPEAKER_TOKENS, text_to_bytes
+
+
+# Buffer sizes are multiples of this many steps, to bound the number of distinct shapes.
+ALLOCATION_QUANTUM = 128
+
+
+def round_up(steps: int, quantum: int = ALLOCATION_QUANTUM) -> int:
+    """Rounds a step count up to a multiple of `quantum`."""
+    return -(-steps // quantum) * quantum
+
+
+def budget_capacity(max_tokens: int | None, audio_length: int) -> int:
+    """Buffer length that holds a whole generation of `max_tokens` steps (default: `audio_length`)."""
+    if max_tokens is None or max_tokens >= audio_length:
+        return audio_length
+    return min(round_up(max_tokens), audio_length)
+
+
+def text_features(text: str) -> tuple[int, int]:
+    """The byte length (as tokenized) and the number of speaker turns of a text."""
+    byte_text = text_to_bytes(text)
+    turns = sum(byte_text.count(token) for _, token in SPEAKER_TOKENS)
+    return len(byte_text), turns
+
+
+@dataclass
+class LengthPredictor:
+    """Predicts how many audio frames a text will generate.
+
+    Attributes:
+        intercept: Frames independent of the text.
+        frames_per_byte: Frames per byte of tokenized text.
+        frames_per_turn: Extra frames per speaker turn (pauses between speakers).
+        margin: Factor applied to the prediction when sizing buffers.
+        headroom: Frames added after the margin when sizing buffers.
+    """
+
+    intercept: float = 20.0
+    frames_per_byte: float = 6.0
+    frames_per_turn: float = 10.0
+    margin: float = 1.3
+    headroom: int = 86
+
+    def predict(self, text: str) -> float:
+        """Expected number of generated frames (excluding any audio prompt)."""
+        num_bytes, turns = text_features(text)
+        return max(self.intercept + self.frames_per_byte * num_bytes + self.frames_per_turn * turns, 0.0)
+
+    def schedule_key(self, text: str) -> float:
+        """Sort key for shortest-job-first scheduling: the expected frames."""
+        return self.predict(text)
+
+    def allocation(
+        self, texts: Sequence[str], prompt_frames: Sequence[int], max_tokens: int | None, audio_length: int
+    ) -> int:
+        """Decoder buffer length (in steps) for a batch, rounded up and capped at the budget.
+
+        Args:
+            texts: The texts of the batch.
+            prompt_frames: Audio prompt length in frames per row (0 without a prompt).
+            max_tokens: The generation budget in steps (default: `audio_length`).
+            audio_length: The model's maximum audio length.
+        """
+        capacity = budget_capacity(max_tokens, audio_length)
+        needed = max(
+            prompt + math.ceil(self.margin * self.predict(text)) + self.headroom
+            for text, prompt in zip(texts, prompt_frames)
+        )
+        return min(round_up(needed), capacity)
+
+    @classmethod
+    def fit(cls, texts: Sequence[str], frames: Sequence[int], coverage: float = 0.95, **kwargs) -> "LengthPredictor":
+        """Fits the coefficients to observed lengths by least squares.
+
+        The margin is chosen so that `coverage` of the observed lengths fit within
+        `margin * prediction + headroom`.
+
+        Args:
+            texts: Texts that were generated to completion (finished with EOS).
+            frames: The number of frames each of them generated.
+            coverage: Fraction of the observations the margin should cover.
+            **kwargs: Overrides, e.g. `headroom`.
+
+        Raises:
+            ValueError: If there are fewer than 3 observations.
+        """
+        if len(texts) < 3:
+            raise ValueError(f"Need at least 3 finished generations to fit, got {len(texts)}")
+        features = np.array([(1.0, *text_features(text)) for text in texts])
+        observed = np.asarray(frames, dtype=np.float64)
+        (intercept, per_byte, per_turn), *_ = np.linalg.lstsq(features, observed, rcond=None)
+        predictor = cls(float(intercept), float(per_byte), float(per_turn), **kwargs)
+        predicted = np.array([max(predictor.predict(text), 1.0) for text in texts])
+        ratios = (observed - predictor.headroom) / predicted
+        predictor.margin = max(float(np.quantile(ratios, coverage)), 1.0)
+        return predictor
+
+    def save(self, path: str) -> None:
+        """Writes the coefficients as JSON."""
+        with open(path, "w") as f:
+            json.dump(asdict(self), f, indent=2)
+
+    @classmethod
+    def load(cls, path: str) -> "LengthPredictor":
+        """Reads coefficients written by `save`."""
+        with open(path) as f:
+            return cls(**json.load(f))
@@ -0,0 +1,205 @@
+"""Memory planning for batched generation.
+
+`estimate_request_memory` predicts how many bytes one request adds to a batch, from the
+model config, compute dtype, `max_tokens`, text length and prompt length. `MemoryPlanner`
+uses those estimates to cap how many rows run together and to split batches that would
+not fit into a configured budget.
+
+The estimates are deliberately conservative upper bounds: they count every buffer that
+scales with the batch (KV caches, encoder activations, logits and sampling workspaces,
+token and delay-index tensors) plus the largest transient DAC decode, which runs one row
+at a time.
+"""
+
+from dataclasses import dataclass
+from typing import Callable, Sequence, TypeVar
+
+import torch
+
+from .config import DiaConfig
+from .length import budget_capacity
+
+
+T = TypeVar("T")
+
+# Sampling works on float32 logits and makes a few full-size copies (softmax, sort, mask).
+LOGITS_WORKSPACE_COPIES = 4
+# The DAC decoder's widest activations have ~96 channels at the output sample rate, and a
+# residual unit holds about two of them at once.
+DAC_BYTES_PER_SAMPLE = 96 * 4 * 2
+DAC_SAMPLES_PER_FRAME = 512
+
+
+@dataclass(frozen=True)
+class MemoryEstimate:
+    """Estimated bytes for one request (one batch row, i.e. two CFG rows).
+
+    Attributes:
+        self_attn_cache: Decoder self-attention K/V caches.
+        cross_attn_cache: Decoder cross-attention K/V caches.
+        encoder: Encoder output plus the largest transient encoder activation.
+        logits: Per-step logits and sampling workspace.
+        tokens: Generated tokens plus the delay/revert index tensors.
+        dac: Transient DAC memory for encoding the prompt or decoding the output.
+    """
+
+    self_attn_cache: int
+    cross_attn_cache: int
+    encoder: int
+    logits: int
+    tokens: int
+    dac: int
+
+    def repeated(self, num_samples: int) -> "MemoryEstimate":
+        """The estimate for `num_samples` rows of the same request (`generate(num_samples=...)`)."""
+        return MemoryEstimate(
+            self_attn_cache=self.self_attn_cache * num_samples,
+            cross_attn_cache=self.cross_attn_cache * num_samples,
+            encoder=self.encoder * num_samples,
+            logits=self.logits * num_samples,
+            tokens=self.tokens * num_samples,
+            dac=self.dac,
+        )
+
+    @property
+    def row_bytes(self) -> int:
+        """Bytes that scale with the number of rows in the batch."""
+        return self.self_attn_cache + self.cross_attn_cache + self.encoder + self.logits + self.tokens
+
+    @property
+    def total(self) -> int:
+        """Bytes needed to run this request alone."""
+        return self.row_bytes + self.dac
+
+
+def estimate_request_memory(
+    config: DiaConfig,
+    compute_dtype: torch.dtype,
+    max_tokens: int | None = None,
+    text_length: int | None = None,
+    prompt_frames: int = 0,
+) -> MemoryEstimate:
+    """Estimates the memory one request adds to a batch.
+
+    Args:
+        config: The model configuration.
+        compute_dtype: The dtype of activations and caches.
+        max_tokens: Requested audio tokens (defaults to `config.data.audio_length`).
+        text_length: Encoded text length in bytes (defaults to `config.data.text_length`).
+        prompt_frames: Length of the audio prompt in DAC frames.
+
+    Returns:
+        The estimate.
+    """
+    elt = torch.empty((), dtype=compute_dtype).element_size()
+    dec = config.model.decoder
+    enc = config.model.encoder
+    channels = config.data.channels
+    max_tokens = config.data.audio_length if max_tokens is None else max_tokens
+    text_length = config.data.text_length if text_length is None else min(text_length, config.data.text_length)
+    # KV caches and the token buffer never grow beyond the request's budget.
+    cache_len = budget_capacity(max_tokens, config.data.audio_length)
+    rows = 2  # conditional and unconditional (CFG) rows
+
+    self_attn = dec.n_layer * 2 * rows * dec.kv_heads * cache_len * dec.gqa_head_dim * elt
+    cross_attn = dec.n_layer * 2 * rows * dec.cross_query_heads * text_length * dec.cross_head_dim * elt
+    encoder_activations = max(2 * enc.n_hidden, 3 * enc.n_head * enc.head_dim) * text_length * elt
+    encoder_scores = enc.n_head * text_length * text_length * elt
+    encoder = rows * (enc.n_embd * text_length * elt + max(encoder_activations, encoder_scores))
+    logits = rows * channels * config.model.tgt_vocab_size * 4 * LOGITS_WORKSPACE_COPIES
+    # generated tokens (int64) plus delay/revert indices: t_idx [T, C] and [T * C, 3], int64
+    tokens = cache_len * channels * 8 + 2 * (cache_len * channels * (1 + 3) * 8)
+    dac_frames = max(max_tokens, prompt_frames)
+    dac = dac_frames * DAC_SAMPLES_PER_FRAME * DAC_BYTES_PER_SAMPLE
+
+    return MemoryEstimate(
+        self_attn_cache=self_attn,
+        cross_attn_cache=cross_attn,
+        encoder=encoder,
+        logits=logits,
+        tokens=tokens,
+        dac=dac,
+    )
+
+
+def module_bytes(module: torch.nn.Module | None) -> int:
+    """Returns the total size of a module's parameters and buffers in bytes."""
+    if module is None:
+        return 0
+    tensors = list(module.parameters()) + list(module.buffers())
+    return sum(t.numel() * t.element_size() for t in tensors)
+
+
+class MemoryPlanner:
+    """Caps batch sizes so that generation stays within a memory budget.
+
+    Args:
+        config: The model configuration.
+        compute_dtype: The dtype of activations and caches.
+        budget_bytes: Total memory the process may use for generation.
+        fixed_bytes: Memory already in use that does not scale with the batch (weights).
+    """
+
+    def __init__(self, config: DiaConfig, compute_dtype: torch.dtype, budget_bytes: int, fixed_bytes: int = 0):
+        if budget_bytes <= fixed_bytes:
+            raise ValueError(f"Memory budget ({budget_bytes} bytes) must exceed the fixed usage ({fixed_bytes} bytes)")
+        self.config = config
+        self.compute_dtype = compute_dtype
+        self.budget_bytes = budget_bytes
+        self.fixed_bytes = fixed_bytes
+        # The [T, T] causal mask is allocated once per batch.
+        self.batch_bytes_overhead = config.data.audio_length**2
+
+    @classmethod
+    def for_model(cls, model, budget_bytes: int) -> "MemoryPlanner":
+        """Creates a planner for a loaded `Dia`, counting its weights as fixed usage."""
+        fixed = module_bytes(model.model) + module_bytes(model.dac_model)
+        return cls(model.config, model.compute_dtype, budget_bytes, fixed)
+
+    @property
+    def available_bytes(self) -> int:
+        return self.budget_bytes - self.fixed_bytes
+
+    def estimate(
+        self, max_tokens: int | None = None, text_length: int | None = None, prompt_frames: int = 0
+    ) -> MemoryEstimate:
+        return estimate_request_memory(self.config, self.compute_dtype, max_tokens, text_length, prompt_frames)
+
+    def batch_bytes(self, estimates: Sequence[MemoryEstimate]) -> int:
+        """Estimated bytes for running `estimates` as one batch."""
+        if not estimates:
+            return 0
+        return self.batch_bytes_overhead + sum(e.row_bytes for e in estimates) + max(e.dac for e in estimates)
+
+    def fits(self, estimates: Sequence[MemoryEstimate]) -> bool:
+        return self.batch_bytes(estimates) <= self.available_bytes
+
+    def max_rows(self, estimate: MemoryEstimate) -> int:
+        """How many requests like `estimate` fit in one batch (0 if not even one)."""
+        free = self.available_bytes - self.batch_bytes_overhead - estimate.dac
+        return max(free // estimate.row_bytes, 0) if estimate.row_bytes else 0
+
+    def split(self, items: Sequence[T], estimate_fn: Callable[[T], MemoryEstimate]) -> list[list[T]]:
+        """Splits `items` into consecutive batches that each fit the budget.
+
+        Raises:
+            MemoryError: If a single item does not fit on its own.
+        """
+        batches: list[list[T]] = []
+        current: list[T] = []
+        current_estimates: list[MemoryEstimate] = []
+        for item in items:
+            estimate = estimate_fn(item)
+            if not self.fits([estimate]):
+                raise MemoryError(
+                    f"A single request needs ~{estimate.total / 2**20:.0f} MB, more than the "
+                    f"{self.available_bytes / 2**20:.0f} MB available"
+                )
+            if current and not self.fits(current_estimates + [estimate]):
+                batches.append(current)
+                current, current_estimates = [], []
+            current.append(item)
+            current_estimates.append(estimate)
+        if current:
+            batches.append(current)
+        return batches
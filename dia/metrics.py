@@ -0,0 +1,338 @@
+"""Prometheus-style metrics for generation and serving.
+
+Counters, gauges and histograms are recorded in-process and rendered in the Prometheus
+text exposition format by `render()`. The HTTP server exposes them at `GET /metrics`;
+other processes (e.g. the websocket server) can call `start_http_server(port)`.
+
+Recording is meant to stay on in production: an observation is a bisect plus a few
+increments under an uncontended lock, and values that already exist elsewhere (cache
+hit counters, queue depth) are read through callbacks only when metrics are scraped.
+
+Example:
+    from dia import metrics
+
+    metrics.DECODE_STEP_SECONDS.observe(0.012)
+    metrics.CACHE_HITS.labels("encoder").inc()
+    print(metrics.render())
+"""
+
+import bisect
+import math
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Iterator, Sequence
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+STEP_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.015, 0.02, 0.03, 0.05, 0.075, 0.1, 0.25, 0.5, 1.0)
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+REQUEST_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+RTF_BUCKETS = (0.1, 0.25, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 5.0, 10.0, 20.0)
+RATIO_BUCKETS = (0.125, 0.25, 0.375, 0.5, 0.625, 0.75, 0.875, 1.0)
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if value == int(value) and abs(value) < 2**53:
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    escaped = (v.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for v in values)
+    return "{" + ",".join(f'{n}="{v}"' for n, v in zip(names, escaped)) + "}"
+
+
+class _Value:
+    """A single counter or gauge value, optionally read from a callback at scrape time."""
+
+    __slots__ = ("_value", "_function", "_lock")
+
+    def __init__(self):
+        self._value = 0.0
+        self._function: Callable[[], float] | None = None
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self._value += amount
+
+    def set(self, value: float) -> None:
+        self._value = float(value)
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        """Reads the value from `function()` whenever metrics are rendered."""
+        self._function = function
+
+    def get(self) -> float:
+        return float(self._function()) if self._function is not None else self._value
+
+
+# Active `capture()` sample dicts; empty (and therefore free to check) outside benchmarks.
+_captures: list[dict[str, list[float]]] = []
+
+
+@contextmanager
+def capture() -> Iterator[dict[str, list[float]]]:
+    """Records the raw value of every histogram observation made inside the block.
+
+    Histograms only keep bucket counts; benchmarks that need exact percentiles use
+
+        with metrics.capture() as samples:
+            model.generate(text)
+        step_times = samples["dia_decode_step_seconds"]
+    """
+    samples: dict[str, list[float]] = defaultdict(list)
+    _captures.append(samples)
+    try:
+        yield samples
+    finally:
+        _captures.remove(samples)
+
+
+class _HistogramValue:
+    """Bucket counts, sum and count of one histogram series."""
+
+    __slots__ = ("name", "bounds", "_counts", "_sum", "_lock")
+
+    def __init__(self, name: str, bounds: tuple[float, ...]):
+        self.name = name
+        self.bounds = bounds
+        self._counts = [0] * (len(bounds) + 1)
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        index = bisect.bisect_left(self.bounds, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+        if _captures:
+            for samples in _captures:
+                samples[self.name].append(value)
+
+    def snapshot(self) -> tuple[list[int], float]:
+        with self._lock:
+            return list(self._counts), self._sum
+
+
+class _Metric:
+    """A named metric family; `labels(...)` returns the series for one label combination."""
+
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._series: dict[tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self._default = self.labels()
+        (REGISTRY if registry is None else registry).register(self)
+
+    def _new_series(self):
+        raise NotImplementedError
+
+    def labels(self, *values) -> object:
+        """Returns the series for `values` (one per label name), creating it on first use."""
+        key = tuple(str(v) for v in values)
+        series = self._series.get(key)
+        if series is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}, got {values}")
+            with self._lock:
+                series = self._series.setdefault(key, self._new_series())
+        return series
+
+    def _samples(self) -> Iterator[str]:
+        for key, series in list(self._series.items()):
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(series.get())}"
+
+    def collect(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} {self.kind}"
+        yield from self._samples()
+
+
+class Counter(_Metric):
+    """A monotonically increasing count."""
+
+    kind = "counter"
+
+    def _new_series(self) -> _Value:
+        return _Value()
+
+    def inc(self, amount: float = 1.0) -> None:
+        self._default.inc(amount)
+
+
+class Gauge(_Metric):
+    """A value that can go up and down."""
+
+    kind = "gauge"
+
+    def _new_series(self) -> _Value:
+        return _Value()
+
+    def set(self, value: float) -> None:
+        self._default.set(value)
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        self._default.set_function(function)
+
+
+class Histogram(_Metric):
+    """Observations counted into cumulative buckets, as Prometheus histograms."""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = STAGE_BUCKETS,
+        registry=None,
+    ):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_series(self) -> _HistogramValue:
+        return _HistogramValue(self.name, self.buckets)
+
+    def observe(self, value: float) -> None:
+        self._default.observe(value)
+
+    def _samples(self) -> Iterator[str]:
+        for key, series in list(self._series.items()):
+            counts, total = series.snapshot()
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames + ("le",), key + (_format_value(bound),))
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.labelnames, key)
+            yield f"{self.name}_sum{labels} {_format_value(total)}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+class Registry:
+    """A collection of metrics rendered together."""
+
+    def __init__(self):
+        self._metrics: dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> None:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+
+    def render(self) -> str:
+        """Returns all metrics in the Prometheus text exposition format."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = [line for metric in metrics for line in metric.collect()]
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def render() -> str:
+    """Renders the default registry."""
+    return REGISTRY.render()
+
+
+def track_hit_rate(cache: str, hits: Callable[[], float], lookups: Callable[[], float]) -> None:
+    """Exposes an existing hit counter as `dia_cache_hits_total` / `dia_cache_lookups_total`.
+
+    The callbacks are only called when metrics are rendered, so tracking adds no cost
+    to lookups. Tracking a new source under the same name replaces the old one.
+    """
+    CACHE_HITS.labels(cache).set_function(hits)
+    CACHE_LOOKUPS.labels(cache).set_function(lookups)
+
+
+def start_http_server(port: int, addr: str = "0.0.0.0") -> ThreadingHTTPServer:
+    """Serves `render()` at `GET /metrics` from a daemon thread.
+
+    Returns:
+        The server; call `shutdown()` on it to stop serving.
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((addr, port), Handler)
+    threading.Thread(target=server.serve_forever, name="dia-metrics", daemon=True).start()
+    return server
+
+
+# --- Generation ---
+ENCODER_SECONDS = Histogram("dia_encoder_seconds", "Text encoder and cross-attention K/V time per batch.")
+PREFILL_SECONDS = Histogram("dia_prefill_seconds", "Decoder state setup and audio prompt prefill time per batch.")
+DECODE_STEP_SECONDS = Histogram(
+    "dia_decode_step_seconds", "Wall time of one decoder step for the whole batch.", buckets=STEP_BUCKETS
+)
+SAMPLING_SECONDS = Histogram(
+    "dia_sampling_seconds",
+    "Time spent sampling the next tokens in one decoder step (not recorded under torch.compile).",
+    buckets=STEP_BUCKETS,
+)
+DAC_DECODE_SECONDS = Histogram("dia_dac_decode_seconds", "DAC decode time per decoded row or streaming window.")
+GENERATION_SECONDS = Histogram(
+    "dia_generation_seconds", "Wall time of one batched generation.", buckets=REQUEST_BUCKETS
+)
+REAL_TIME_FACTOR = Histogram(
+    "dia_real_time_factor", "Seconds of audio generated per wall-clock second, per batch.", buckets=RTF_BUCKETS
+)
+BATCH_ROWS = Histogram("dia_batch_rows", "Number of texts per batched generation.", buckets=SIZE_BUCKETS)
+GENERATED_FRAMES = Counter("dia_generated_frames_total", "Audio frames generated (~86 per second of audio).")
+GENERATED_AUDIO_SECONDS = Counter("dia_generated_audio_seconds_total", "Seconds of audio generated.")
+BUFFER_GROWTHS = Counter(
+    "dia_buffer_growths_total", "Decoder buffers regrown because a batch outran its predicted length."
+)
+RUNAWAY_ROWS = Counter(
+    "dia_runaway_rows_total", "Rows ended by a runaway detector (silence, repeat, budget).", ("reason",)
+)
+
+# --- Serving ---
+QUEUE_DEPTH = Gauge("dia_queue_depth", "Requests waiting for a batch slot.")
+QUEUE_SECONDS = Histogram(
+    "dia_queue_seconds", "Time from submission until a request's batch starts.", buckets=REQUEST_BUCKETS
+)
+TIME_TO_FIRST_CHUNK_SECONDS = Histogram(
+    "dia_time_to_first_chunk_seconds", "Time from submission to the first streamed chunk.", buckets=REQUEST_BUCKETS
+)
+BATCH_OCCUPANCY = Histogram(
+    "dia_batch_occupancy", "Requests per batch as a fraction of the maximum batch size.", buckets=RATIO_BUCKETS
+)
+REQUESTS = Counter(
+    "dia_requests_total",
+    "Requests by how they were served (generated, coalesced, cached, cancelled, rejected, failed).",
+    ("outcome",),
+)
+CACHE_HITS = Counter("dia_cache_hits_total", "Cache lookups that hit.", ("cache",))
+CACHE_LOOKUPS = Counter("dia_cache_lookups_total", "Cache lookups.", ("cache",))
@@ -1,19 +1,36 @@
+import hashlib
+import os
 import time
+from contextlib import contextmanager
+from dataclasses import dataclass
 from enum import Enum
+from typing import Callable, Iterator
 
 import numpy as np
 import torch
 import torchaudio
 
 # Assuming these imports are relative to the package structure
+from . import metrics
 from .audio import apply_audio_delay, build_delay_indices, build_revert_indices, revert_audio_delay
+from .cache import LRUCache, tensor_nbytes
 from .config import DiaConfig
+from .control import StepCallback, StepInfo, remap_rows, stop_mask
 from .layers import DiaModel
-from .state import DecoderInferenceState, DecoderOutput, EncoderInferenceState
+from .length import LengthPredictor, budget_capacity, round_up
+from .memory import MemoryEstimate, MemoryPlanner, estimate_request_memory
+from .profiling import GenerationProfiler, ProfileConfig, record
+from .runaway import REASONS, RunawayConfig, RunawayDetector
+from .state import DecoderInferenceState, DecoderOutput, EncoderInferenceState, KVCache
+from .timing import StageTimings, TimingHook
+from .tokenizer import TextBatch, bucket_text_length, text_to_bytes, tokenize_batch
 
 
 DEFAULT_SAMPLE_RATE = 44100
 SAMPLE_RATE_RATIO = 512
+# Streaming decodes each window with extra frames on both sides to avoid DAC edge artifacts.
+STREAM_CONTEXT_FRAMES = 16
+STREAM_LOOKAHEAD_FRAMES = 4
 
 
 def _get_default_device():
@@ -30,6 +47,7 @@ def _sample_next_token(
     top_p: float,
     top_k: int | None,
     audio_eos_value: int,
+    noise_BC: torch.Tensor | None = None,
 ) -> torch.Tensor:
     if temperature == 0.0:
         return torch.argmax(logits_BCxV, dim=-1)
@@ -66,11 +84,101 @@ def _sample_next_token(
 
     final_probs_BCxV = torch.softmax(logits_BCxV, dim=-1)
 
+    if noise_BC is not None:
+        # Inverse-CDF sampling from caller-provided uniform noise (see `Dia._row_noise`).
+        cdf_BCxV = torch.cumsum(final_probs_BCxV, dim=-1)
+        threshold_BCx1 = noise_BC.unsqueeze(-1) * cdf_BCxV[:, -1:]
+        sampled_indices_C = torch.searchsorted(cdf_BCxV, threshold_BCx1, right=True).squeeze(-1)
+        return sampled_indices_C.clamp(max=cdf_BCxV.shape[-1] - 1)
+
     sampled_indices_BC = torch.multinomial(final_probs_BCxV, num_samples=1)
     sampled_indices_C = sampled_indices_BC.squeeze(-1)
     return sampled_indices_C
 
 
+@dataclass
+class AudioChunk:
+    """A window of streamed audio for one row of a batch.
+
+    Attributes:
+        row: Index of the batch row the audio belongs to.
+        audio: Float waveform samples; may be empty for the final chunk.
+        start_sample: Offset of the first sample within the row's full output.
+        sample_rate: Sample rate of `audio`.
+        is_final: Whether this is the last chunk for the row.
+        codes: The row's full reverted codebook `[T, C]`, set on the final chunk only.
+        sample: Index of the take within the row, with `num_samples > 1`.
+    """
+
+    row: int
+    audio: np.ndarray
+    start_sample: int
+    sample_rate: int
+    is_final: bool
+    codes: np.ndarray | None = None
+    sample: int = 0
+
+
+@dataclass
+class GenerationResult:
+    """One row of `generate(..., return_result=True)`.
+
+    Attributes:
+        waveform: Float waveform samples, or None if the DAC model is not loaded or
+            `return_codes=True` was passed.
+        codes: The reverted DAC codebook, shape [T, C].
+        length: Number of generated frames (~86 per second of audio).
+        finish_reason: "eos" if the model ended the row, "max_tokens" if it hit the limit,
+            "stopped" if an `on_step` callback stopped it, or "silence", "repeat" or
+            "budget" if a runaway detector ended it (see `dia.runaway`).
+        timings: Stage timings of the batch the row was generated in (shared by its rows).
+        sample_rate: Sample rate of `waveform`.
+    """
+
+    waveform: np.ndarray | None
+    codes: np.ndarray
+    length: int
+    finish_reason: str
+    timings: StageTimings
+    sample_rate: int = DEFAULT_SAMPLE_RATE
+
+
+@dataclass
+class _GenerationLoop:
+    """Mutable bookkeeping for one run of the decode loop."""
+
+    dec_state: DecoderInferenceState
+    dec_output: DecoderOutput
+    batch_size: int
+    max_tokens: int
+    dec_step: int
+    current_idx: torch.Tensor
+    eos_detected_Bx: torch.Tensor
+    eos_countdown_Bx: torch.Tensor
+    finished_step_Bx: torch.Tensor
+    eos_by_token_Bx: torch.Tensor
+    stopped_Bx: torch.Tensor
+    runaway_reason_Bx: torch.Tensor
+    rows: list[int]
+    runaway: RunawayDetector | None = None
+    generators: list[torch.Generator | None] | None = None
+    bos_over: bool = False
+    steps: int = 0
+
+    def finish_reasons(self) -> list[str]:
+        """Why each row ended: "stopped", "eos", a runaway detector's reason, or "max_tokens"."""
+        return [
+            "stopped" if stopped else "eos" if eos else REASONS[runaway] or "max_tokens"
+            for stopped, eos, runaway in zip(
+                self.stopped_Bx.tolist(), self.eos_by_token_Bx.tolist(), self.runaway_reason_Bx.tolist()
+            )
+        ]
+
+    @property
+    def done(self) -> bool:
+        return self.dec_step >= self.max_tokens or bool((self.eos_countdown_Bx == 0).all())
+
+
 class ComputeDtype(str, Enum):
     FLOAT32 = "float32"
     FLOAT16 = "float16"
@@ -93,7 +201,7 @@ class Dia:
         config: DiaConfig,
         compute_dtype: str | ComputeDtype = ComputeDtype.FLOAT32,
         device: torch.device | None = None,
-        load_dac: bool = True,
+        load_dac: bool | torch.nn.Module = True,
     ):
         """Initializes the Dia model.
 
@@ -101,7 +209,9 @@ class Dia:
             config: The configuration object for the model.
             compute_dtype: The computation dtype to use.
             device: The device to load the model onto. If None, will automatically select the best available device.
-            load_dac: Whether to load the DAC model.
+            load_dac: Whether to load the DAC model, or a codec module with DAC's interface
+                (`preprocess`, `encode`, `decode`, `quantizer.from_codes`) to use instead of
+                downloading it, e.g. `dia.testing.StubDAC`.
 
         Raises:
             RuntimeError: If there is an error loading the DAC model.
@@ -115,11 +225,25 @@ class Dia:
         self.model: DiaModel = DiaModel(config, self.compute_dtype)
         self.dac_model = None
         self._compiled_step = None
-        self.load_dac = load_dac
+        self.load_dac = isinstance(load_dac, torch.nn.Module) or bool(load_dac)
+        self.encoder_cache: LRUCache | None = None
+        self.memory_planner: MemoryPlanner | None = None
+        self.length_predictor: LengthPredictor | None = None
+        self.runaway_config: RunawayConfig | None = None
+        # Where the weights came from and how they were transformed; see `fingerprint`.
+        self._weights_info: dict[str, object] = {"weights": None}
+        self._sampling_marks = None
+        self._cross_attn_marks = None
+        self._timing_hooks: list[TimingHook] = []
+        self._profiles: list[list[StageTimings]] = []
+        self._timings: StageTimings | None = None
 
         if not self.load_dac:
             print("Warning: DAC model will not be loaded. This is not recommended.")
 
+        if isinstance(load_dac, torch.nn.Module):
+            self.dac_model = load_dac.to(self.device).eval()
+
         if torch.cuda.is_available():
             torch.backends.cuda.matmul.allow_tf32 = True
 
@@ -130,16 +254,27 @@ class Dia:
         checkpoint_path: str,
         compute_dtype: str | ComputeDtype = ComputeDtype.FLOAT32,
         device: torch.device | None = None,
-        load_dac: bool = True,
+        load_dac: bool | torch.nn.Module = True,
+        weight_quant: str | None = None,
+        mmap_weights: bool = False,
     ) -> "Dia":
         """Loads the Dia model from local configuration and checkpoint files.
 
+        If `checkpoint_path` points at a bundle written by `dia convert` (the bundle
+        directory or any file inside it), the bundle's own config and dtype are used and
+        the pre-converted weights are loaded as-is.
+
         Args:
-            config_path: Path to the configuration JSON file.
-            checkpoint_path: Path to the model checkpoint (.pth) file.
-            compute_dtype: The computation dtype to use.
+            config_path: Path to the configuration JSON file. Ignored for bundles.
+            checkpoint_path: Path to the model checkpoint (.pth) file, or to a converted bundle.
+            compute_dtype: The computation dtype to use. Ignored for bundles.
             device: The device to load the model onto. If None, will automatically select the best available device.
-            load_dac: Whether to load the DAC model.
+            load_dac: Whether to load the DAC model, or a codec to use instead (see `__init__`).
+            weight_quant: Optional weight-only quantization ("int8" or "int4") applied to every
+                `DenseGeneral` after loading. Ignored for bundles, which carry their own.
+            mmap_weights: Memory-map a bundle's weights on CPU instead of reading them, so that
+                processes loading the same bundle share its pages (see `dia.pipeline`).
+                Only supported for bundles.
 
         Returns:
             An instance of the Dia model loaded with weights and set to eval mode.
@@ -148,6 +283,14 @@ class Dia:
             FileNotFoundError: If the config or checkpoint file is not found.
             RuntimeError: If there is an error loading the checkpoint.
         """
+        from .convert import find_bundle_dir
+
+        bundle_dir = find_bundle_dir(checkpoint_path)
+        if bundle_dir is not None:
+            return cls._from_bundle(bundle_dir, compute_dtype, device, load_dac, weight_quant, mmap_weights)
+        if mmap_weights:
+            print("Warning: mmap_weights is only supported for bundles written by `dia convert`; ignoring it.")
+
         config = DiaConfig.load(config_path)
         if config is None:
             raise FileNotFoundError(f"Config file not found at {config_path}")
@@ -161,10 +304,14 @@ class Dia:
             raise FileNotFoundError(f"Checkpoint file not found at {checkpoint_path}")
         except Exception as e:
             raise RuntimeError(f"Error loading checkpoint from {checkpoint_path}") from e
+        stat = os.stat(checkpoint_path)
+        dia._weights_info["weights"] = (os.path.abspath(checkpoint_path), stat.st_size, stat.st_mtime_ns)
 
+        if weight_quant is not None:
+            dia._quantize_weights(weight_quant)
         dia.model.to(dia.device)
         dia.model.eval()
-        if load_dac:
+        if dia.load_dac:
             dia._load_dac_model()
         return dia
 
@@ -174,7 +321,8 @@ class Dia:
         model_name: str = "nari-labs/Dia-1.6B",
         compute_dtype: str | ComputeDtype = ComputeDtype.FLOAT32,
         device: torch.device | None = None,
-        load_dac: bool = True,
+        load_dac: bool | torch.nn.Module = True,
+        weight_quant: str | None = None,
     ) -> "Dia":
         """Loads the Dia model from a Hugging Face Hub repository.
 
@@ -185,7 +333,9 @@ class Dia:
             model_name: The Hugging Face Hub repository ID (e.g., "nari-labs/Dia-1.6B").
             compute_dtype: The computation dtype to use.
             device: The device to load the model onto. If None, will automatically select the best available device.
-            load_dac: Whether to load the DAC model.
+            load_dac: Whether to load the DAC model, or a codec to use instead (see `__init__`).
+            weight_quant: Optional weight-only quantization ("int8" or "int4") applied to every
+                `DenseGeneral` after loading. Mainly useful for memory-bandwidth-bound CPU inference.
 
         Returns:
             An instance of the Dia model loaded with weights and set to eval mode.
@@ -207,12 +357,81 @@ class Dia:
         dia = cls(config, compute_dtype, device, load_dac)
 
         dia.model = loaded_model  # Assign the already loaded model
+        dia._weights_info["weights"] = model_name
+        if weight_quant is not None:
+            dia._quantize_weights(weight_quant)
+        dia.model.to(dia.device)
+        dia.model.eval()
+        if dia.load_dac:
+            dia._load_dac_model()
+        return dia
+
+    @classmethod
+    def _from_bundle(
+        cls,
+        bundle_dir: str,
+        compute_dtype: str | ComputeDtype,
+        device: torch.device | None,
+        load_dac: bool | torch.nn.Module,
+        weight_quant: str | None = None,
+        mmap_weights: bool = False,
+    ) -> "Dia":
+        """Loads a bundle written by `dia convert`. See `dia.convert` for the format."""
+        from .convert import load_bundle
+
+        if isinstance(compute_dtype, str):
+            compute_dtype = ComputeDtype(compute_dtype)
+        device = device if device is not None else _get_default_device()
+
+        try:
+            config, loaded_model, manifest = load_bundle(bundle_dir, device, mmap=mmap_weights)
+        except FileNotFoundError:
+            raise
+        except Exception as e:
+            raise RuntimeError(f"Error loading bundle from {bundle_dir}") from e
+
+        bundle_dtype = ComputeDtype(manifest["compute_dtype"])
+        if bundle_dtype != compute_dtype:
+            print(
+                f"Warning: bundle was converted for {bundle_dtype.value}; "
+                f"ignoring compute_dtype={compute_dtype.value}."
+            )
+        if weight_quant is not None and weight_quant != manifest.get("weight_quant"):
+            print(
+                f"Warning: bundle weight_quant is {manifest.get('weight_quant')}; "
+                f"ignoring weight_quant={weight_quant}."
+            )
+
+        dia = cls(config, bundle_dtype, device, load_dac)
+        dia.model = loaded_model
+        dia._weights_info = {"weights": os.path.abspath(bundle_dir), "manifest": manifest}
         dia.model.to(dia.device)
         dia.model.eval()
-        if load_dac:
+        if dia.load_dac:
             dia._load_dac_model()
         return dia
 
+    def _quantize_weights(self, weight_quant: str):
+        """Quantizes every `DenseGeneral` of the loaded model in place. See `dia.quantization`."""
+        from .quantization import quantize_dense_layers
+
+        with torch.no_grad():
+            quantize_dense_layers(self.model, weight_quant)
+        self._weights_info["weight_quant"] = weight_quant
+
+    def fingerprint(self) -> str:
+        """A short hash of what determines this model's outputs besides the request.
+
+        Covers the weights (checkpoint file path, size and mtime; bundle path and manifest,
+        which records dtype and quantization; or Hub repository), the compute dtype, weight
+        quantization, the device type and runaway detection. Cached results are keyed by it,
+        so results of a different model are never served (see `dia.serving`).
+        """
+        info = {**self._weights_info, "compute_dtype": str(self.compute_dtype), "device": self.device.type}
+        if self.runaway_config is not None:
+            info["runaway"] = (self.runaway_config, self.length_predictor)
+        return hashlib.sha256(repr(sorted(info.items())).encode("utf-8")).hexdigest()[:16]
+
     def _load_dac_model(self):
         """Loads the Descript Audio Codec (DAC) model.
 
@@ -222,6 +441,8 @@ class Dia:
         Raises:
             RuntimeError: If downloading or loading the DAC model fails.
         """
+        if self.dac_model is not None:
+            return  # a codec was passed to __init__
         import dac
 
         try:
@@ -232,47 +453,162 @@ class Dia:
             raise RuntimeError("Failed to load DAC model") from e
         self.dac_model = dac_model
 
-    def _encode_text(self, text: str) -> torch.Tensor:
-        """Encodes the input text string into a tensor of token IDs using byte-level encoding.
+    def enable_encoder_cache(self, max_bytes: int) -> LRUCache:
+        """Enables an LRU cache of encoder outputs and cross-attention K/V, keyed by text.
 
-        Special tokens [S1] and [S2] are replaced by their byte values. The resulting
-        sequence is truncated to the maximum configured text length.
+        Regenerating the same text (e.g. another take with a different seed) then skips the
+        encoder and the cross-attention projections. Entries are stored trimmed to the text
+        length, so a cached text can be reused in batches of any length bucket.
 
         Args:
-            text: The input text string.
+            max_bytes: The cache budget in bytes. Least recently used texts are evicted first.
 
         Returns:
-            A tensor containing the encoded byte token IDs.
+            The cache, which exposes hit/miss counters via `stats()`.
         """
-        max_len = self.config.data.text_length
+        self.encoder_cache = LRUCache(max_bytes)
+        cache = self.encoder_cache
+        metrics.track_hit_rate("encoder", lambda: cache.hits, lambda: cache.hits + cache.misses)
+        return self.encoder_cache
 
-        byte_text = text.encode("utf-8")
-        # Replace special tokens with their byte values if needed by the specific tokenizer/config
-        # Assuming byte values 1 and 2 are correct placeholders based on original code
-        replaced_bytes = byte_text.replace(b"[S1]", b"\x01").replace(b"[S2]", b"\x02")
-        text_tokens = list(replaced_bytes)
-        return torch.tensor(
-            text_tokens[:max_len],
-            dtype=torch.long,
-            device=self.device,
+    def set_memory_budget(self, budget_bytes: int | None) -> MemoryPlanner | None:
+        """Limits the memory used by generation; larger batches are split automatically.
+
+        The model and DAC weights count against the budget. `generate` and
+        `generate_stream` split a list of texts into consecutive sub-batches that each fit,
+        and serving workers use the same planner to cap how many requests run together.
+
+        Args:
+            budget_bytes: Total memory budget in bytes, or None to remove the limit.
+
+        Returns:
+            The planner, or None if the limit was removed.
+        """
+        self.memory_planner = MemoryPlanner.for_model(self, budget_bytes) if budget_bytes is not None else None
+        return self.memory_planner
+
+    def set_length_predictor(self, predictor: LengthPredictor | None) -> None:
+        """Sizes decoder buffers for the predicted output length instead of `max_tokens`.
+
+        The self-attention KV caches, the generated-token buffer and the causal mask are
+        allocated for the predicted length of the longest row of a batch; a batch that
+        runs longer grows them. See `dia.length`.
+
+        Args:
+            predictor: The predictor, or None to size buffers to `max_tokens` again.
+        """
+        self.length_predictor = predictor
+
+    def set_runaway_detection(self, config: RunawayConfig | bool | None) -> None:
+        """Ends rows that loop on silence or a repeated pattern, or run far past their predicted length.
+
+        Applies to every generation that does not pass `runaway` itself. See `dia.runaway`.
+
+        Args:
+            config: The detector thresholds, True for the defaults, or None (or False) to disable.
+        """
+        self.runaway_config = RunawayConfig() if config is True else config or None
+
+    def _buffer_length(self, texts: list[str], audio_prompts: list[torch.Tensor | None], max_tokens: int) -> int:
+        """Initial length (in steps) of the decoder buffers for a batch."""
+        audio_length = self.config.data.audio_length
+        prompt_frames = [0 if p is None else p.shape[0] for p in audio_prompts]
+        if self.length_predictor is None:
+            length = budget_capacity(max_tokens, audio_length)
+        else:
+            length = self.length_predictor.allocation(texts, prompt_frames, max_tokens, audio_length)
+        # The prompt (plus BOS and the first step) must always fit.
+        return min(max(length, round_up(max(prompt_frames) + 2)), audio_length)
+
+    def _grow_buffers(self, loop: "_GenerationLoop") -> None:
+        """Doubles the decoder buffers (capped at the budget) when a step would write past them."""
+        capacity = budget_capacity(loop.max_tokens, self.config.data.audio_length)
+        length = min(2 * loop.dec_state.max_len, capacity)
+        loop.dec_state.grow(length)
+        loop.dec_output.grow(length)
+        metrics.BUFFER_GROWTHS.inc()
+
+    def add_timing_hook(self, hook: TimingHook) -> Callable[[], None]:
+        """Calls `hook(stage, seconds)` for every stage of every generation. See `dia.timing`.
+
+        Hooks run on the generating thread between steps, so they should be cheap and
+        must not raise.
+
+        Returns:
+            A function that removes the hook again.
+        """
+        self._timing_hooks.append(hook)
+
+        def remove() -> None:
+            if hook in self._timing_hooks:
+                self._timing_hooks.remove(hook)
+
+        return remove
+
+    @contextmanager
+    def profile_stages(self) -> Iterator[list[StageTimings]]:
+        """Collects the `StageTimings` of every generation (or sub-batch) run inside the block.
+
+        Example:
+            with model.profile_stages() as profiles:
+                model.generate(texts)
+            print([p.summary() for p in profiles])
+        """
+        collected: list[StageTimings] = []
+        self._profiles.append(collected)
+        try:
+            yield collected
+        finally:
+            self._profiles.remove(collected)
+
+    def estimate_request_memory(
+        self, text: str, audio_prompt: str | torch.Tensor | None = None, max_tokens: int | None = None
+    ) -> MemoryEstimate:
+        """Estimates the memory one request adds to a batch. See `dia.memory`."""
+        text_length = bucket_text_length(len(text_to_bytes(text)), self.config.data.text_length)
+        prompt_frames = 0
+        if isinstance(audio_prompt, torch.Tensor):
+            prompt_frames = audio_prompt.shape[0]
+        elif isinstance(audio_prompt, str):
+            try:
+                info = torchaudio.info(audio_prompt)
+                prompt_frames = int(info.num_frames / info.sample_rate * DEFAULT_SAMPLE_RATE / SAMPLE_RATE_RATIO)
+            except Exception:
+                pass
+        return estimate_request_memory(self.config, self.compute_dtype, max_tokens, text_length, prompt_frames)
+
+    def _memory_batches(
+        self,
+        text: str | list[str],
+        audio_prompt: list[str | torch.Tensor | None] | str | torch.Tensor | None,
+        max_tokens: int | None,
+        num_samples: int = 1,
+    ) -> list[list[int]] | None:
+        """Splits a batch into row groups that fit the memory budget, or None if no split is needed.
+
+        The samples of a text always stay in the same group, so they share its encoder work.
+        """
+        if self.memory_planner is None or not isinstance(text, list) or len(text) <= 1:
+            return None
+        prompts = audio_prompt if isinstance(audio_prompt, list) else [audio_prompt] * len(text)
+        groups = self.memory_planner.split(
+            range(len(text)),
+            lambda i: self.estimate_request_memory(text[i], prompts[i], max_tokens).repeated(num_samples),
         )
+        return groups if len(groups) > 1 else None
 
-    def _pad_text_input(self, text_tokens: list[torch.Tensor]) -> torch.Tensor:
-        """Pads the text input to the maximum length."""
-        text_pad_value = self.config.data.text_pad_value
-        max_len = self.config.data.text_length
-        batch_size = len(text_tokens)
+    def _tokenize(self, texts: list[str] | list[bytes]) -> TextBatch:
+        """Tokenizes texts into one padded [B, 1, T_text] batch at the bucketed text length.
 
-        src_tokens = torch.full(
-            (batch_size, 1, max_len),
-            fill_value=text_pad_value,
-            dtype=torch.long,
+        Padded positions are masked out in both encoder self-attention and decoder
+        cross-attention, so the bucket size does not change the result. See `dia.tokenizer`.
+        """
+        return tokenize_batch(
+            texts,
+            max_len=self.config.data.text_length,
+            pad_value=self.config.data.text_pad_value,
             device=self.device,
         )
-        for i in range(batch_size):
-            current_len = len(text_tokens[i])
-            src_tokens[i, 0, :current_len] = text_tokens[i]
-        return src_tokens
 
     def _prepare_audio_prompt(self, audio_prompts: list[torch.Tensor | None]) -> tuple[torch.Tensor, list[int]]:
         """Prepares the audio prompt tensor for the decoder.
@@ -335,27 +671,21 @@ class Dia:
 
         return delayed_batch, prefill_steps
 
-    def _prepare_generation(
-        self,
-        text: torch.Tensor,
-        audio_prompts: list[torch.Tensor | None],
-    ):
-        """Initializes the model state for generation.
-
-        Encodes the text input (conditional and unconditional), prepares the
-        encoder and decoder states (including KV caches and cross-attention),
-        prepares the audio prompt, and performs the initial decoder prefill steps
-        based on the audio prompts.
+    def _run_encoder(
+        self, text: torch.Tensor, lengths: torch.Tensor
+    ) -> tuple[EncoderInferenceState, torch.Tensor, list[KVCache]]:
+        """Runs the encoder (conditional and unconditional) and precomputes cross-attention K/V.
 
         Args:
-            text: The padded text input tensor, shape [B, 1, T_text].
-            audio_prompts: A list of prepared audio prompt tensors or None.
+            text: The padded text input tensor, shape [B, 1, T_text], where T_text is the
+                  bucketed text length.
+            lengths: The number of valid text tokens per row, shape [B].
 
         Returns:
             A tuple containing:
-                - dec_state (DecoderInferenceState): The initialized decoder state.
-                - dec_output (DecoderOutput): The initialized decoder output manager,
-                  containing the prefilled audio tokens.
+                - enc_state (EncoderInferenceState): The encoder state.
+                - encoder_out (torch.Tensor): Encoder output, shape [2*B, T_text, E].
+                - cross_attn_cache (list[KVCache]): Per-layer cross-attention K/V.
         """
         batch_size = text.shape[0]
 
@@ -364,18 +694,129 @@ class Dia:
         stacked_inputs = torch.stack([enc_input_uncond, enc_input_cond], dim=1)
         enc_input = stacked_inputs.view(2 * batch_size, -1)
 
-        enc_state = EncoderInferenceState.new(self.config, enc_input_cond)
+        enc_state = EncoderInferenceState.new(self.config, enc_input_cond, lengths)
         encoder_out = self.model.encoder(enc_input, enc_state)
 
+        # Like sampling, the cross-attention precompute is timed separately in eager mode only.
+        timed = not torch.compiler.is_compiling()
+        if timed:
+            cross_attn_start = self._timer_mark()
         dec_cross_attn_cache = self.model.decoder.precompute_cross_attn_cache(
             encoder_out, enc_state.positions, enc_state.padding_mask
         )
+        if timed:
+            self._cross_attn_marks = (cross_attn_start, self._timer_mark())
+        return enc_state, encoder_out, dec_cross_attn_cache
+
+    def _encode_text_batch(self, text_batch: TextBatch) -> tuple[EncoderInferenceState, torch.Tensor, list[KVCache]]:
+        """Encodes a batch of byte texts, running the encoder once per distinct text.
+
+        Identical texts within the batch are deduplicated before the encoder runs. If the
+        encoder cache is enabled, cached texts skip the encoder entirely.
+
+        Args:
+            text_batch: The tokenized batch.
+
+        Returns:
+            The same tuple as `_run_encoder`, for the full batch.
+        """
+        text_bytes = text_batch.byte_texts
+        unique_texts = list(dict.fromkeys(text_bytes))
+        row_index = {t: i for i, t in enumerate(unique_texts)}
+
+        if self.encoder_cache is None:
+            if len(unique_texts) == len(text_bytes):
+                return self._run_encoder(text_batch.tokens, text_batch.lengths)
+            unique_batch = self._tokenize(unique_texts)
+            _, encoder_out, cross_attn_cache = self._run_encoder(unique_batch.tokens, unique_batch.lengths)
+
+            # Expand unique rows back to the batch, keeping the [uncond, cond] row pairs together.
+            unique_idx = torch.tensor([row_index[t] for t in text_bytes], device=self.device)
+            pair_idx = torch.stack([2 * unique_idx, 2 * unique_idx + 1], dim=1).view(-1)
+            enc_state = EncoderInferenceState.new(self.config, text_batch.tokens, text_batch.lengths)
+            encoder_out = encoder_out.index_select(0, pair_idx)
+            cross_attn_cache = [cache.select_rows(pair_idx) for cache in cross_attn_cache]
+            return enc_state, encoder_out, cross_attn_cache
+
+        entries = {}
+        missing = []
+        for t in unique_texts:
+            entry = self.encoder_cache.get(self._encoder_cache_key(t)) if t else None
+            if entry is None:
+                missing.append(t)
+            else:
+                entries[t] = entry
+
+        if missing:
+            missing_batch = self._tokenize(missing)
+            _, missing_out, missing_cross = self._run_encoder(missing_batch.tokens, missing_batch.lengths)
+            for i, t in enumerate(missing):
+                rows, n = slice(2 * i, 2 * i + 2), len(t)
+                entry = (
+                    missing_out[rows, :n].clone(),
+                    [cache.k[rows, :, :n].clone() for cache in missing_cross],
+                    [cache.v[rows, :, :n].clone() for cache in missing_cross],
+                )
+                entries[t] = entry
+                if n > 0:
+                    nbytes = tensor_nbytes(entry[0], *entry[1], *entry[2])
+                    self.encoder_cache.put(self._encoder_cache_key(t), entry, nbytes)
+
+        # Assemble the batch at its own length bucket; positions past each text stay masked.
+        enc_state = EncoderInferenceState.new(self.config, text_batch.tokens, text_batch.lengths)
+        seq_len = text_batch.tokens.shape[-1]
+        first_out, first_k, first_v = entries[text_bytes[0]]
+        encoder_out = first_out.new_zeros((2 * len(text_bytes), seq_len, first_out.shape[-1]))
+        layer_k = [k.new_zeros((2 * len(text_bytes), k.shape[1], seq_len, k.shape[3])) for k in first_k]
+        layer_v = [v.new_zeros((2 * len(text_bytes), v.shape[1], seq_len, v.shape[3])) for v in first_v]
+        for i, t in enumerate(text_bytes):
+            rows, n = slice(2 * i, 2 * i + 2), len(t)
+            cached_out, cached_k, cached_v = entries[t]
+            encoder_out[rows, :n] = cached_out
+            for layer in range(len(layer_k)):
+                layer_k[layer][rows, :, :n] = cached_k[layer]
+                layer_v[layer][rows, :, :n] = cached_v[layer]
+        cross_attn_cache = [KVCache.from_kv(k, v) for k, v in zip(layer_k, layer_v)]
+        return enc_state, encoder_out, cross_attn_cache
+
+    def _encoder_cache_key(self, text_bytes: bytes) -> tuple[bytes, str, str]:
+        return text_bytes, str(self.compute_dtype), str(self.device)
+
+    def _prepare_generation(
+        self,
+        enc_state: EncoderInferenceState,
+        encoder_out: torch.Tensor,
+        dec_cross_attn_cache: list[KVCache],
+        audio_prompts: list[torch.Tensor | None],
+        max_len: int | None = None,
+    ):
+        """Initializes the model state for generation.
+
+        Prepares the decoder state (including KV caches and cross-attention) from the
+        encoder outputs, prepares the audio prompt, and performs the initial decoder
+        prefill steps based on the audio prompts.
+
+        Args:
+            enc_state: The encoder state returned by `_encode_text_batch`.
+            encoder_out: The encoder output, shape [2*B, T_text, E].
+            dec_cross_attn_cache: The per-layer cross-attention K/V.
+            audio_prompts: A list of prepared audio prompt tensors or None.
+            max_len: Length of the decoder buffers in steps (default: the configured audio length).
+
+        Returns:
+            A tuple containing:
+                - dec_state (DecoderInferenceState): The initialized decoder state.
+                - dec_output (DecoderOutput): The initialized decoder output manager,
+                  containing the prefilled audio tokens.
+        """
+        batch_size = encoder_out.shape[0] // 2
+
         dec_state = DecoderInferenceState.new(
-            self.config, enc_state, encoder_out, dec_cross_attn_cache, self.compute_dtype
+            self.config, enc_state, encoder_out, dec_cross_attn_cache, self.compute_dtype, max_len
         )
         prefill, prefill_steps = self._prepare_audio_prompt(audio_prompts)
 
-        dec_output = DecoderOutput.new(batch_size, self.config, self.device)
+        dec_output = DecoderOutput.new(batch_size, self.config, self.device, max_len)
         dec_output.prefill(prefill, prefill_steps)
 
         dec_step = min(prefill_steps) - 1
@@ -395,6 +836,7 @@ class Dia:
         top_p: float,
         top_k: int,
         current_idx: int,
+        noise_BxC: torch.Tensor | None = None,
     ) -> torch.Tensor:
         """Performs a single step of the decoder inference.
 
@@ -412,6 +854,8 @@ class Dia:
             top_p: The cumulative probability threshold for top-p sampling.
             top_k: The number of top logits to consider for top-k sampling.
             current_idx: The current generation step index.
+            noise_BxC: Uniform noise to sample with, shape [B, C], for per-row seeded
+                       sampling; None samples from the global RNG.
 
         Returns:
             torch.Tensor: The sampled next tokens for each item in the batch,
@@ -441,18 +885,28 @@ class Dia:
 
         flat_logits_BCxV = logits_BxCxV.view(B * self.config.data.channels, -1)
 
-        pred_BC = _sample_next_token(
-            flat_logits_BCxV.float(),
-            temperature=temperature,
-            top_p=top_p,
-            top_k=top_k,
-            audio_eos_value=audio_eos_value,
-        )
+        # Sampling is timed in eager mode only; the marks are read once the step has synced.
+        timed = not torch.compiler.is_compiling()
+        if timed:
+            sampling_start = self._timer_mark()
+        with record("sample_next_token"):
+            pred_BC = _sample_next_token(
+                flat_logits_BCxV.float(),
+                temperature=temperature,
+                top_p=top_p,
+                top_k=top_k,
+                audio_eos_value=audio_eos_value,
+                noise_BC=None if noise_BxC is None else noise_BxC.reshape(-1),
+            )
+        if timed:
+            self._sampling_marks = (sampling_start, self._timer_mark())
 
         pred_BxC = pred_BC.view(B, self.config.data.channels)
         return pred_BxC
 
-    def _generate_output(self, generated_codes: torch.Tensor, lengths_Bx: torch.Tensor) -> list[np.ndarray]:
+    def _generate_output(
+        self, generated_codes: torch.Tensor, lengths_Bx: torch.Tensor, return_codes: bool = False
+    ) -> list[np.ndarray]:
         """Converts generated delayed codes into audio waveforms.
 
         Reverts the delay pattern applied during generation, decodes the resulting
@@ -465,12 +919,41 @@ class Dia:
             lengths_Bx: A tensor containing the valid length of generated codes
                         (excluding padding and BOS/EOS markers) for each item
                         in the batch, shape [B].
+            return_codes: Return the reverted codebook indices even if DAC is loaded.
 
         Returns:
             A list of NumPy arrays, where each array represents the generated audio
             waveform for one item in the batch. If DAC is not loaded, returns the
             raw, reverted codebook indices as NumPy arrays.
         """
+        codebooks = self._revert_codes(generated_codes, lengths_Bx)
+        if self.load_dac and not return_codes:
+            return [self._decode(codebook).cpu().numpy() for codebook in codebooks]
+        return [codebook.cpu().numpy() for codebook in codebooks]
+
+    def _generation_results(
+        self,
+        generated_codes: torch.Tensor,
+        lengths_Bx: torch.Tensor,
+        finish_reasons: list[str],
+        return_codes: bool = False,
+    ) -> list[GenerationResult]:
+        """Like `_generate_output`, but returns a `GenerationResult` per row with codes and timings."""
+        decode = self.load_dac and not return_codes
+        return [
+            GenerationResult(
+                waveform=self._decode(codebook).cpu().numpy() if decode else None,
+                codes=codebook.cpu().numpy(),
+                length=codebook.shape[0],
+                finish_reason=reason,
+                timings=self._timings,
+            )
+            for codebook, reason in zip(self._revert_codes(generated_codes, lengths_Bx), finish_reasons)
+        ]
+
+    def _revert_codes(self, generated_codes: torch.Tensor, lengths_Bx: torch.Tensor) -> list[torch.Tensor]:
+        """Reverts the delay pattern and returns each row's valid codebook, shape [T_i, C]."""
+        start = self._timer_mark()
         num_channels = self.config.data.channels
         batch_size = generated_codes.shape[0]
         seq_length = generated_codes.shape[1]
@@ -497,17 +980,9 @@ class Dia:
         invalid_mask = (codebook < min_valid_index) | (codebook > max_valid_index)
         codebook[invalid_mask] = 0
 
-        audios = []
-
-        if self.load_dac:
-            for i in range(batch_size):
-                audio = self._decode(codebook[i, : lengths_Bx[i], :])
-                audio_np = audio.cpu().numpy()
-                audios.append(audio_np)
-        else:
-            for i in range(batch_size):
-                audios.append(codebook[i, : lengths_Bx[i], :].cpu().numpy())
-        return audios
+        codebooks = [codebook[i, : lengths_Bx[i], :] for i in range(batch_size)]
+        self._record_stage("delay_revert", self._timer_elapsed(start, self._timer_mark()))
+        return codebooks
 
     @torch.no_grad()
     @torch.inference_mode()
@@ -527,12 +1002,33 @@ class Dia:
         """
         Decodes the given frames into an output audio waveform
         """
+        start = self._timer_mark()
         audio_codes = audio_codes.unsqueeze(0).transpose(1, 2)
-        audio_values, _, _ = self.dac_model.quantizer.from_codes(audio_codes)
-        audio_values = self.dac_model.decode(audio_values)
+        with record("dac_decode"):
+            audio_values, _, _ = self.dac_model.quantizer.from_codes(audio_codes)
+            audio_values = self.dac_model.decode(audio_values)
         audio_values: torch.Tensor
+        self._record_stage("dac_decode", self._timer_elapsed(start, self._timer_mark()), metrics.DAC_DECODE_SECONDS)
         return audio_values.squeeze()
 
+    @torch.inference_mode()
+    def decode_codes(self, codes: np.ndarray | torch.Tensor) -> np.ndarray:
+        """Decodes a reverted codebook (as returned with `return_codes=True`) into a waveform.
+
+        Args:
+            codes: DAC codebook indices, shape [T, C].
+
+        Returns:
+            The audio waveform as a float32 NumPy array.
+
+        Raises:
+            RuntimeError: If the DAC model is not loaded (`load_dac=False` during init).
+        """
+        if self.dac_model is None:
+            raise RuntimeError("DAC model is required for decoding codes but was not loaded.")
+        codes = torch.as_tensor(np.asarray(codes, dtype=np.int64) if isinstance(codes, np.ndarray) else codes)
+        return self._decode(codes.to(self.device, dtype=torch.long)).cpu().numpy()
+
     def load_audio(self, audio_path: str) -> torch.Tensor:
         """Loads and preprocesses an audio file for use as a prompt.
 
@@ -559,6 +1055,30 @@ class Dia:
             audio = torchaudio.functional.resample(audio, sr, DEFAULT_SAMPLE_RATE)
         return self._encode(audio.to(self.device))
 
+    def encode_audio(self, audio: np.ndarray | torch.Tensor, sample_rate: int) -> torch.Tensor:
+        """Encodes an in-memory waveform into DAC codes for use as a prompt, without a file.
+
+        Args:
+            audio: Float waveform in [-1, 1], shape [T] or [C, T]. Multi-channel audio is
+                   averaged to mono.
+            sample_rate: Sample rate of `audio`.
+
+        Returns:
+            torch.Tensor: The encoded audio prompt as DAC codebook indices, shape [T, C].
+
+        Raises:
+            RuntimeError: If the DAC model is not loaded (`load_dac=False` during init).
+        """
+        if self.dac_model is None:
+            raise RuntimeError("DAC model is required for encoding audio prompts but was not loaded.")
+        audio = torch.as_tensor(audio, dtype=torch.float32)
+        if audio.ndim == 2:
+            audio = audio.mean(dim=0)
+        audio = audio.unsqueeze(0)  # 1, T
+        if sample_rate != DEFAULT_SAMPLE_RATE:
+            audio = torchaudio.functional.resample(audio, sample_rate, DEFAULT_SAMPLE_RATE)
+        return self._encode(audio.to(self.device))
+
     def save_audio(self, path: str, audio: np.ndarray):
         """Saves the generated audio waveform to a file.
 
@@ -587,7 +1107,14 @@ class Dia:
         audio_prompt_path: list[str | torch.Tensor | None] | str | torch.Tensor | None = None,
         use_cfg_filter: bool | None = None,
         verbose: bool = False,
-    ) -> np.ndarray | list[np.ndarray]:
+        return_codes: bool = False,
+        return_result: bool = False,
+        profile: ProfileConfig | bool | None = None,
+        on_step: StepCallback | None = None,
+        runaway: RunawayConfig | bool | None = None,
+        num_samples: int = 1,
+        seed: int | list[int | None] | None = None,
+    ) -> np.ndarray | list[np.ndarray] | GenerationResult | list[GenerationResult] | list[list]:
         """Generates audio corresponding to the input text.
 
         Args:
@@ -611,6 +1138,31 @@ class Dia:
             use_cfg_filter: (Deprecated) This parameter is no longer used.
             verbose: If True, prints progress information during generation, including
                      speed metrics.
+            return_codes: If True, returns the reverted DAC codebook indices (shape [T, C])
+                          instead of decoding them, e.g. to cache them and decode later
+                          with `decode_codes`.
+            return_result: If True, returns a `GenerationResult` per prompt with the
+                           waveform, codes, length, finish reason and stage timings
+                           (see `dia.timing`) instead of bare arrays.
+            profile: Run a window of decode steps under `torch.profiler` and write a Chrome
+                     trace and a top-ops table (see `dia.profiling`). True profiles the
+                     default window (steps 50 to 80).
+            on_step: Called with a `StepInfo` after every decode step; may return a stop
+                     signal for all or some rows (see `dia.control`). Stopped rows keep
+                     the audio generated so far.
+            runaway: End rows that loop on silence or a repeated pattern, or run far past
+                     their predicted length, through the EOS countdown (see `dia.runaway`).
+                     True uses the default thresholds, False disables detection, and None
+                     uses the model's setting (`set_runaway_detection`).
+            num_samples: Number of independent takes per text. The text is tokenized and
+                         encoded, and the audio prompt prefilled, once; the decoder state is
+                         then copied into `num_samples` rows that sample independently.
+                         `on_step` sees every take of text i with row index i.
+            seed: Seed of each row's own sampling RNG, for all texts or one per text (None
+                  for a row samples from the global RNG). A seeded text produces the same
+                  audio whatever else is in its batch. Take 0 of `num_samples` uses `seed`
+                  itself, so it equals the single-take result; later takes use seeds drawn
+                  from a generator seeded with `seed` (see `_take_seeds`).
 
         Returns:
             If a single text prompt was provided, returns a NumPy array containing the
@@ -618,14 +1170,16 @@ class Dia:
             If a list of text prompts was provided, returns a list of NumPy arrays,
             each corresponding to a prompt in the input list. Returns None for a
             sequence if no audio was generated for it.
+            With `return_result=True`, a `GenerationResult` (or a list of them) instead.
+            With `num_samples > 1`, each of the above is a list of `num_samples` takes.
+
+        Raises:
+            ValueError: If `num_samples` is less than 1.
         """
         batch_size = len(text) if isinstance(text, list) else 1
-        audio_eos_value = self.config.data.audio_eos_value
-        audio_pad_value = self.config.data.audio_pad_value
-        delay_pattern = self.config.data.delay_pattern
-        max_tokens = self.config.data.audio_length if max_tokens is None else max_tokens
-        max_delay_pattern = max(delay_pattern)
-        delay_pattern_Cx = torch.tensor(delay_pattern, device=self.device, dtype=torch.long)
+        if num_samples < 1:
+            raise ValueError(f"num_samples must be at least 1, got {num_samples}")
+        seeds = self._row_seeds(seed, batch_size)
         self.model.eval()
 
         if audio_prompt_path:
@@ -634,15 +1188,275 @@ class Dia:
         if use_cfg_filter is not None:
             print("Warning: use_cfg_filter is deprecated.")
 
+        groups = self._memory_batches(text, audio_prompt, max_tokens, num_samples)
+        if groups is not None:
+            if verbose:
+                print(f"generate: splitting {batch_size} texts into {len(groups)} batches to fit the memory budget")
+            prompts = audio_prompt if isinstance(audio_prompt, list) else [audio_prompt] * batch_size
+            outputs = []
+            for indices in groups:
+                sub_outputs = self.generate(
+                    [text[i] for i in indices],
+                    max_tokens=max_tokens,
+                    cfg_scale=cfg_scale,
+                    temperature=temperature,
+                    top_p=top_p,
+                    use_torch_compile=use_torch_compile,
+                    cfg_filter_top_k=cfg_filter_top_k,
+                    audio_prompt=[prompts[i] for i in indices],
+                    verbose=verbose,
+                    return_codes=return_codes,
+                    return_result=return_result,
+                    profile=profile,
+                    on_step=remap_rows(on_step, indices),
+                    runaway=runaway,
+                    num_samples=num_samples,
+                    seed=None if seeds is None else [seeds[i] for i in indices],
+                )
+                outputs.extend(sub_outputs if len(indices) > 1 else [sub_outputs])
+            return outputs
+
         if verbose:
             total_start_time = time.time()
 
+        generation_start = time.perf_counter()
+        self._begin_timings(return_result)
+        self._maybe_compile(use_torch_compile)
+        profiler = None
+        if profile:
+            profiler = GenerationProfiler(ProfileConfig() if profile is True else profile, self.device)
+            profiler.at_step(0)
+        loop = self._start_generation(text, audio_prompt, max_tokens, runaway, num_samples, seeds)
+
+        if verbose:
+            print("generate: starting generation loop")
+            if use_torch_compile:
+                print("generate: using use_torch_compile=True, the first step may be slow")
+            start_time = time.time()
+
+        # --- Generation Loop ---
+        steps_done = 0
+        while not loop.done:
+            if profiler is not None:
+                profiler.at_step(steps_done)
+            self._generation_step(loop, cfg_scale, temperature, top_p, cfg_filter_top_k, on_step)
+            steps_done += 1
+            if profiler is not None:
+                profiler.step_done()
+
+            if verbose and loop.dec_step % 86 == 0:
+                duration = time.time() - start_time
+                if duration > 0:
+                    print(
+                        f"generate step {loop.dec_step}: speed={86 * batch_size / duration:.3f} tokens/s, realtime factor={batch_size / duration:.3f}x"
+                    )
+                start_time = time.time()
+
+        # --- Finalize and Extract Output ---
+        lengths_Bx = self._finish_lengths(loop)
+        generated_codes = self._collect_codes(loop, lengths_Bx)
+        finish_reasons = loop.finish_reasons()
+
+        if generated_codes is not None:
+            if verbose:
+                avg_steps = lengths_Bx.float().mean().item()
+                total_duration = time.time() - total_start_time
+                print(f"generate: avg steps={avg_steps:.1f}, total duration={total_duration:.3f}s")
+
+            del loop
+
+            if return_result:
+                outputs = self._generation_results(generated_codes, lengths_Bx, finish_reasons, return_codes)
+            else:
+                outputs = self._generate_output(generated_codes, lengths_Bx, return_codes)
+            self._record_generation(lengths_Bx, generation_start)
+        else:
+            print("Warning: Nothing generated for any sequence in the batch.")
+            outputs = [None] * len(finish_reasons)
+            if return_result:
+                empty = np.zeros((0, self.config.data.channels), dtype=np.int64)
+                outputs = [GenerationResult(None, empty, 0, reason, self._timings) for reason in finish_reasons]
+        if profiler is not None:
+            profiler.finish()
+        self._end_timings()
+
+        if num_samples > 1:
+            outputs = [outputs[i * num_samples : (i + 1) * num_samples] for i in range(batch_size)]
+        return outputs if batch_size > 1 else outputs[0]
+
+    @torch.inference_mode()
+    def generate_stream(
+        self,
+        text: str | list[str],
+        max_tokens: int | None = None,
+        cfg_scale: float = 3.0,
+        temperature: float = 1.2,
+        top_p: float = 0.95,
+        use_torch_compile: bool = False,
+        cfg_filter_top_k: int = 45,
+        audio_prompt: list[str | torch.Tensor | None] | str | torch.Tensor | None = None,
+        chunk_frames: int = 43,
+        on_step: StepCallback | None = None,
+        runaway: RunawayConfig | bool | None = None,
+        num_samples: int = 1,
+        seed: int | list[int | None] | None = None,
+    ) -> Iterator[AudioChunk]:
+        """Generates audio incrementally, yielding DAC-decoded windows as soon as they exist.
+
+        A frame is complete once every delayed channel has been sampled for it. Whenever a
+        row has `chunk_frames` new complete frames, they are decoded with a few frames of
+        left context and lookahead (to avoid edge artifacts) and yielded. Each row ends
+        with a chunk that has `is_final=True`.
+
+        Args:
+            text: The input text prompt, or a list of text prompts for batch generation.
+            max_tokens: The maximum number of audio tokens to generate per prompt.
+            cfg_scale: The scale factor for classifier-free guidance (CFG).
+            temperature: The temperature for sampling.
+            top_p: The cumulative probability threshold for nucleus (top-p) sampling.
+            use_torch_compile: Whether to compile the generation steps using torch.compile.
+            cfg_filter_top_k: The number of top logits to consider during sampling.
+            audio_prompt: An audio prompt or list of prompts, as for `generate`.
+            chunk_frames: Number of new frames (~86 per second) to accumulate per chunk.
+            on_step: Per-step callback that can stop rows, as for `generate`. A stopped
+                     row gets its final chunk right away.
+            runaway: Runaway detection, as for `generate`. Trimming cannot take back
+                     chunks that were already yielded.
+            num_samples: Independent takes per text, as for `generate`; chunks carry the
+                         text's index as `row` and the take's index as `sample`.
+            seed: Per-row sampling seeds, as for `generate`.
+
+        Yields:
+            AudioChunk objects, in generation order, for all rows of the batch.
+
+        Raises:
+            RuntimeError: If the DAC model is not loaded.
+            ValueError: If `num_samples` is less than 1.
+        """
+        if self.dac_model is None:
+            raise RuntimeError("DAC model is required for streaming but was not loaded.")
+        if num_samples < 1:
+            raise ValueError(f"num_samples must be at least 1, got {num_samples}")
+        seeds = self._row_seeds(seed, len(text) if isinstance(text, list) else 1)
+
+        groups = self._memory_batches(text, audio_prompt, max_tokens, num_samples)
+        if groups is not None:
+            # Sub-batches run one after another; rows keep their index in the full batch.
+            prompts = audio_prompt if isinstance(audio_prompt, list) else [audio_prompt] * len(text)
+            for indices in groups:
+                for chunk in self.generate_stream(
+                    [text[i] for i in indices],
+                    max_tokens=max_tokens,
+                    cfg_scale=cfg_scale,
+                    temperature=temperature,
+                    top_p=top_p,
+                    use_torch_compile=use_torch_compile,
+                    cfg_filter_top_k=cfg_filter_top_k,
+                    audio_prompt=[prompts[i] for i in indices],
+                    chunk_frames=chunk_frames,
+                    on_step=remap_rows(on_step, indices),
+                    runaway=runaway,
+                    num_samples=num_samples,
+                    seed=None if seeds is None else [seeds[i] for i in indices],
+                ):
+                    chunk.row = indices[chunk.row]
+                    yield chunk
+            return
+
+        self.model.eval()
+        generation_start = time.perf_counter()
+        self._begin_timings()
+        self._maybe_compile(use_torch_compile)
+        loop = self._start_generation(text, audio_prompt, max_tokens, runaway, num_samples, seeds)
+        emitted = [0] * loop.batch_size
+        finished = [False] * loop.batch_size
+
+        while not loop.done:
+            self._generation_step(loop, cfg_scale, temperature, top_p, cfg_filter_top_k, on_step)
+            yield from self._sample_chunks(self._ready_chunks(loop, emitted, finished, chunk_frames), num_samples)
+
+        lengths_Bx = self._finish_lengths(loop)
+        final_chunks = self._ready_chunks(loop, emitted, finished, chunk_frames, final_lengths=lengths_Bx.tolist())
+        yield from self._sample_chunks(final_chunks, num_samples)
+        self._record_generation(lengths_Bx, generation_start)
+        self._end_timings()
+
+    @staticmethod
+    def _row_seeds(seed: int | list[int | None] | None, batch_size: int) -> list[int | None] | None:
+        """Expands `seed` to one entry per text, or None if no row is seeded.
+
+        Raises:
+            ValueError: If a list of seeds does not have one entry per text.
+        """
+        if seed is None:
+            return None
+        if not isinstance(seed, list):
+            return [seed] * batch_size
+        if len(seed) != batch_size:
+            raise ValueError(f"Got {len(seed)} seeds for {batch_size} texts")
+        return seed if any(s is not None for s in seed) else None
+
+    @staticmethod
+    def _take_seeds(seed: int | None, num_samples: int) -> list[int | None]:
+        """The seeds of a row's `num_samples` takes.
+
+        Take 0 uses `seed` itself, so it matches a single-take call. Later takes use seeds
+        drawn from a CPU generator seeded with `seed`, so every (seed, take) pair gets its
+        own stream: take j of one seed is not take 0 of another.
+        """
+        if seed is None or num_samples == 1:
+            return [seed] * num_samples
+        generator = torch.Generator().manual_seed(seed)
+        return [seed] + torch.randint(0, 2**63 - 1, (num_samples - 1,), generator=generator).tolist()
+
+    def _row_noise(self, loop: "_GenerationLoop", step: int) -> torch.Tensor | None:
+        """Uniform sampling noise for one step, drawn from each seeded row's own generator.
+
+        A row draws from its generator only from its first generated step on, so its
+        stream does not depend on the prompt lengths of the other rows in the batch.
+        Returns None (sample from the global RNG) if no row is seeded.
+        """
+        if loop.generators is None:
+            return None
+        channels = self.config.data.channels
+        noise_BxC = torch.rand((loop.batch_size, channels), device=self.device)
+        for row, generator in enumerate(loop.generators):
+            if generator is not None and step >= loop.dec_output.prefill_steps[row]:
+                noise_BxC[row] = torch.rand((channels,), generator=generator, device=self.device)
+        return noise_BxC
+
+    @staticmethod
+    def _sample_chunks(chunks: Iterator[AudioChunk], num_samples: int) -> Iterator[AudioChunk]:
+        """Maps the decode row of each chunk to its text (`row`) and take (`sample`)."""
+        for chunk in chunks:
+            chunk.row, chunk.sample = divmod(chunk.row, num_samples)
+            yield chunk
+
+    def _maybe_compile(self, use_torch_compile: bool):
         if use_torch_compile and not hasattr(self, "_compiled"):
             # Compilation can take about a minute.
+            self._run_encoder = torch.compile(self._run_encoder, dynamic=True, fullgraph=True)
             self._prepare_generation = torch.compile(self._prepare_generation, dynamic=True, fullgraph=True)
             self._decoder_step = torch.compile(self._decoder_step, fullgraph=True, mode="max-autotune")
             self._compiled = True
 
+    def _start_generation(
+        self,
+        text: str | list[str],
+        audio_prompt: list[str | torch.Tensor | None] | str | torch.Tensor | None,
+        max_tokens: int | None,
+        runaway: RunawayConfig | bool | None = None,
+        num_samples: int = 1,
+        seeds: list[int | None] | None = None,
+    ) -> "_GenerationLoop":
+        """Tokenizes and encodes the text, prefills the decoder and returns the loop state.
+
+        With `num_samples > 1`, the prefilled decoder state is repeated so that text i
+        occupies rows `i * num_samples` to `(i + 1) * num_samples - 1`.
+        """
+        batch_size = len(text) if isinstance(text, list) else 1
+        max_tokens = self.config.data.audio_length if max_tokens is None else max_tokens
+
         if isinstance(audio_prompt, list):
             audio_prompt = [self.load_audio(p) if isinstance(p, str) else p for p in audio_prompt]
         elif isinstance(audio_prompt, str):
@@ -654,133 +1468,356 @@ class Dia:
 
         assert len(audio_prompt) == batch_size, "Number of audio prompts must match batch size"
 
-        if isinstance(text, list):
-            text = [self._encode_text(t) for t in text]
-        else:
-            text = [self._encode_text(text)]
-        text = self._pad_text_input(text)
-
-        dec_state, dec_output = self._prepare_generation(text, audio_prompt)
+        start = time.perf_counter()
+        text_batch = self._tokenize(text if isinstance(text, list) else [text])
+        self._record_stage("tokenize", time.perf_counter() - start)
+        for i in text_batch.truncated:
+            print(
+                f"Warning: text {i} is {text_batch.original_lengths[i]} bytes; "
+                f"truncated to {self.config.data.text_length}."
+            )
+        metrics.BATCH_ROWS.observe(batch_size)
+        self._cross_attn_marks = None
+        start = self._timer_mark()
+        enc_state, encoder_out, cross_attn_cache = self._encode_text_batch(text_batch)
+        encoder_seconds = self._timer_elapsed(start, self._timer_mark())
+        metrics.ENCODER_SECONDS.observe(encoder_seconds)
+        if self._cross_attn_marks is not None:
+            cross_attn_seconds = self._timer_elapsed(*self._cross_attn_marks)
+            self._record_stage("cross_attn", cross_attn_seconds)
+            encoder_seconds -= cross_attn_seconds
+            self._cross_attn_marks = None
+        self._record_stage("encoder", encoder_seconds)
+
+        texts = text if isinstance(text, list) else [text]
+        start = self._timer_mark()
+        max_len = self._buffer_length(texts, audio_prompt, max_tokens)
+        dec_state, dec_output = self._prepare_generation(
+            enc_state, encoder_out, cross_attn_cache, audio_prompt, max_len
+        )
+        if num_samples > 1:
+            dec_state.repeat_rows(num_samples)
+            dec_output.repeat_rows(num_samples)
+        self._record_stage("prefill", self._timer_elapsed(start, self._timer_mark()), metrics.PREFILL_SECONDS)
+        rows = [i for i in range(batch_size) for _ in range(num_samples)]
+        batch_size *= num_samples
         dec_step = min(dec_output.prefill_steps) - 1
-        current_idx = torch.tensor([dec_step], device=self.device)
-
-        eos_detected_Bx = torch.zeros((batch_size,), dtype=torch.bool, device=self.device)
-        eos_countdown_Bx = torch.full((batch_size,), -1, dtype=torch.long, device=self.device)
-        finished_step_Bx = torch.full((batch_size,), -1, dtype=torch.long, device=self.device)
-
-        bos_over = False
-
-        if verbose:
-            print("generate: starting generation loop")
-            if use_torch_compile:
-                print("generate: using use_torch_compile=True, the first step may be slow")
-            start_time = time.time()
 
-        # --- Generation Loop ---
-        while dec_step < max_tokens:
-            if (eos_countdown_Bx == 0).all():
-                break
-
-            current_step_idx = dec_step + 1
-            torch.compiler.cudagraph_mark_step_begin()
-            dec_state.prepare_step(dec_step)
-            tokens_Bx1xC = dec_output.get_tokens_at(dec_step).repeat_interleave(2, dim=0)  # Repeat for CFG
-
-            pred_BxC = self._decoder_step(
-                tokens_Bx1xC,
-                dec_state,
-                cfg_scale,
-                temperature,
-                top_p,
-                cfg_filter_top_k,
-                current_idx,
-            )
+        runaway = self.runaway_config if runaway is None else RunawayConfig() if runaway is True else runaway
+        detector = None
+        if runaway:
+            predictor = self.length_predictor or LengthPredictor()
+            predicted = [predictor.predict(texts[i]) for i in rows]
+            detector = RunawayDetector(runaway, dec_output.prefill_steps, predicted, self.device)
+        generators = None
+        if seeds is not None:
+            generators = [
+                None if seed is None else torch.Generator(self.device).manual_seed(take_seed)
+                for seed in seeds
+                for take_seed in self._take_seeds(seed, num_samples)
+            ]
+
+        return _GenerationLoop(
+            dec_state=dec_state,
+            dec_output=dec_output,
+            batch_size=batch_size,
+            max_tokens=max_tokens,
+            dec_step=dec_step,
+            current_idx=torch.tensor([dec_step], device=self.device),
+            eos_detected_Bx=torch.zeros((batch_size,), dtype=torch.bool, device=self.device),
+            eos_countdown_Bx=torch.full((batch_size,), -1, dtype=torch.long, device=self.device),
+            finished_step_Bx=torch.full((batch_size,), -1, dtype=torch.long, device=self.device),
+            eos_by_token_Bx=torch.zeros((batch_size,), dtype=torch.bool, device=self.device),
+            stopped_Bx=torch.zeros((batch_size,), dtype=torch.bool, device=self.device),
+            runaway_reason_Bx=torch.zeros((batch_size,), dtype=torch.long, device=self.device),
+            rows=rows,
+            runaway=detector,
+            generators=generators,
+        )
 
-            current_idx += 1
-
-            active_mask_Bx = eos_countdown_Bx != 0
-            eos_trigger_Bx = torch.zeros_like(active_mask_Bx)
-            if active_mask_Bx.any():
-                is_eos_token = (~eos_detected_Bx[active_mask_Bx]) & (pred_BxC[active_mask_Bx, 0] == audio_eos_value)
-                is_max_len = current_step_idx >= max_tokens - max_delay_pattern
-                eos_trigger_Bx[active_mask_Bx] = is_eos_token | is_max_len
-            eos_detected_Bx |= eos_trigger_Bx
-            start_countdown_mask_Bx = eos_trigger_Bx & (eos_countdown_Bx < 0)
-            if start_countdown_mask_Bx.any():
-                eos_countdown_Bx[start_countdown_mask_Bx] = max_delay_pattern
-                finished_step_Bx[start_countdown_mask_Bx] = current_step_idx
-
-            padding_mask_Bx = eos_countdown_Bx > 0
-            if padding_mask_Bx.any():
-                pred_active_BxC = pred_BxC[padding_mask_Bx].clone()
-                countdown_active_Bx = eos_countdown_Bx[padding_mask_Bx]
-                step_after_eos_Bx = max_delay_pattern - countdown_active_Bx
-                step_after_eos_Bx_ = step_after_eos_Bx.unsqueeze(1)
-                delay_pattern_Cx_ = delay_pattern_Cx.unsqueeze(0)
-                eos_mask_NxC = step_after_eos_Bx_ == delay_pattern_Cx_
-                pad_mask_NxC = step_after_eos_Bx_ > delay_pattern_Cx_
-                pred_active_BxC[eos_mask_NxC] = audio_eos_value
-                pred_active_BxC[pad_mask_NxC] = audio_pad_value
-                pred_BxC[padding_mask_Bx] = pred_active_BxC
-                eos_countdown_Bx[padding_mask_Bx] -= 1
-
-            # --- Update BOS flag (Original) ---
-            if not bos_over:
-                bos_over = all(
-                    dec_step - prefill_step > max_delay_pattern for prefill_step in dec_output.prefill_steps
-                )
+    def _generation_step(
+        self,
+        loop: "_GenerationLoop",
+        cfg_scale: float,
+        temperature: float,
+        top_p: float,
+        cfg_filter_top_k: int,
+        on_step: StepCallback | None = None,
+    ) -> torch.Tensor:
+        """Runs one decode step: samples the next tokens and handles the EOS countdown.
 
-            dec_output.update_one(pred_BxC, current_step_idx, not bos_over)
+        If `on_step` returns a stop signal, the stopped rows end at this step. Rows flagged
+        by the runaway detector start the EOS countdown like a sampled EOS.
 
-            dec_step += 1
+        Returns:
+            The tokens written at this step, shape [B, C].
+        """
+        audio_eos_value = self.config.data.audio_eos_value
+        audio_pad_value = self.config.data.audio_pad_value
+        delay_pattern = self.config.data.delay_pattern
+        max_delay_pattern = max(delay_pattern)
+        max_tokens = loop.max_tokens
+        dec_step = loop.dec_step
+        dec_output = loop.dec_output
+        eos_detected_Bx = loop.eos_detected_Bx
+        eos_countdown_Bx = loop.eos_countdown_Bx
+        finished_step_Bx = loop.finished_step_Bx
+
+        step_start = time.perf_counter()
+        current_step_idx = dec_step + 1
+        if current_step_idx >= loop.dec_state.max_len:
+            self._grow_buffers(loop)
+        torch.compiler.cudagraph_mark_step_begin()
+        loop.dec_state.prepare_step(dec_step)
+        tokens_Bx1xC = dec_output.get_tokens_at(dec_step).repeat_interleave(2, dim=0)  # Repeat for CFG
+
+        pred_BxC = self._decoder_step(
+            tokens_Bx1xC,
+            loop.dec_state,
+            cfg_scale,
+            temperature,
+            top_p,
+            cfg_filter_top_k,
+            loop.current_idx,
+            self._row_noise(loop, current_step_idx),
+        )
 
-            if verbose and dec_step % 86 == 0:
-                duration = time.time() - start_time
-                if duration > 0:
-                    print(
-                        f"generate step {dec_step}: speed={86 * batch_size / duration:.3f} tokens/s, realtime factor={batch_size / duration:.3f}x"
-                    )
-                start_time = time.time()
+        loop.current_idx += 1
+
+        active_mask_Bx = eos_countdown_Bx != 0
+        eos_trigger_Bx = torch.zeros_like(active_mask_Bx)
+        if loop.runaway is not None:
+            reason_Bx, end_Bx = loop.runaway.update(pred_BxC[:, 0], current_step_idx)
+            runaway_Bx = (reason_Bx > 0) & ~eos_detected_Bx
+            eos_trigger_Bx |= runaway_Bx
+        if active_mask_Bx.any():
+            is_eos_token = (~eos_detected_Bx[active_mask_Bx]) & (pred_BxC[active_mask_Bx, 0] == audio_eos_value)
+            is_max_len = current_step_idx >= max_tokens - max_delay_pattern
+            eos_trigger_Bx[active_mask_Bx] |= is_eos_token | is_max_len
+        eos_detected_Bx |= eos_trigger_Bx
+        start_countdown_mask_Bx = eos_trigger_Bx & (eos_countdown_Bx < 0)
+        if start_countdown_mask_Bx.any():
+            eos_countdown_Bx[start_countdown_mask_Bx] = max_delay_pattern
+            finished_step_Bx[start_countdown_mask_Bx] = current_step_idx
+            is_eos_Bx = pred_BxC[:, 0] == audio_eos_value
+            loop.eos_by_token_Bx |= start_countdown_mask_Bx & is_eos_Bx
+            if loop.runaway is not None:
+                # A sampled EOS at the same step wins; otherwise record the detector and trim its run.
+                flagged_Bx = start_countdown_mask_Bx & runaway_Bx & ~is_eos_Bx
+                loop.runaway_reason_Bx = torch.where(flagged_Bx, reason_Bx, loop.runaway_reason_Bx)
+                if loop.runaway.config.trim:
+                    end_Bx = end_Bx.clamp(max=current_step_idx)
+                    finished_step_Bx.copy_(torch.where(flagged_Bx, end_Bx, finished_step_Bx))
+
+        padding_mask_Bx = eos_countdown_Bx > 0
+        if padding_mask_Bx.any():
+            delay_pattern_Cx = torch.tensor(delay_pattern, device=self.device, dtype=torch.long)
+            pred_active_BxC = pred_BxC[padding_mask_Bx].clone()
+            countdown_active_Bx = eos_countdown_Bx[padding_mask_Bx]
+            step_after_eos_Bx = max_delay_pattern - countdown_active_Bx
+            step_after_eos_Bx_ = step_after_eos_Bx.unsqueeze(1)
+            delay_pattern_Cx_ = delay_pattern_Cx.unsqueeze(0)
+            eos_mask_NxC = step_after_eos_Bx_ == delay_pattern_Cx_
+            pad_mask_NxC = step_after_eos_Bx_ > delay_pattern_Cx_
+            pred_active_BxC[eos_mask_NxC] = audio_eos_value
+            pred_active_BxC[pad_mask_NxC] = audio_pad_value
+            pred_BxC[padding_mask_Bx] = pred_active_BxC
+            eos_countdown_Bx[padding_mask_Bx] -= 1
+
+        # --- Update BOS flag (Original) ---
+        if not loop.bos_over:
+            loop.bos_over = all(
+                dec_step - prefill_step > max_delay_pattern for prefill_step in dec_output.prefill_steps
+            )
 
-        # --- Finalize and Extract Output ---
-        final_step = dec_step + 1
+        dec_output.update_one(pred_BxC, current_step_idx, not loop.bos_over)
+
+        if on_step is not None:
+            info = StepInfo(loop.steps, pred_BxC, eos_detected_Bx, loop.rows)
+            stop_Bx = stop_mask(on_step(info), loop.batch_size, self.device)
+            if stop_Bx is not None:
+                self._stop_rows(loop, stop_Bx, current_step_idx)
+
+        loop.dec_step += 1
+        loop.steps += 1
+        # The EOS checks above synchronize with the device, so wall time covers the whole step.
+        self._record_stage("decode_step", time.perf_counter() - step_start, metrics.DECODE_STEP_SECONDS)
+        if self._sampling_marks is not None:
+            self._record_stage("sampling", self._timer_elapsed(*self._sampling_marks), metrics.SAMPLING_SECONDS)
+            self._sampling_marks = None
+        return pred_BxC
 
+    def _stop_rows(self, loop: "_GenerationLoop", stop_Bx: torch.Tensor, current_step_idx: int) -> None:
+        """Ends rows immediately, keeping the frames that all channels have reached."""
+        stop_Bx = stop_Bx & (loop.eos_countdown_Bx != 0)
+        if not stop_Bx.any():
+            return
+        # Frames before this step have had their most delayed channel written.
+        end_step = current_step_idx + 1 - max(self.config.data.delay_pattern)
+        finished_Bx = loop.finished_step_Bx[stop_Bx]
+        loop.finished_step_Bx[stop_Bx] = torch.where(finished_Bx < 0, end_step, finished_Bx.clamp(max=end_step))
+        loop.stopped_Bx |= stop_Bx & ~loop.eos_detected_Bx
+        loop.eos_detected_Bx |= stop_Bx
+        loop.eos_countdown_Bx[stop_Bx] = 0
+
+    def _timer_mark(self) -> "torch.cuda.Event | float":
+        """A timestamp for stage metrics: a recorded CUDA event on GPU (no sync), else `perf_counter`."""
+        if self.device.type == "cuda":
+            event = torch.cuda.Event(enable_timing=True)
+            event.record()
+            return event
+        return time.perf_counter()
+
+    @staticmethod
+    def _timer_elapsed(start: "torch.cuda.Event | float", end: "torch.cuda.Event | float") -> float:
+        """Seconds between two `_timer_mark`s, waiting for the end event if needed."""
+        if isinstance(start, float):
+            return end - start
+        end.synchronize()
+        return start.elapsed_time(end) / 1000
+
+    def _record_stage(self, stage: str, seconds: float, metric: "metrics.Histogram | None" = None) -> None:
+        """Reports a stage timing to `metric`, the running generation's timings and the timing hooks."""
+        if metric is not None:
+            metric.observe(seconds)
+        if self._timings is not None:
+            self._timings.add(stage, seconds)
+        for hook in self._timing_hooks:
+            hook(stage, seconds)
+
+    def _begin_timings(self, collect: bool = False) -> None:
+        """Starts collecting `StageTimings` if requested or if `profile_stages` is active."""
+        self._timings = StageTimings() if collect or self._profiles else None
+
+    def _end_timings(self) -> StageTimings | None:
+        """Stops collecting and hands the timings to every active `profile_stages` block."""
+        timings, self._timings = self._timings, None
+        if timings is not None:
+            for collected in self._profiles:
+                collected.append(timings)
+        return timings
+
+    def _record_generation(self, lengths_Bx: torch.Tensor, started_at: float) -> None:
+        """Records frames, audio seconds and the real-time factor of a finished batch."""
+        frames = int(lengths_Bx.sum().item())
+        duration = time.perf_counter() - started_at
+        audio_seconds = frames * SAMPLE_RATE_RATIO / DEFAULT_SAMPLE_RATE
+        metrics.GENERATED_FRAMES.inc(frames)
+        metrics.GENERATED_AUDIO_SECONDS.inc(audio_seconds)
+        self._record_stage("generation", duration, metrics.GENERATION_SECONDS)
+        if duration > 0:
+            metrics.REAL_TIME_FACTOR.observe(audio_seconds / duration)
+
+    def _finish_lengths(self, loop: "_GenerationLoop") -> torch.Tensor:
+        """Computes the number of generated frames per row once the loop has ended."""
+        max_delay_pattern = max(self.config.data.delay_pattern)
+        final_step = loop.dec_step + 1
+
+        finished_step_Bx = loop.finished_step_Bx
         finished_step_Bx[finished_step_Bx == -1] = final_step - max_delay_pattern
 
-        prefill_steps_tensor = torch.tensor(dec_output.prefill_steps, device=self.device)
+        if loop.runaway is not None:
+            for reason in loop.runaway_reason_Bx.tolist():
+                if reason:
+                    metrics.RUNAWAY_ROWS.labels(REASONS[reason]).inc()
+
+        prefill_steps_tensor = torch.tensor(loop.dec_output.prefill_steps, device=self.device)
         lengths_Bx = finished_step_Bx - prefill_steps_tensor
-        lengths_Bx = torch.clamp(lengths_Bx, min=0)
+        return torch.clamp(lengths_Bx, min=0)
 
-        max_len = lengths_Bx.max().item() + max_delay_pattern
-        outputs = []
-
-        if max_len > 0:
-            num_channels = self.config.data.channels
-            audio_pad_value = self.config.data.audio_pad_value
-            generated_codes = torch.full(
-                (batch_size, max_len, num_channels),
-                fill_value=audio_pad_value,
-                dtype=torch.long,
-                device=self.device,
-            )
+    def _collect_codes(self, loop: "_GenerationLoop", lengths_Bx: torch.Tensor) -> torch.Tensor | None:
+        """Copies each row's generated (still delayed) codes into a [B, T, C] tensor.
 
-            for i in range(batch_size):
-                start_step = dec_output.prefill_steps[i]
-                actual_len = lengths_Bx[i].item() + max_delay_pattern
-                if actual_len > 0:
-                    tokens_to_copy = dec_output.generated_tokens[i, start_step : start_step + actual_len, :]
-                    generated_codes[i, :actual_len, :] = tokens_to_copy
+        Returns:
+            The codes, or None if nothing was generated for any row.
+        """
+        max_delay_pattern = max(self.config.data.delay_pattern)
+        max_len = lengths_Bx.max().item() + max_delay_pattern
+        if max_len <= 0:
+            return None
 
-            if verbose:
-                avg_steps = lengths_Bx.float().mean().item()
-                total_duration = time.time() - total_start_time
-                print(f"generate: avg steps={avg_steps:.1f}, total duration={total_duration:.3f}s")
+        num_channels = self.config.data.channels
+        audio_pad_value = self.config.data.audio_pad_value
+        generated_codes = torch.full(
+            (loop.batch_size, max_len, num_channels),
+            fill_value=audio_pad_value,
+            dtype=torch.long,
+            device=self.device,
+        )
 
-            del dec_state
+        for i in range(loop.batch_size):
+            start_step = loop.dec_output.prefill_steps[i]
+            actual_len = lengths_Bx[i].item() + max_delay_pattern
+            if actual_len > 0:
+                tokens_to_copy = loop.dec_output.generated_tokens[i, start_step : start_step + actual_len, :]
+                generated_codes[i, :actual_len, :] = tokens_to_copy
+        return generated_codes
 
-            outputs = self._generate_output(generated_codes, lengths_Bx)
-        else:
-            print("Warning: Nothing generated for any sequence in the batch.")
-            outputs = [None] * batch_size
+    def _ready_chunks(
+        self,
+        loop: "_GenerationLoop",
+        emitted: list[int],
+        finished: list[bool],
+        chunk_frames: int,
+        final_lengths: list[int] | None = None,
+    ) -> Iterator[AudioChunk]:
+        """Yields decoded chunks for rows with enough new complete frames.
 
-        return outputs if batch_size > 1 else outputs[0]
+        Args:
+            loop: The generation loop state.
+            emitted: Frames already yielded per row. Updated in place.
+            finished: Whether the final chunk was yielded per row. Updated in place.
+            chunk_frames: Minimum number of new frames per chunk.
+            final_lengths: Row lengths after the loop ended; flushes every row.
+        """
+        max_delay_pattern = max(self.config.data.delay_pattern)
+        prefill_steps = loop.dec_output.prefill_steps
+        countdown = loop.eos_countdown_Bx.tolist()
+        finished_step = loop.finished_step_Bx.tolist()
+
+        for i in range(loop.batch_size):
+            if finished[i]:
+                continue
+            if final_lengths is not None:
+                total, is_final = final_lengths[i], True
+            elif countdown[i] == 0:
+                total, is_final = max(finished_step[i] - prefill_steps[i], 0), True
+            else:
+                # Frame t is complete once its most delayed channel has been written.
+                total = loop.dec_step - prefill_steps[i] - max_delay_pattern + 1
+                if finished_step[i] >= 0:
+                    total = min(total, finished_step[i] - prefill_steps[i])
+                is_final = False
+
+            end = total if is_final else total - STREAM_LOOKAHEAD_FRAMES
+            if not is_final and end - emitted[i] < chunk_frames:
+                continue
+
+            start = emitted[i]
+            audio = self._decode_frames(loop, i, start, end, total) if end > start else np.zeros(0, np.float32)
+            yield AudioChunk(
+                row=i,
+                audio=audio,
+                start_sample=start * SAMPLE_RATE_RATIO,
+                sample_rate=DEFAULT_SAMPLE_RATE,
+                is_final=is_final,
+                codes=self._gather_frames(loop, i, 0, total).cpu().numpy() if is_final else None,
+            )
+            emitted[i] = max(end, start)
+            finished[i] = is_final
+
+    def _gather_frames(self, loop: "_GenerationLoop", row: int, start: int, end: int) -> torch.Tensor:
+        """Reads frames [start, end) of one row from the delayed loop state as valid codes, shape [T, C]."""
+        delay_Cx = torch.tensor(self.config.data.delay_pattern, device=self.device, dtype=torch.long)
+        frames_Tx1 = torch.arange(start, end, device=self.device)[:, None]
+        t_idx_TxC = loop.dec_output.prefill_steps[row] + frames_Tx1 + delay_Cx
+        c_idx_TxC = torch.arange(self.config.data.channels, device=self.device)[None, :]
+        codes_TxC = loop.dec_output.generated_tokens[row][t_idx_TxC, c_idx_TxC]
+        return torch.where((codes_TxC >= 0) & (codes_TxC <= 1023), codes_TxC, 0)
+
+    def _decode_frames(self, loop: "_GenerationLoop", row: int, start: int, end: int, available: int) -> np.ndarray:
+        """DAC-decodes frames [start, end) of one row, reading undelayed codes from the loop state."""
+        left = max(0, start - STREAM_CONTEXT_FRAMES)
+        right = min(available, end + STREAM_LOOKAHEAD_FRAMES)
+        audio = self._decode(self._gather_frames(loop, row, left, right)).cpu().numpy()
+        return audio[(start - left) * SAMPLE_RATE_RATIO : (end - left) * SAMPLE_RATE_RATIO]
@@ -0,0 +1,313 @@
+"""Sharded multi-process offline synthesis for many-core CPU hosts.
+
+One process with one intra-op thread pool leaves most cores idle while Python runs the
+sampling loop, EOS bookkeeping and DAC glue. `run_pipeline` instead starts N worker
+processes, each with its own `Dia` instance and a fixed number of torch threads
+(optionally pinned to disjoint cores). Workers pull length-sorted batches from a shared
+queue, so long and short batches balance out, and write their audio files themselves.
+
+Weights are loaded from a `dia convert` bundle with `mmap_weights=True`: every worker
+maps the same safetensors file read-only, so the weights occupy the page cache once
+instead of once per worker (they show up as file-backed, shared RSS). The DAC codec
+and activations are still per worker.
+
+A single collector in the parent process receives every row result and failure,
+appends them to the progress file (see `dia.batch`) and notices workers that die, so
+their in-flight rows are reported as failed instead of silently lost.
+
+Usage:
+    dia convert --output ./dia-f32 --dtype float32
+    dia pipeline script.jsonl --bundle ./dia-f32 --workers 8 --threads-per-worker 4 --output-dir ./out
+"""
+
+import argparse
+import multiprocessing as mp
+import os
+import queue
+import time
+from dataclasses import dataclass, field
+
+import torch
+
+from .batch import (
+    ManifestEntry,
+    ProgressLog,
+    add_generation_arguments,
+    generate_batch,
+    generation_defaults,
+    plan_batches,
+    read_manifest,
+    write_audio,
+)
+from .config import DiaConfig
+from .convert import CONFIG_FILENAME, find_bundle_dir
+from .convert import read_manifest as read_bundle_manifest
+from .model import DEFAULT_SAMPLE_RATE, Dia
+
+
+@dataclass
+class WorkerConfig:
+    """Settings passed to every worker process."""
+
+    bundle: str
+    threads: int
+    cores: list[int] | None = None
+    use_torch_compile: bool = False
+
+
+@dataclass
+class PipelineStats:
+    """What the collector saw during one pipeline run."""
+
+    workers: int
+    threads_per_worker: int
+    rows: int = 0
+    failed: int = 0
+    audio_seconds: float = 0.0
+    wall_seconds: float = 0.0
+    load_seconds: float = 0.0
+    worker_rss: dict[int, dict[str, int]] = field(default_factory=dict)
+    errors: list[str] = field(default_factory=list)
+
+    def summary(self) -> str:
+        wall = self.wall_seconds or 1e-9
+        return (
+            f"{self.workers} workers x {self.threads_per_worker} threads: {self.rows} rows ({self.failed} failed), "
+            f"{self.audio_seconds:.1f}s of audio in {self.wall_seconds:.1f}s: {self.rows / wall:.2f} rows/s, "
+            f"realtime factor={self.audio_seconds / wall:.2f}x"
+        )
+
+
+def memory_usage() -> dict[str, int]:
+    """Resident memory of this process in bytes, split into anonymous and file-backed pages (Linux only)."""
+    usage = {}
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                if key in ("VmRSS", "RssAnon", "RssFile", "RssShmem"):
+                    usage[key] = int(value.split()[0]) * 1024
+    except OSError:
+        pass
+    return usage
+
+
+def _worker_main(worker_id: int, config: WorkerConfig, tasks, results) -> None:
+    """Worker process: loads the model, then generates and writes batches until it gets None."""
+    if config.cores:
+        os.sched_setaffinity(0, config.cores)
+    torch.set_num_threads(config.threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        pass  # already set by an earlier parallel region
+
+    try:
+        model = Dia.from_local(None, config.bundle, device=torch.device("cpu"), mmap_weights=True)
+    except Exception as e:
+        results.put(("failed", worker_id, f"model load failed: {e}"))
+        return
+    results.put(("ready", worker_id, memory_usage()))
+
+    while (task := tasks.get()) is not None:
+        index, batch = task
+        results.put(("start", worker_id, index))
+        try:
+            outputs = generate_batch(model, batch, config.use_torch_compile)
+        except Exception as e:
+            for entry in batch:
+                results.put(("row", worker_id, index, entry.id, "error", {"error": str(e)}))
+            results.put(("done", worker_id, index))
+            continue
+        for entry, audio in zip(batch, outputs):
+            if audio is None:
+                results.put(("row", worker_id, index, entry.id, "error", {"error": "no audio generated"}))
+                continue
+            try:
+                write_audio(entry.output, audio)
+            except Exception as e:
+                results.put(("row", worker_id, index, entry.id, "error", {"error": f"write failed: {e}"}))
+                continue
+            seconds = round(len(audio) / DEFAULT_SAMPLE_RATE, 3)
+            results.put(("row", worker_id, index, entry.id, "ok", {"output": entry.output, "seconds": seconds}))
+        results.put(("done", worker_id, index))
+    results.put(("exit", worker_id, memory_usage()))
+
+
+def assign_cores(num_workers: int, threads_per_worker: int) -> list[list[int] | None]:
+    """Splits the cores this process may use into disjoint sets, one per worker (None if there are too few)."""
+    available = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else []
+    if len(available) < num_workers * threads_per_worker:
+        print(
+            f"Warning: {len(available)} cores available for {num_workers} x {threads_per_worker} threads; "
+            "not pinning workers."
+        )
+        return [None] * num_workers
+    return [available[i * threads_per_worker : (i + 1) * threads_per_worker] for i in range(num_workers)]
+
+
+def run_pipeline(
+    entries: list[ManifestEntry],
+    bundle: str,
+    progress: ProgressLog,
+    num_workers: int,
+    threads_per_worker: int | None = None,
+    batch_size: int = 8,
+    pin_cores: bool = False,
+    use_torch_compile: bool = False,
+    verbose: bool = True,
+) -> PipelineStats:
+    """Generates `entries` with `num_workers` processes and collects their results.
+
+    Args:
+        entries: Rows to generate.
+        bundle: Path to a bundle written by `dia convert`.
+        progress: Log that receives one record per row.
+        num_workers: Number of worker processes.
+        threads_per_worker: Torch intra-op threads per worker (default: cores / workers).
+        batch_size: Rows per batched generation.
+        pin_cores: Pin each worker to its own set of cores (Linux only).
+        use_torch_compile: Compile the decoder step in each worker.
+        verbose: Print progress while collecting.
+
+    Returns:
+        The collected statistics.
+
+    Raises:
+        ValueError: If `bundle` is not a bundle written by `dia convert`.
+    """
+    bundle_dir = find_bundle_dir(bundle)
+    if bundle_dir is None:
+        raise ValueError(f"{bundle} is not an inference bundle; create one with `dia convert`")
+    config = DiaConfig.load(os.path.join(bundle_dir, read_bundle_manifest(bundle_dir).get("config", CONFIG_FILENAME)))
+    threads_per_worker = threads_per_worker or max(1, (os.cpu_count() or 1) // num_workers)
+    stats = PipelineStats(num_workers, threads_per_worker)
+    batches = plan_batches(entries, batch_size, config.data.audio_length)
+    unreported: dict[int, set[str]] = {i: {e.id for e in batch} for i, batch in enumerate(batches)}
+
+    ctx = mp.get_context("spawn")
+    tasks, results = ctx.Queue(), ctx.Queue()
+    for index, batch in enumerate(batches):
+        tasks.put((index, batch))
+    for _ in range(num_workers):
+        tasks.put(None)
+
+    cores = assign_cores(num_workers, threads_per_worker) if pin_cores else [None] * num_workers
+    started_at = time.perf_counter()
+    workers = [
+        ctx.Process(
+            target=_worker_main,
+            args=(i, WorkerConfig(bundle_dir, threads_per_worker, cores[i], use_torch_compile), tasks, results),
+            name=f"dia-worker-{i}",
+            daemon=True,
+        )
+        for i in range(num_workers)
+    ]
+    for worker in workers:
+        worker.start()
+
+    in_flight: dict[int, int] = {}
+    finished: set[int] = set()
+    ready = 0
+
+    def fail_rows(index: int, reason: str) -> None:
+        for entry_id in unreported.pop(index, set()):
+            progress.record(entry_id, "error", error=reason)
+            stats.failed += 1
+
+    while len(finished) < num_workers:
+        try:
+            message = results.get(timeout=1.0)
+        except queue.Empty:
+            for i, worker in enumerate(workers):
+                if i not in finished and not worker.is_alive():
+                    finished.add(i)
+                    reason = f"worker {i} exited with code {worker.exitcode}"
+                    stats.errors.append(reason)
+                    if i in in_flight:
+                        fail_rows(in_flight.pop(i), reason)
+            continue
+
+        kind, worker_id = message[0], message[1]
+        if kind == "ready":
+            ready += 1
+            stats.worker_rss[worker_id] = message[2]
+            if ready == 1:
+                stats.load_seconds = time.perf_counter() - started_at
+        elif kind == "start":
+            in_flight[worker_id] = message[2]
+        elif kind == "row":
+            _, _, index, entry_id, status, fields = message
+            progress.record(entry_id, status, **fields)
+            unreported.get(index, set()).discard(entry_id)
+            if status == "ok":
+                stats.rows += 1
+                stats.audio_seconds += fields["seconds"]
+            else:
+                stats.failed += 1
+        elif kind == "done":
+            in_flight.pop(worker_id, None)
+            unreported.pop(message[2], None)
+            if verbose:
+                stats.wall_seconds = time.perf_counter() - started_at
+                print(f"{len(batches) - len(unreported)}/{len(batches)} batches: {stats.summary()}")
+        elif kind == "exit":
+            finished.add(worker_id)
+            stats.worker_rss[worker_id] = message[2]
+        elif kind == "failed":
+            finished.add(worker_id)
+            stats.errors.append(f"worker {worker_id}: {message[2]}")
+
+    # Batches nobody picked up (every worker failed or died) are reported as failed.
+    for index in list(unreported):
+        fail_rows(index, "no worker left to generate it")
+    for worker in workers:
+        worker.join(timeout=10)
+    stats.wall_seconds = time.perf_counter() - started_at
+    return stats
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="dia pipeline", description="Generate a manifest with several CPU worker processes."
+    )
+    parser.add_argument("manifest", type=str, help="JSONL or CSV manifest (see `dia batch`).")
+    parser.add_argument("--bundle", type=str, required=True, help="Inference bundle written by `dia convert`.")
+    parser.add_argument("--output-dir", type=str, default=".", help="Directory for outputs (default: .).")
+    parser.add_argument("--format", type=str, default="wav", help="Extension for rows without an output path.")
+    parser.add_argument("--progress", type=str, default=None, help="Progress file (default: <manifest>.progress).")
+    parser.add_argument("--workers", type=int, default=4, help="Number of worker processes.")
+    parser.add_argument(
+        "--threads-per-worker", type=int, default=None, help="Torch threads per worker (default: cores / workers)."
+    )
+    parser.add_argument("--batch-size", type=int, default=8, help="Rows per batched generation.")
+    parser.add_argument("--pin-cores", action="store_true", help="Pin each worker to its own cores (Linux).")
+    parser.add_argument("--compile", action="store_true", help="Use torch.compile in each worker.")
+    add_generation_arguments(parser)
+    args = parser.parse_args(argv)
+
+    entries = read_manifest(args.manifest, args.output_dir, generation_defaults(args), args.format)
+    progress = ProgressLog(args.progress or args.manifest + ".progress")
+    pending = [e for e in entries if not progress.is_done(e)]
+    print(f"{len(entries)} rows, {len(entries) - len(pending)} already done, {len(pending)} to generate")
+    if not pending:
+        return 0
+
+    stats = run_pipeline(
+        pending,
+        args.bundle,
+        progress,
+        args.workers,
+        args.threads_per_worker,
+        args.batch_size,
+        args.pin_cores,
+        args.compile,
+    )
+    for error in stats.errors:
+        print(f"Warning: {error}")
+    print(f"done: {stats.summary()}")
+    return 1 if stats.failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,132 @@
+"""torch.profiler capture of a window of decode steps.
+
+`Dia.generate(..., profile=ProfileConfig(start_step=50, end_step=80))` runs the given
+decode steps under `torch.profiler` and writes a Chrome trace (open it in
+chrome://tracing or https://ui.perfetto.dev) plus a table of the most expensive ops.
+While the profiler runs, the model adds `record_function` labels to every encoder
+layer, every decoder layer and its `self_attn` / `cross_attn` / `mlp` sub-blocks,
+token sampling and DAC decode, so ops in the table and the trace can be traced back to
+the code that issued them. Outside a profiling window the labels are no-ops, and under
+torch.compile they are left out of the compiled graph.
+
+Steps count from the first decode step. `start_step=0` also captures tokenization, the
+encoder and prefill; `end_step=None` continues through delay revert and DAC decode.
+
+Usage:
+    python cli.py "[S1] Hello." --output out.wav --profile 50:80 --profile-dir ./traces
+"""
+
+import contextlib
+import os
+import time
+from dataclasses import dataclass
+
+import torch
+
+
+_labels_enabled = False
+
+
+def record(name: str) -> contextlib.AbstractContextManager:
+    """A `torch.profiler.record_function` label while a profiling window is open, else a no-op."""
+    if torch.compiler.is_compiling() or not _labels_enabled:
+        return contextlib.nullcontext()
+    return torch.profiler.record_function(name)
+
+
+@dataclass
+class ProfileConfig:
+    """Which decode steps to profile and where to write the results.
+
+    Attributes:
+        start_step: First decode step to capture (0 also captures the encoder and prefill).
+        end_step: Step at which to stop (exclusive), or None to continue through DAC decode.
+        output_dir: Directory for the trace and the op table.
+        record_shapes: Record input shapes, to tell apart ops that differ only in shape.
+        with_stack: Record Python stacks (larger traces, slower).
+        row_limit: Rows of the op table.
+    """
+
+    start_step: int = 50
+    end_step: int | None = 80
+    output_dir: str = "."
+    record_shapes: bool = False
+    with_stack: bool = False
+    row_limit: int = 30
+
+    @classmethod
+    def parse(cls, window: str, **kwargs) -> "ProfileConfig":
+        """Parses a `START:END` step window such as "50:80", "0:" or ":40".
+
+        Raises:
+            ValueError: If the window is malformed or empty.
+        """
+        start, sep, end = window.partition(":")
+        if not sep:
+            raise ValueError(f"Expected a START:END step window, got {window!r}")
+        config = cls(int(start) if start else 0, int(end) if end else None, **kwargs)
+        if config.start_step < 0 or (config.end_step is not None and config.end_step <= config.start_step):
+            raise ValueError(f"Empty profiling window {window!r}")
+        return config
+
+
+class GenerationProfiler:
+    """Opens and closes the profiler around the configured window of one generation."""
+
+    def __init__(self, config: ProfileConfig, device: torch.device):
+        self.config = config
+        self.device = device
+        self._profiler: torch.profiler.profile | None = None
+        self._done = False
+
+    def at_step(self, step: int) -> None:
+        """Called before decode step `step` (and with 0 before the encoder)."""
+        if self._profiler is None and not self._done and step >= self.config.start_step:
+            self._start()
+        elif self._profiler is not None and self.config.end_step is not None and step >= self.config.end_step:
+            self._stop()
+
+    def step_done(self) -> None:
+        """Marks a step boundary in the trace."""
+        if self._profiler is not None:
+            self._profiler.step()
+
+    def finish(self) -> None:
+        """Closes the window if it is still open (e.g. generation ended early)."""
+        if self._profiler is not None:
+            self._stop()
+
+    def _start(self) -> None:
+        global _labels_enabled
+
+        activities = [torch.profiler.ProfilerActivity.CPU]
+        if self.device.type == "cuda":
+            activities.append(torch.profiler.ProfilerActivity.CUDA)
+        self._profiler = torch.profiler.profile(
+            activities=activities, record_shapes=self.config.record_shapes, with_stack=self.config.with_stack
+        )
+        self._profiler.start()
+        _labels_enabled = True
+
+    def _stop(self) -> None:
+        global _labels_enabled
+
+        _labels_enabled = False
+        if self.device.type == "cuda":
+            torch.cuda.synchronize(self.device)
+        profiler, self._profiler = self._profiler, None
+        profiler.stop()
+        self._done = True
+
+        os.makedirs(self.config.output_dir, exist_ok=True)
+        window = f"{self.config.start_step}-{'end' if self.config.end_step is None else self.config.end_step}"
+        prefix = os.path.join(self.config.output_dir, f"dia-steps{window}-{time.strftime('%Y%m%d-%H%M%S')}")
+        profiler.export_chrome_trace(prefix + ".trace.json")
+        sort_by = "self_cuda_time_total" if self.device.type == "cuda" else "self_cpu_time_total"
+        table = profiler.key_averages(group_by_input_shape=self.config.record_shapes).table(
+            sort_by=sort_by, row_limit=self.config.row_limit
+        )
+        with open(prefix + ".ops.txt", "w") as f:
+            f.write(table + "\n")
+        print(table)
+        print(f"profile: wrote {prefix}.trace.json and {prefix}.ops.txt")
@@ -0,0 +1,258 @@
+"""Weight-only quantization for the `DenseGeneral` projections of the Dia model.
+
+Weights are stored as signed integers in matmul layout (`[out, in]`) with symmetric
+scales, either one per output channel (`int8`) or one per group of input channels
+(`int4`, two values packed per byte). Activations stay in the compute dtype.
+
+On CPU, int8 layers use PyTorch's packed int8 matmul kernel when it is available, so
+only the int8 weights are streamed from memory at every decode step. Other devices
+and int4 layers expand the weights on the fly.
+"""
+
+import math
+
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+from torch import Tensor
+
+from .layers import DenseGeneral
+
+
+WEIGHT_QUANT_MODES = ("int8", "int4")
+DEFAULT_GROUP_SIZE = 128
+
+_use_int8pack_mm = hasattr(torch, "_weight_int8pack_mm")
+
+
+def quantize_per_channel_int8(weight_OxI: Tensor) -> tuple[Tensor, Tensor]:
+    """Symmetric per-output-channel int8 quantization of a 2D `[out, in]` weight.
+
+    Returns:
+        A tuple `(qweight_OxI, scale_O)` where `qweight_OxI` is int8 and
+        `weight ~= qweight * scale[:, None]`.
+    """
+    weight_OxI = weight_OxI.to(torch.float32)
+    absmax_O = weight_OxI.abs().amax(dim=1).clamp(min=1e-8)
+    scale_O = absmax_O / 127.0
+    qweight_OxI = torch.round(weight_OxI / scale_O[:, None]).clamp(-127, 127).to(torch.int8)
+    return qweight_OxI, scale_O
+
+
+def quantize_groupwise_int4(weight_OxI: Tensor, group_size: int) -> tuple[Tensor, Tensor]:
+    """Symmetric group-wise int4 quantization of a 2D `[out, in]` weight.
+
+    Values are offset to `[0, 15]` and packed two per byte along the input axis.
+
+    Returns:
+        A tuple `(packed_OxI2, scale_OxG)` where `packed_OxI2` is uint8 with shape
+        `[out, in // 2]` and `scale_OxG` holds one scale per group of `group_size` inputs.
+    """
+    out_dim, in_dim = weight_OxI.shape
+    weight_OxGxS = weight_OxI.to(torch.float32).reshape(out_dim, in_dim // group_size, group_size)
+    scale_OxG = weight_OxGxS.abs().amax(dim=-1).clamp(min=1e-8) / 7.0
+    q_OxGxS = torch.round(weight_OxGxS / scale_OxG[..., None]).clamp(-8, 7)
+    q_OxI = (q_OxGxS.reshape(out_dim, in_dim) + 8).to(torch.uint8)
+    packed_OxI2 = q_OxI[:, 0::2] | (q_OxI[:, 1::2] << 4)
+    return packed_OxI2, scale_OxG
+
+
+def dequantize_groupwise_int4(packed_OxI2: Tensor, scale_OxG: Tensor, dtype: torch.dtype) -> Tensor:
+    """Inverse of `quantize_groupwise_int4`, returning a `[out, in]` weight in `dtype`."""
+    out_dim = packed_OxI2.shape[0]
+    num_groups = scale_OxG.shape[1]
+    q_OxI = torch.stack([packed_OxI2 & 0x0F, packed_OxI2 >> 4], dim=-1).reshape(out_dim, -1)
+    q_OxGxS = q_OxI.to(dtype).sub_(8).reshape(out_dim, num_groups, -1)
+    return (q_OxGxS * scale_OxG.to(dtype)[..., None]).reshape(out_dim, -1)
+
+
+class QuantizedDenseGeneral(nn.Module):
+    """Weight-only quantized drop-in replacement for a `DenseGeneral` layer.
+
+    Attributes:
+        in_shapes (Tuple[int, ...]): Sizes of the contracted input dimensions.
+        out_features (Tuple[int, ...]): Shape of the output features.
+        axis (Tuple[int, ...]): Input axes to contract (always the trailing axes).
+        weight_quant (str): The quantization mode, one of `WEIGHT_QUANT_MODES`.
+        group_size (int): Number of input channels sharing a scale (int4 only).
+        weight (Tensor): Quantized kernel buffer, `[out, in]` int8 or `[out, in // 2]` packed uint8.
+        scale (Tensor): Scale buffer in the compute dtype, `[out]` for int8 or `[out, in // group_size]` for int4.
+    """
+
+    def __init__(
+        self,
+        in_shapes: tuple[int, ...],
+        out_features: tuple[int, ...],
+        axis: tuple[int, ...],
+        compute_dtype: torch.dtype,
+        weight_quant: str = "int8",
+        group_size: int = DEFAULT_GROUP_SIZE,
+        device: torch.device | None = None,
+    ):
+        super().__init__()
+        if weight_quant not in WEIGHT_QUANT_MODES:
+            raise ValueError(f"Unsupported weight quantization: {weight_quant}. Expected one of {WEIGHT_QUANT_MODES}")
+        self.in_shapes = in_shapes
+        self.out_features = out_features
+        self.axis = axis
+        self.weight_quant = weight_quant
+        self.compute_dtype = compute_dtype
+
+        in_flat = math.prod(in_shapes)
+        out_flat = math.prod(out_features)
+        if weight_quant == "int8":
+            self.group_size = in_flat
+            self.register_buffer("weight", torch.empty((out_flat, in_flat), dtype=torch.int8, device=device))
+            self.register_buffer("scale", torch.empty((out_flat,), dtype=compute_dtype, device=device))
+        else:
+            # Fall back to a single group per channel when the input size does not divide evenly.
+            self.group_size = group_size if in_flat % group_size == 0 and group_size % 2 == 0 else in_flat
+            if in_flat % 2 != 0:
+                raise ValueError(f"int4 packing requires an even input size, got {in_flat}")
+            num_groups = in_flat // self.group_size
+            self.register_buffer("weight", torch.empty((out_flat, in_flat // 2), dtype=torch.uint8, device=device))
+            self.register_buffer("scale", torch.empty((out_flat, num_groups), dtype=compute_dtype, device=device))
+
+    @classmethod
+    def from_dense(
+        cls,
+        dense: DenseGeneral,
+        weight_quant: str = "int8",
+        transform_weights: bool = True,
+        group_size: int = DEFAULT_GROUP_SIZE,
+    ) -> "QuantizedDenseGeneral":
+        """Builds a quantized layer from a `DenseGeneral`, in either of its layouts.
+
+        Args:
+            dense: The layer to quantize.
+            weight_quant: The quantization mode.
+            transform_weights: If False, only the buffers are allocated. Used when the
+                weights about to be loaded were already quantized.
+            group_size: Input channels per scale for int4.
+        """
+        if tuple(dense.axis) != tuple(range(-len(dense.in_shapes), 0)):
+            raise ValueError(f"Quantization requires contracting the trailing input axes, got axis={dense.axis}")
+        module = cls(
+            in_shapes=dense.in_shapes,
+            out_features=dense.out_features,
+            axis=dense.axis,
+            compute_dtype=dense.weight.dtype,
+            weight_quant=weight_quant,
+            group_size=group_size,
+            device=dense.weight.device,
+        )
+        if transform_weights:
+            in_flat = math.prod(dense.in_shapes)
+            weight = dense.weight.data
+            if not dense.matmul_layout:
+                weight = weight.reshape(in_flat, -1).t()
+            if weight_quant == "int8":
+                qweight, scale = quantize_per_channel_int8(weight)
+            else:
+                qweight, scale = quantize_groupwise_int4(weight, module.group_size)
+            module.weight.copy_(qweight)
+            module.scale.copy_(scale)
+        return module
+
+    def dequantize(self) -> Tensor:
+        """Returns the `[out, in]` weight expanded to the compute dtype."""
+        if self.weight_quant == "int8":
+            return self.weight.to(self.compute_dtype) * self.scale[:, None]
+        return dequantize_groupwise_int4(self.weight, self.scale, self.compute_dtype)
+
+    def _int8_matmul(self, x: Tensor) -> Tensor:
+        global _use_int8pack_mm
+        if _use_int8pack_mm and x.device.type == "cpu":
+            try:
+                return torch._weight_int8pack_mm(x.contiguous(), self.weight, self.scale)
+            except RuntimeError:
+                # Kernel not built for this dtype/platform; use the portable path from now on.
+                _use_int8pack_mm = False
+        return F.linear(x, self.weight.to(self.compute_dtype)) * self.scale
+
+    def forward(self, inputs: Tensor) -> Tensor:
+        x = inputs.flatten(inputs.ndim - len(self.in_shapes)).to(self.compute_dtype)
+        if self.weight_quant == "int8":
+            lead_shape = x.shape[:-1]
+            output = self._int8_matmul(x.reshape(-1, x.shape[-1])).reshape(*lead_shape, -1)
+        else:
+            output = F.linear(x, self.dequantize())
+        return output.unflatten(-1, self.out_features).to(inputs.dtype)
+
+
+class QuantizedEmbedding(nn.Module):
+    """Int8 per-row quantized drop-in replacement for `nn.Embedding`.
+
+    Attributes:
+        weight (Tensor): int8 table, `[num_embeddings, embedding_dim]`.
+        scale (Tensor): Per-row scale in the compute dtype, `[num_embeddings, 1]`.
+    """
+
+    def __init__(
+        self,
+        num_embeddings: int,
+        embedding_dim: int,
+        compute_dtype: torch.dtype,
+        device: torch.device | None = None,
+    ):
+        super().__init__()
+        self.num_embeddings = num_embeddings
+        self.embedding_dim = embedding_dim
+        self.compute_dtype = compute_dtype
+        self.register_buffer("weight", torch.empty((num_embeddings, embedding_dim), dtype=torch.int8, device=device))
+        self.register_buffer("scale", torch.empty((num_embeddings, 1), dtype=compute_dtype, device=device))
+
+    @classmethod
+    def from_embedding(cls, embedding: nn.Embedding, transform_weights: bool = True) -> "QuantizedEmbedding":
+        module = cls(
+            embedding.num_embeddings,
+            embedding.embedding_dim,
+            compute_dtype=embedding.weight.dtype,
+            device=embedding.weight.device,
+        )
+        if transform_weights:
+            qweight, scale = quantize_per_channel_int8(embedding.weight.data)
+            module.weight.copy_(qweight)
+            module.scale.copy_(scale[:, None])
+        return module
+
+    def forward(self, ids: Tensor) -> Tensor:
+        return F.embedding(ids, self.weight).to(self.compute_dtype) * F.embedding(ids, self.scale)
+
+
+def quantize_dense_layers(
+    model: nn.Module,
+    weight_quant: str,
+    transform_weights: bool = True,
+    group_size: int = DEFAULT_GROUP_SIZE,
+) -> nn.Module:
+    """Replaces every `DenseGeneral` in `model` with a `QuantizedDenseGeneral`, in place.
+
+    This covers the encoder and decoder attention projections, the MLPs and `logits_dense`.
+
+    Args:
+        model: The model to quantize.
+        weight_quant: The quantization mode, one of `WEIGHT_QUANT_MODES`.
+        transform_weights: If False, only the quantized buffers are allocated.
+        group_size: Input channels per scale for int4.
+
+    Returns:
+        The same model instance.
+    """
+    if weight_quant not in WEIGHT_QUANT_MODES:
+        raise ValueError(f"Unsupported weight quantization: {weight_quant}. Expected one of {WEIGHT_QUANT_MODES}")
+    for module in list(model.modules()):
+        for name, child in list(module.named_children()):
+            if isinstance(child, DenseGeneral):
+                quantized = QuantizedDenseGeneral.from_dense(child, weight_quant, transform_weights, group_size)
+                setattr(module, name, quantized)
+    return model
+
+
+def quantize_embeddings(model: nn.Module, transform_weights: bool = True) -> nn.Module:
+    """Replaces every `nn.Embedding` in `model` with an int8 `QuantizedEmbedding`, in place."""
+    for module in list(model.modules()):
+        for name, child in list(module.named_children()):
+            if isinstance(child, nn.Embedding):
+                setattr(module, name, QuantizedEmbedding.from_embedding(child, transform_weights))
+    return model
@@ -0,0 +1,134 @@
+"""Detection of runaway generations that would otherwise run to `max_tokens`.
+
+Some generations never sample EOS on channel 0 and instead loop on silence or on a
+short repeated pattern until the token budget is spent. `RunawayDetector` watches the
+channel-0 codes of every row on the device and flags a row when:
+
+    silence  the row has produced `silence_frames` silence-like frames in a row: codes in
+             `silence_codes` if given, else the same code as the frame before (DAC encodes
+             stationary silence as a constant code)
+    repeat   the last `repeat_frames` frames repeat with a period of 2 to `max_period`
+             frames (a looping word or syllable)
+    budget   the row has run `budget_factor` times its predicted length plus
+             `budget_headroom` frames (see `dia.length`)
+
+A flagged row is ended through the normal EOS countdown, so its delayed channels are
+closed exactly like after a sampled EOS, and its finish reason is the detector's name.
+With `trim`, the looping tail is cut from the output: a repeated pattern keeps one
+period, and silence keeps `trim_silence_frames`. Tracking costs a few element-wise ops
+on [B, max_period] tensors per step and adds no device synchronization.
+
+Example:
+    result = model.generate(text, runaway=RunawayConfig(silence_frames=172), return_result=True)
+    print(result.finish_reason)  # "eos", "max_tokens", "silence", "repeat" or "budget"
+"""
+
+import math
+from dataclasses import dataclass
+
+import torch
+
+
+# Finish reasons by detector code; 0 means the row was not flagged.
+REASONS = (None, "silence", "repeat", "budget")
+SILENCE, REPEAT, BUDGET = 1, 2, 3
+
+
+@dataclass
+class RunawayConfig:
+    """Thresholds of the runaway detectors (~86 frames per second of audio).
+
+    Attributes:
+        silence_frames: Consecutive silence-like frames that end a row (None disables).
+        silence_codes: Channel-0 codes that count as silence; None treats an unchanged code as silence.
+        repeat_frames: Frames a periodic pattern must span to end a row (None disables).
+        max_period: Longest repeating pattern, in frames, that is detected.
+        budget_factor: End a row after this multiple of its predicted length (None disables).
+        budget_headroom: Frames allowed on top of `budget_factor` times the prediction.
+        trim: Cut the detected silence or repetition from the output.
+        trim_silence_frames: Silence kept at the end of a trimmed row.
+    """
+
+    silence_frames: int | None = 258
+    silence_codes: tuple[int, ...] | None = None
+    repeat_frames: int | None = 172
+    max_period: int = 16
+    budget_factor: float | None = 2.5
+    budget_headroom: int = 258
+    trim: bool = True
+    trim_silence_frames: int = 43
+
+
+class RunawayDetector:
+    """Per-row detector state for one generation. See `RunawayConfig`.
+
+    Args:
+        config: The thresholds.
+        prefill_steps: First generated step of every row; earlier steps hold the prompt.
+        predicted_frames: Predicted length of every row, for the budget detector.
+        device: The device of the generation.
+    """
+
+    def __init__(
+        self,
+        config: RunawayConfig,
+        prefill_steps: list[int],
+        predicted_frames: list[float],
+        device: torch.device,
+    ):
+        batch_size = len(prefill_steps)
+        self.config = config
+        self.prefill_Bx = torch.tensor(prefill_steps, device=device)
+        # Last `max_period` channel-0 codes, most recent first; -1 never matches a code.
+        self.history_BxP = torch.full((batch_size, config.max_period), -1, dtype=torch.long, device=device)
+        # Consecutive steps whose code equals the code p + 1 steps earlier.
+        self.runs_BxP = torch.zeros((batch_size, config.max_period), dtype=torch.long, device=device)
+        self.silence_run_Bx = torch.zeros((batch_size,), dtype=torch.long, device=device)
+        self.silence_codes = (
+            torch.tensor(config.silence_codes, device=device) if config.silence_codes is not None else None
+        )
+        self.periods_P = torch.arange(1, config.max_period + 1, device=device)
+        self.limit_Bx = None
+        if config.budget_factor is not None:
+            budgets = [math.ceil(config.budget_factor * frames) for frames in predicted_frames]
+            self.limit_Bx = self.prefill_Bx + config.budget_headroom + torch.tensor(budgets, device=device)
+
+    def update(self, codes_Bx: torch.Tensor, step: int) -> tuple[torch.Tensor, torch.Tensor]:
+        """Feeds the channel-0 codes written at `step`.
+
+        Returns:
+            The detector code of every row (0 if not flagged), shape [B], and the step at
+            which a flagged row's output should end (used with `trim`), shape [B].
+        """
+        config = self.config
+        codes_Bx = codes_Bx.long()
+        generating_Bx = step >= self.prefill_Bx
+
+        matches_BxP = (codes_Bx[:, None] == self.history_BxP) & generating_Bx[:, None]
+        self.runs_BxP = torch.where(matches_BxP, self.runs_BxP + 1, 0)
+        self.history_BxP = torch.cat([codes_Bx[:, None], self.history_BxP[:, :-1]], dim=1)
+        if self.silence_codes is not None:
+            silent_Bx = torch.isin(codes_Bx, self.silence_codes) & generating_Bx
+            self.silence_run_Bx = torch.where(silent_Bx, self.silence_run_Bx + 1, 0)
+        else:
+            self.silence_run_Bx = self.runs_BxP[:, 0]
+
+        reason_Bx = torch.zeros_like(codes_Bx)
+        end_Bx = torch.full_like(codes_Bx, step)
+        if self.limit_Bx is not None:
+            reason_Bx = torch.where(step >= self.limit_Bx, BUDGET, reason_Bx)
+        if config.repeat_frames is not None and config.max_period > 1:
+            # Constant runs match every period; they are left to the silence detector.
+            looping_BxP = (self.runs_BxP >= config.repeat_frames) & (self.runs_BxP[:, :1] < config.repeat_frames)
+            looping_BxP[:, 0] = False
+            # The shortest looping period; its run started one period after the pattern did.
+            period_Bx = torch.where(looping_BxP, self.periods_P, config.max_period + 1).min(dim=1).values
+            looping_Bx = period_Bx <= config.max_period
+            run_Bx = self.runs_BxP.gather(1, (period_Bx.clamp(max=config.max_period) - 1)[:, None])[:, 0]
+            reason_Bx = torch.where(looping_Bx, REPEAT, reason_Bx)
+            end_Bx = torch.where(looping_Bx, step + 1 - run_Bx, end_Bx)
+        if config.silence_frames is not None:
+            silent_Bx = self.silence_run_Bx >= config.silence_frames
+            reason_Bx = torch.where(silent_Bx, SILENCE, reason_Bx)
+            end_Bx = torch.where(silent_Bx, step + 1 - self.silence_run_Bx + config.trim_silence_frames, end_Bx)
+        return reason_Bx, end_Bx
@@ -0,0 +1,365 @@
+"""OpenAI-compatible HTTP speech endpoint backed by a batching model worker.
+
+`POST /v1/audio/speech` accepts the OpenAI request shape (`input`, `response_format`,
+`speed`, `stream`) plus Dia sampling options. Concurrent requests are collected for up
+to `max_wait_ms` (or until `max_batch_size` is reached) and run as one batched
+generation by `BatchingWorker`. Streaming responses use chunked transfer encoding and
+send audio as soon as it is decoded.
+
+Every response carries timing headers:
+    X-Queue-Time-Ms: Time spent waiting for a batch slot.
+    X-Generation-Time-Ms: Time spent in the batched generation (non-streaming only).
+    X-Time-To-First-Chunk-Ms: Time until the first audio chunk (streaming only).
+    X-Total-Time-Ms: Time until the response was ready to send.
+    X-Batch-Size: Number of requests generated together with this one.
+    X-Coalesced: "true" if the request joined an identical in-flight generation.
+    X-Cache: "hit" if the result came from the result cache (`--cache-dir`), else "miss".
+
+If the client disconnects before its audio is ready (or while it is streamed), its row
+is stopped at the next decode step so the batch slot is freed. `timeout` (a Dia
+extension, in seconds) stops generation early and returns the audio generated so far.
+
+`GET /metrics` exposes generation and serving metrics in the Prometheus text format
+(see `dia.metrics`).
+
+Usage:
+    dia serve --host 0.0.0.0 --port 8000 --max-batch-size 8 --max-wait-ms 10
+
+    curl -X POST localhost:8000/v1/audio/speech -H "Content-Type: application/json" \\
+        -d '{"input": "[S1] Hello there.", "response_format": "wav"}' -o out.wav
+
+The app can be exercised without a network with `fastapi.testclient.TestClient`:
+    with TestClient(create_app(model)) as client:
+        client.post("/v1/audio/speech", json={"input": "[S1] Hi."})
+"""
+
+import argparse
+import asyncio
+import base64
+import io
+import struct
+import time
+import wave
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Literal
+
+import numpy as np
+import torch
+from pydantic import BaseModel, Field
+
+from . import metrics
+from .cache import ResultCache
+from .length import LengthPredictor
+from .model import DEFAULT_SAMPLE_RATE, Dia
+from .serving import BatchingWorker, GenerationRequest, InvalidAudioPromptError
+
+
+MEDIA_TYPES = {"wav": "audio/wav", "pcm": "audio/pcm"}
+
+# How often a non-streaming request checks whether its client is still connected.
+DISCONNECT_POLL_SECONDS = 0.5
+
+
+class SpeechRequest(BaseModel):
+    """Request body of `/v1/audio/speech`. Fields after `stream` are Dia extensions."""
+
+    model: str = "dia-1.6b"
+    input: str = Field(min_length=1)
+    voice: str | None = None
+    response_format: Literal["wav", "pcm"] = "wav"
+    speed: float = Field(1.0, ge=0.25, le=4.0)
+    stream: bool = False
+    audio_prompt: str | None = Field(None, description="Base64-encoded audio file to clone the voice from.")
+    max_tokens: int | None = Field(None, gt=0)
+    cfg_scale: float = 3.0
+    temperature: float = 1.3
+    top_p: float = Field(0.95, gt=0.0, le=1.0)
+    cfg_filter_top_k: int = Field(45, gt=0)
+    seed: int | None = None
+    timeout: float | None = Field(None, gt=0, description="Stop after this many seconds and return the audio so far.")
+
+
+def to_pcm16(audio: np.ndarray) -> bytes:
+    """Converts float audio in [-1, 1] to little-endian 16-bit PCM bytes."""
+    return (np.clip(audio, -1.0, 1.0) * 32767).astype("<i2").tobytes()
+
+
+def wav_bytes(audio: np.ndarray, sample_rate: int) -> bytes:
+    """Encodes float audio as a complete 16-bit mono WAV file."""
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        f.writeframes(to_pcm16(audio))
+    return buffer.getvalue()
+
+
+def streaming_wav_header(sample_rate: int) -> bytes:
+    """A 16-bit mono WAV header with unknown (maximum) data size, for streamed bodies."""
+    byte_rate = sample_rate * 2
+    return (
+        b"RIFF"
+        + struct.pack("<I", 0xFFFFFFFF)
+        + b"WAVEfmt "
+        + struct.pack("<IHHIIHH", 16, 1, 1, sample_rate, byte_rate, 2, 16)
+        + b"data"
+        + struct.pack("<I", 0xFFFFFFFF)
+    )
+
+
+def change_speed(audio: np.ndarray, speed: float) -> np.ndarray:
+    """Time-stretches audio by linear resampling (also shifts pitch), as in the Gradio app."""
+    if speed == 1.0 or len(audio) == 0:
+        return audio
+    target_len = max(int(len(audio) / speed), 1)
+    x_resampled = np.linspace(0, len(audio) - 1, target_len)
+    return np.interp(x_resampled, np.arange(len(audio)), audio).astype(np.float32)
+
+
+def _timing_headers(request: GenerationRequest, received_at: float, **extra_ms: float) -> dict[str, str]:
+    headers = {"X-Batch-Size": str(request.batch_size or 0), "X-Coalesced": str(request.coalesced).lower()}
+    headers["X-Cache"] = "hit" if request.cached else "miss"
+    if request.started_at is not None:
+        headers["X-Queue-Time-Ms"] = f"{(request.started_at - request.submitted_at) * 1000:.1f}"
+    for name, value in extra_ms.items():
+        headers[name] = f"{value * 1000:.1f}"
+    headers["X-Total-Time-Ms"] = f"{(time.perf_counter() - received_at) * 1000:.1f}"
+    return headers
+
+
+async def _submit_until_disconnect(worker: BatchingWorker, request: GenerationRequest, http_request) -> np.ndarray:
+    """Awaits `worker.submit`, cancelling it (which stops the generation) if the client goes away.
+
+    Raises:
+        ConnectionAbortedError: If the client disconnected first.
+    """
+    task = asyncio.ensure_future(worker.submit(request))
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_SECONDS)
+            if done:
+                return task.result()
+            if await http_request.is_disconnected():
+                raise ConnectionAbortedError("Client disconnected")
+    finally:
+        task.cancel()
+
+
+def create_app(
+    model: Dia,
+    max_batch_size: int = 8,
+    max_wait_ms: float = 10.0,
+    result_cache: ResultCache | None = None,
+    shortest_first: bool = False,
+):
+    """Builds the FastAPI app serving `model`.
+
+    The batching worker is started and stopped with the app's lifespan, so use the
+    returned app with an ASGI server or as a context-managed `TestClient`.
+
+    Args:
+        model: The loaded model, with the DAC model loaded.
+        max_batch_size: Maximum number of requests per batched generation.
+        max_wait_ms: How long to collect concurrent requests before generating.
+        result_cache: Optional cache of deterministic (seeded or greedy) results.
+        shortest_first: Schedule requests with the shortest predicted audio first.
+    """
+    from fastapi import FastAPI, HTTPException, Request
+    from fastapi.responses import Response, StreamingResponse
+
+    worker = BatchingWorker(
+        model,
+        max_batch_size=max_batch_size,
+        max_wait_ms=max_wait_ms,
+        result_cache=result_cache,
+        shortest_first=shortest_first,
+    )
+
+    @asynccontextmanager
+    async def lifespan(app):
+        await worker.start()
+        try:
+            yield
+        finally:
+            await worker.stop()
+
+    app = FastAPI(title="Dia speech API", lifespan=lifespan)
+    app.state.worker = worker
+
+    @app.get("/health")
+    async def health():
+        return {
+            "status": "ok",
+            "queue_depth": worker.queue_depth,
+            "coalescing": worker.coalescing_stats(),
+            "result_cache": result_cache.stats() if result_cache is not None else None,
+        }
+
+    @app.get("/metrics")
+    async def metrics_endpoint():
+        return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+    @app.post("/v1/audio/speech")
+    async def speech(body: SpeechRequest, http_request: Request):
+        received_at = time.perf_counter()
+        if model.dac_model is None:
+            raise HTTPException(status_code=503, detail="The model was loaded without the DAC codec")
+        try:
+            audio_prompt = base64.b64decode(body.audio_prompt, validate=True) if body.audio_prompt else None
+        except ValueError:
+            raise HTTPException(status_code=400, detail="audio_prompt must be base64-encoded audio") from None
+        request = GenerationRequest(
+            text=body.input,
+            audio_prompt=audio_prompt,
+            max_tokens=body.max_tokens,
+            cfg_scale=body.cfg_scale,
+            temperature=body.temperature,
+            top_p=body.top_p,
+            cfg_filter_top_k=body.cfg_filter_top_k,
+            seed=body.seed,
+            timeout=body.timeout,
+        )
+        media_type = MEDIA_TYPES[body.response_format]
+
+        if not body.stream:
+            try:
+                audio = await _submit_until_disconnect(worker, request, http_request)
+            except ConnectionAbortedError:
+                return Response(status_code=499)
+            except InvalidAudioPromptError as e:
+                raise HTTPException(status_code=400, detail=str(e)) from e
+            except MemoryError as e:
+                raise HTTPException(status_code=413, detail=str(e)) from e
+            except TimeoutError as e:
+                raise HTTPException(status_code=504, detail=str(e)) from e
+            except Exception as e:
+                raise HTTPException(status_code=500, detail=f"Generation failed: {e}") from e
+            if audio is None:
+                raise HTTPException(status_code=500, detail="No audio was generated")
+            audio = change_speed(audio, body.speed)
+            content = wav_bytes(audio, DEFAULT_SAMPLE_RATE) if body.response_format == "wav" else to_pcm16(audio)
+            generation_time = (request.finished_at or received_at) - (request.started_at or received_at)
+            headers = _timing_headers(request, received_at, **{"X-Generation-Time-Ms": generation_time})
+            return Response(content=content, media_type=media_type, headers=headers)
+
+        chunks = worker.submit_stream(request)
+        # Wait for the first chunk so that generation errors still map to an HTTP status
+        # and the time-to-first-chunk header is known before the body starts.
+        try:
+            first = await anext(chunks, None)
+        except InvalidAudioPromptError as e:
+            raise HTTPException(status_code=400, detail=str(e)) from e
+        except MemoryError as e:
+            raise HTTPException(status_code=413, detail=str(e)) from e
+        except TimeoutError as e:
+            raise HTTPException(status_code=504, detail=str(e)) from e
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Generation failed: {e}") from e
+        ttfc = time.perf_counter() - received_at
+        headers = _timing_headers(request, received_at, **{"X-Time-To-First-Chunk-Ms": ttfc})
+
+        async def body_iter() -> AsyncIterator[bytes]:
+            # Closing `chunks` when the client goes away releases the request's row.
+            try:
+                if body.response_format == "wav":
+                    yield streaming_wav_header(DEFAULT_SAMPLE_RATE)
+                if first is None:
+                    return
+                yield to_pcm16(change_speed(first, body.speed))
+                async for chunk in chunks:
+                    yield to_pcm16(change_speed(chunk, body.speed))
+            finally:
+                await chunks.aclose()
+
+        return StreamingResponse(body_iter(), media_type=media_type, headers=headers)
+
+    return app
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="dia serve", description="Serve an OpenAI-style /v1/audio/speech endpoint.")
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--repo-id", type=str, default="nari-labs/Dia-1.6B", help="Hugging Face repository ID.")
+    parser.add_argument("--config", type=str, help="Path to a local config.json or inference bundle.")
+    parser.add_argument("--checkpoint", type=str, help="Path to a local checkpoint or inference bundle.")
+    parser.add_argument(
+        "--dtype", type=str, default=None, help="Compute dtype (default: float16 on CUDA, float32 otherwise)."
+    )
+    parser.add_argument("--device", type=str, default=None, help="Device to run on (default: auto).")
+    parser.add_argument("--weight-quant", type=str, default=None, help="Weight-only quantization mode.")
+    parser.add_argument(
+        "--tiny", action="store_true", help="Serve a tiny random-weight model with a stub codec (offline testing)."
+    )
+    parser.add_argument("--max-batch-size", type=int, default=8, help="Maximum requests per batch.")
+    parser.add_argument(
+        "--max-wait-ms", type=float, default=10.0, help="How long to collect concurrent requests (default: 10)."
+    )
+    parser.add_argument(
+        "--memory-budget-gb", type=float, default=None, help="Cap batches to fit this much memory, weights included."
+    )
+    parser.add_argument(
+        "--length-model", type=str, default=None, help="Length predictor JSON (from `dia bench calibrate`)."
+    )
+    parser.add_argument(
+        "--shortest-first", action="store_true", help="Run requests with the shortest predicted audio first."
+    )
+    parser.add_argument(
+        "--detect-runaway", action="store_true", help="End rows that loop on silence or repetition early."
+    )
+    parser.add_argument("--cache-dir", type=str, default=None, help="Cache generated codes of seeded requests here.")
+    parser.add_argument("--cache-max-mb", type=float, default=1024, help="Disk budget for cached codes (MB).")
+    parser.add_argument(
+        "--audio-cache-max-mb", type=float, default=256, help="Memory budget for cached decoded audio (MB)."
+    )
+    args = parser.parse_args(argv)
+
+    import uvicorn
+
+    device = torch.device(args.device) if args.device else None
+    if args.tiny:
+        device = device or torch.device("cpu")
+    # Half precision is slow (or unsupported) on CPU, so default to it only on CUDA.
+    on_cuda = device.type == "cuda" if device is not None else torch.cuda.is_available()
+    dtype = args.dtype or ("float16" if on_cuda else "float32")
+    if args.tiny:
+        from .testing import tiny_dia
+
+        model = tiny_dia(compute_dtype=dtype, device=device)
+    elif args.checkpoint:
+        model = Dia.from_local(
+            args.config,
+            args.checkpoint,
+            compute_dtype=dtype,
+            device=device,
+            weight_quant=args.weight_quant,
+        )
+    else:
+        model = Dia.from_pretrained(args.repo_id, compute_dtype=dtype, device=device, weight_quant=args.weight_quant)
+    if args.memory_budget_gb:
+        model.set_memory_budget(int(args.memory_budget_gb * 2**30))
+    if args.length_model:
+        model.set_length_predictor(LengthPredictor.load(args.length_model))
+    if args.detect_runaway:
+        model.set_runaway_detection(True)
+    result_cache = None
+    if args.cache_dir:
+        result_cache = ResultCache(
+            args.cache_dir,
+            max_codes_bytes=int(args.cache_max_mb * 2**20),
+            max_audio_bytes=int(args.audio_cache_max_mb * 2**20),
+        )
+    app = create_app(
+        model,
+        max_batch_size=args.max_batch_size,
+        max_wait_ms=args.max_wait_ms,
+        result_cache=result_cache,
+        shortest_first=args.shortest_first,
+    )
+    uvicorn.run(app, host=args.host, port=args.port)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,602 @@
+"""Serving utilities that share one `Dia` model between concurrent asyncio clients.
+
+`BatchingWorker` owns a dedicated model thread. Request handlers enqueue a
+`GenerationRequest` and await the result; the worker collects requests that arrive
+within a short window, runs compatible ones as a single batched `Dia.generate` call on
+the model thread, and resolves each handler's future. The event loop is never blocked
+by generation, so pings and other connections keep being served.
+
+Streaming requests (`submit_stream`) are batched the same way but run through
+`Dia.generate_stream`; each decoded chunk is handed to its caller as soon as the model
+thread produces it.
+
+Deterministic requests (seeded, or greedy with temperature 0) that are identical to one
+already queued or running are coalesced: they attach to the in-flight generation
+instead of starting another one, and streamed chunks are replayed to late joiners.
+
+Abandoned work frees its batch slot: when every caller waiting for a request has gone
+(the awaiting task was cancelled, e.g. because the client disconnected), its row is
+stopped at the next decode step, and a request with a `timeout` is stopped once it
+expires and returns the audio generated so far.
+
+Example:
+    worker = BatchingWorker(model, max_batch_size=8, max_wait_ms=10)
+    await worker.start()
+    audio = await worker.submit(GenerationRequest(text="[S1] Hello."))
+    async for chunk in worker.submit_stream(GenerationRequest(text="[S1] Hello.")):
+        ...
+"""
+
+import asyncio
+import hashlib
+import io
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import AsyncIterator
+
+import numpy as np
+import torch
+import torchaudio
+
+from . import metrics
+from .cache import ResultCache
+from .control import CancellationToken, cancel_rows
+from .length import LengthPredictor
+from .memory import MemoryEstimate
+from .model import Dia
+
+
+logger = logging.getLogger(__name__)
+
+# With shortest-first scheduling, every second in the queue counts as this many frames
+# less predicted work (~1 second of audio), so long requests are not starved.
+AGING_FRAMES_PER_SECOND = 86.0
+
+
+class InvalidAudioPromptError(ValueError):
+    """A voice prompt given as encoded audio file bytes could not be decoded."""
+
+
+@dataclass
+class GenerationRequest:
+    """A single text-to-speech request.
+
+    Attributes:
+        text: The input text.
+        audio_prompt: Optional voice prompt: an audio file path, encoded audio file bytes,
+            or DAC codes of shape [T, C].
+        max_tokens: Maximum audio tokens to generate (model default if None).
+        cfg_scale: Classifier-free guidance scale.
+        temperature: Sampling temperature.
+        top_p: Nucleus sampling threshold.
+        cfg_filter_top_k: Top-k used during sampling.
+        seed: Optional seed of the request's own sampling RNG. A seeded request produces the
+            same audio whatever it is batched with.
+        timeout: Optional limit in seconds from submission. A request that expires while queued
+            fails with `TimeoutError`; one that expires while generating returns the audio so far.
+        submitted_at: When the request was created (`time.perf_counter`).
+        started_at: When its batch started on the model thread. Set by the worker.
+        finished_at: When its batch finished. Set by the worker.
+        batch_size: Number of requests in its batch. Set by the worker.
+        coalesced: Whether it was served by an identical in-flight generation. Set by the worker.
+        cached: Whether it was served from the worker's result cache. Set by the worker.
+    """
+
+    text: str
+    audio_prompt: str | bytes | torch.Tensor | None = None
+    max_tokens: int | None = None
+    cfg_scale: float = 3.0
+    temperature: float = 1.3
+    top_p: float = 0.95
+    cfg_filter_top_k: int = 45
+    seed: int | None = None
+    timeout: float | None = None
+    submitted_at: float = field(default_factory=time.perf_counter, compare=False)
+    started_at: float | None = field(default=None, compare=False)
+    finished_at: float | None = field(default=None, compare=False)
+    batch_size: int | None = field(default=None, compare=False)
+    coalesced: bool = field(default=False, compare=False)
+    cached: bool = field(default=False, compare=False)
+    _canonical_key: str | None = field(default=None, init=False, repr=False, compare=False)
+
+    def batch_key(self) -> tuple:
+        """Requests with equal keys can share one `Dia.generate` call."""
+        return (self.max_tokens, self.cfg_scale, self.temperature, self.top_p, self.cfg_filter_top_k)
+
+    @property
+    def deterministic(self) -> bool:
+        """Whether two identical requests are expected to produce the same audio."""
+        return self.seed is not None or self.temperature == 0
+
+    def canonical_key(self) -> str:
+        """A hash of everything that determines the output: text, voice prompt and sampling parameters."""
+        if self._canonical_key is not None:
+            return self._canonical_key
+        digest = hashlib.sha256()
+        digest.update(repr((self.text, *self.batch_key(), self.seed)).encode("utf-8"))
+        prompt = self.audio_prompt
+        if isinstance(prompt, bytes):
+            digest.update(b"bytes:" + hashlib.sha256(prompt).digest())
+        elif isinstance(prompt, str):
+            # Include the file's size and mtime so an edited prompt file gets a new key.
+            stat = os.stat(prompt) if os.path.exists(prompt) else None
+            version = f"{stat.st_size}:{stat.st_mtime_ns}" if stat else ""
+            digest.update(f"path:{os.path.abspath(prompt)}:{version}".encode("utf-8"))
+        elif isinstance(prompt, torch.Tensor):
+            digest.update(f"codes:{tuple(prompt.shape)}:{prompt.dtype}".encode("utf-8"))
+            digest.update(prompt.detach().cpu().contiguous().numpy().tobytes())
+        self._canonical_key = digest.hexdigest()
+        return self._canonical_key
+
+
+@dataclass
+class _PendingRequest:
+    request: GenerationRequest
+    future: asyncio.Future
+    # Set for streaming requests; receives audio chunks, then None once the row is done.
+    chunks: "_ChunkBroadcast | None" = None
+    # Cancelled when nobody waits for the result any more, or once the request's timeout expires.
+    cancel: CancellationToken = field(default_factory=CancellationToken)
+
+
+class _ChunkBroadcast:
+    """Fans the chunks of one streamed generation out to all of its subscribers.
+
+    Chunks are kept so that requests coalesced after the stream started still receive
+    the audio from the beginning. Only used from the event loop thread.
+    """
+
+    def __init__(self):
+        self.history: list[np.ndarray | None] = []
+        self._subscribers: list[asyncio.Queue] = []
+
+    def put_nowait(self, chunk: np.ndarray | None) -> None:
+        if self.history and self.history[-1] is None:
+            return
+        self.history.append(chunk)
+        for queue in self._subscribers:
+            queue.put_nowait(chunk)
+
+    def subscribe(self) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue()
+        for chunk in self.history:
+            queue.put_nowait(chunk)
+        self._subscribers.append(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue) -> None:
+        self._subscribers.remove(queue)
+
+
+@dataclass
+class _InflightGeneration:
+    """A queued or running request that identical requests can attach to."""
+
+    pending: _PendingRequest
+    waiters: int = 0
+
+
+def _copy_timing(source: GenerationRequest, target: GenerationRequest) -> None:
+    """Gives a coalesced request the timing of the generation it joined."""
+    if source is not target:
+        target.started_at = source.started_at
+        target.finished_at = source.finished_at
+        target.batch_size = source.batch_size
+
+
+class BatchingWorker:
+    """Runs `Dia.generate` on a dedicated thread, batching requests from concurrent callers.
+
+    Attributes:
+        model: The shared model.
+        max_batch_size: Maximum number of requests per `generate` call.
+        max_wait_ms: How long to wait for more requests once the first one arrives.
+        coalesce: Attach identical deterministic requests to an in-flight generation.
+        coalesce_lookups: Number of deterministic requests checked for coalescing.
+        coalesce_hits: Number of those that attached to an in-flight generation.
+        result_cache: Optional cache of finished deterministic results. Hits skip generation;
+            results found only as codes are DAC-decoded on the model thread.
+        shortest_first: Start each batch with the queued request of shortest predicted
+            output (aged by its waiting time) and fill it with requests of similar length,
+            using the model's length predictor (see `dia.length`).
+
+    If the model has a memory budget (`Dia.set_memory_budget`), batches are capped to fit
+    it and requests that could never fit are rejected with `MemoryError`. Requests whose
+    prompt bytes are not a readable audio file are rejected with `InvalidAudioPromptError`.
+    """
+
+    def __init__(
+        self,
+        model: Dia,
+        max_batch_size: int = 8,
+        max_wait_ms: float = 10.0,
+        coalesce: bool = True,
+        result_cache: ResultCache | None = None,
+        shortest_first: bool = False,
+    ):
+        if max_batch_size < 1:
+            raise ValueError(f"max_batch_size must be >= 1, got {max_batch_size}")
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="dia-model")
+        self._queue: asyncio.Queue[_PendingRequest] | None = None
+        self._deferred: list[_PendingRequest] = []
+        self._task: asyncio.Task | None = None
+        self.coalesce = coalesce
+        self.coalesce_lookups = 0
+        self.coalesce_hits = 0
+        self._inflight: dict[tuple[str, bool], _InflightGeneration] = {}
+        self.result_cache = result_cache
+        self.shortest_first = shortest_first
+        metrics.track_hit_rate("inflight", lambda: self.coalesce_hits, lambda: self.coalesce_lookups)
+        if result_cache is not None:
+            codes, audio = result_cache.codes, result_cache.audio
+            metrics.track_hit_rate("result_codes", lambda: codes.hits, lambda: codes.hits + codes.misses)
+            metrics.track_hit_rate("result_audio", lambda: audio.hits, lambda: audio.hits + audio.misses)
+
+    @property
+    def queue_depth(self) -> int:
+        """Number of requests waiting for a batch slot."""
+        return (self._queue.qsize() if self._queue is not None else 0) + len(self._deferred)
+
+    async def start(self) -> None:
+        """Starts the batching loop on the running event loop."""
+        if self._task is not None:
+            return
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run(), name="dia-batching-worker")
+        metrics.QUEUE_DEPTH.set_function(lambda: self.queue_depth)
+
+    async def stop(self) -> None:
+        """Stops the batching loop and fails any request that has not started."""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        pending = self._deferred + [self._queue.get_nowait() for _ in range(self._queue.qsize())]
+        for item in pending:
+            if not item.future.done():
+                item.future.set_exception(RuntimeError("Worker stopped"))
+            if item.chunks is not None:
+                item.chunks.put_nowait(None)
+        self._deferred = []
+        self._executor.shutdown(wait=False)
+
+    async def run_in_model_thread(self, fn, *args):
+        """Runs `fn(*args)` on the model thread, serialized with generation."""
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    async def submit(self, request: GenerationRequest) -> np.ndarray | None:
+        """Queues a request (or joins an identical in-flight one) and waits for its generated audio."""
+        cached = await self._lookup_result(request)
+        if cached is not None:
+            return cached
+        entry = await self._attach(request, streaming=False)
+        try:
+            return await asyncio.shield(entry.pending.future)
+        finally:
+            self._detach(entry)
+            _copy_timing(entry.pending.request, request)
+
+    async def submit_stream(self, request: GenerationRequest) -> AsyncIterator[np.ndarray]:
+        """Queues a request (or joins an identical in-flight one) and yields float32 audio chunks (44.1 kHz)."""
+        cached = await self._lookup_result(request)
+        if cached is not None:
+            yield cached
+            return
+        entry = await self._attach(request, streaming=True)
+        future = entry.pending.future
+        chunks = entry.pending.chunks.subscribe()
+        first = True
+        try:
+            while (chunk := await chunks.get()) is not None:
+                _copy_timing(entry.pending.request, request)
+                if first:
+                    metrics.TIME_TO_FIRST_CHUNK_SECONDS.observe(time.perf_counter() - request.submitted_at)
+                    first = False
+                yield chunk
+            _copy_timing(entry.pending.request, request)
+            if future.done() and not future.cancelled() and future.exception() is not None:
+                raise future.exception()
+        finally:
+            entry.pending.chunks.unsubscribe(chunks)
+            self._detach(entry)
+
+    def coalescing_stats(self) -> dict[str, float]:
+        """Returns coalescing counters and the hit rate as a plain dict."""
+        return {
+            "lookups": self.coalesce_lookups,
+            "hits": self.coalesce_hits,
+            "hit_rate": self.coalesce_hits / self.coalesce_lookups if self.coalesce_lookups else 0.0,
+            "inflight": len(self._inflight),
+        }
+
+    async def _lookup_result(self, request: GenerationRequest) -> np.ndarray | None:
+        """Returns the cached audio for a deterministic request, decoding cached codes if needed."""
+        if self.result_cache is None or not request.deterministic:
+            return None
+        # Hashing the voice prompt and reading the codes file touch the disk; keep them off the event loop.
+        key = await asyncio.to_thread(self._result_key, request)
+        audio = self.result_cache.audio.get(key)
+        if audio is None:
+            codes = await asyncio.to_thread(self.result_cache.codes.get, key)
+            if codes is None:
+                return None
+            audio = await self.run_in_model_thread(self.model.decode_codes, codes)
+            self.result_cache.audio.put(key, audio, audio.nbytes)
+        request.cached = True
+        metrics.REQUESTS.labels("cached").inc()
+        return audio
+
+    def _store_result(self, request: GenerationRequest, codes: np.ndarray, audio: np.ndarray | None = None) -> None:
+        if self.result_cache is not None and request.deterministic and len(codes):
+            self.result_cache.put(self._result_key(request), codes, audio)
+
+    def _result_key(self, request: GenerationRequest) -> str:
+        """The key of a request's cached result: the model fingerprint and the canonical key.
+
+        A cache directory shared by several models (checkpoints, dtypes, quantizations)
+        thus never serves one model's results for another.
+        """
+        return f"{self.model.fingerprint()}-{request.canonical_key()}"
+
+    async def _attach(self, request: GenerationRequest, streaming: bool) -> _InflightGeneration:
+        """Returns the in-flight generation for an identical request, or queues a new one."""
+        if self._task is None:
+            await self.start()
+        # Decode encoded prompt bytes up front, so that a bad file fails only its own
+        # request instead of the whole batch it would join.
+        await asyncio.to_thread(self._check_prompt, request)
+        planner = self.model.memory_planner
+        # Estimating memory reads a voice prompt file's header; keep it off the event loop.
+        if planner is not None and not planner.fits([await asyncio.to_thread(self._estimate_memory, request)]):
+            metrics.REQUESTS.labels("rejected").inc()
+            raise MemoryError(
+                f"Request needs more than the {planner.available_bytes / 2**20:.0f} MB available for generation"
+            )
+        key = None
+        # A request with a timeout may end early, so its result is not shared.
+        if self.coalesce and request.deterministic and request.timeout is None:
+            key = (await asyncio.to_thread(request.canonical_key), streaming)
+            self.coalesce_lookups += 1
+            entry = self._inflight.get(key)
+            if entry is not None and not entry.pending.future.done():
+                self.coalesce_hits += 1
+                request.coalesced = True
+                metrics.REQUESTS.labels("coalesced").inc()
+                entry.waiters += 1
+                return entry
+
+        future = asyncio.get_running_loop().create_future()
+        cancel = CancellationToken(None if request.timeout is None else request.submitted_at + request.timeout)
+        future.add_done_callback(lambda f: cancel.cancel() if f.cancelled() else None)
+        entry = _InflightGeneration(
+            _PendingRequest(request, future, _ChunkBroadcast() if streaming else None, cancel), 1
+        )
+        if key is not None:
+            self._inflight[key] = entry
+            future.add_done_callback(lambda _: self._forget(key, entry))
+        await self._queue.put(entry.pending)
+        return entry
+
+    @staticmethod
+    def _check_prompt(request: GenerationRequest) -> None:
+        """Raises `InvalidAudioPromptError` if the request's prompt bytes are not a readable audio file."""
+        if not isinstance(request.audio_prompt, bytes):
+            return
+        try:
+            torchaudio.load(io.BytesIO(request.audio_prompt))
+        except ImportError:
+            raise  # A missing decoding backend is the server's problem, not the request's.
+        except Exception as e:
+            metrics.REQUESTS.labels("rejected").inc()
+            raise InvalidAudioPromptError(f"audio_prompt is not a readable audio file: {e}") from e
+
+    def _estimate_memory(self, request: GenerationRequest) -> MemoryEstimate:
+        # Encoded prompt bytes have an unknown duration; their DAC cost is not counted.
+        prompt = None if isinstance(request.audio_prompt, bytes) else request.audio_prompt
+        return self.model.estimate_request_memory(request.text, prompt, request.max_tokens)
+
+    def _forget(self, key: tuple[str, bool], entry: _InflightGeneration) -> None:
+        if self._inflight.get(key) is entry:
+            del self._inflight[key]
+
+    def _predicted_frames(self, item: _PendingRequest) -> float:
+        return (self.model.length_predictor or LengthPredictor()).schedule_key(item.request.text)
+
+    def _pick_shortest(self) -> _PendingRequest:
+        """Takes the deferred request with the least aged predicted work and orders the rest by similarity."""
+        now = time.perf_counter()
+        predicted = {id(item): self._predicted_frames(item) for item in self._deferred}
+
+        def aged(item: _PendingRequest) -> float:
+            return predicted[id(item)] - AGING_FRAMES_PER_SECOND * (now - item.request.submitted_at)
+
+        first = min(self._deferred, key=aged)
+        self._deferred.remove(first)
+        self._deferred.sort(key=lambda item: abs(predicted[id(item)] - predicted[id(first)]))
+        return first
+
+    def _detach(self, entry: _InflightGeneration) -> None:
+        """Drops one waiter; cancels the generation if nobody is waiting for it any more."""
+        entry.waiters -= 1
+        if entry.waiters == 0 and not entry.pending.future.done():
+            entry.pending.future.cancel()
+
+    async def _collect_batch(self) -> list[_PendingRequest]:
+        """Waits for a request, then gathers compatible requests for up to `max_wait_ms`.
+
+        If the model has a memory budget, requests that would not fit next to the ones
+        already collected are deferred to a later batch. With `shortest_first`, the batch
+        starts from the shortest waiting request instead of the oldest.
+        """
+        if self.shortest_first:
+            # Consider everything that is waiting, not just the oldest request.
+            if not self._deferred and self._queue.empty():
+                self._deferred.append(await self._queue.get())
+            while not self._queue.empty():
+                self._deferred.append(self._queue.get_nowait())
+            first = self._pick_shortest()
+        elif self._deferred:
+            first = self._deferred.pop(0)
+        else:
+            first = await self._queue.get()
+        key = first.request.batch_key()
+        batch = [first]
+        planner = self.model.memory_planner
+        estimates = [self._estimate_memory(first.request)] if planner is not None else []
+
+        def fits(item: _PendingRequest) -> bool:
+            if planner is None:
+                return True
+            estimate = self._estimate_memory(item.request)
+            if not planner.fits(estimates + [estimate]):
+                return False
+            estimates.append(estimate)
+            return True
+
+        # Requests deferred from an earlier round that match this key go first.
+        still_deferred = []
+        for item in self._deferred:
+            if len(batch) < self.max_batch_size and item.request.batch_key() == key and fits(item):
+                batch.append(item)
+            else:
+                still_deferred.append(item)
+        self._deferred = still_deferred
+
+        deadline = time.perf_counter() + self.max_wait_ms / 1000.0
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                item = await asyncio.wait_for(self._queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            if item.request.batch_key() == key and fits(item):
+                batch.append(item)
+            else:
+                self._deferred.append(item)
+        return batch
+
+    async def _run(self) -> None:
+        while True:
+            batch = await self._collect_batch()
+            batch = [item for item in batch if not item.future.cancelled() and not self._expired(item)]
+            if not batch:
+                continue
+            started_at = time.perf_counter()
+            metrics.BATCH_OCCUPANCY.observe(len(batch) / self.max_batch_size)
+            for item in batch:
+                item.request.started_at = started_at
+                item.request.batch_size = len(batch)
+                metrics.QUEUE_SECONDS.observe(started_at - item.request.submitted_at)
+            try:
+                if any(item.chunks is not None for item in batch):
+                    outputs = await self.run_in_model_thread(self._stream_batch, batch, asyncio.get_running_loop())
+                else:
+                    outputs = await self.run_in_model_thread(self._generate_batch, batch)
+            except Exception as e:
+                logger.error(f"Batch of {len(batch)} failed: {e}", exc_info=True)
+                metrics.REQUESTS.labels("failed").inc(len(batch))
+                for item in batch:
+                    if not item.future.done():
+                        item.future.set_exception(e)
+                    if item.chunks is not None:
+                        item.chunks.put_nowait(None)
+                continue
+            finished_at = time.perf_counter()
+            cancelled = sum(item.cancel.cancelled for item in batch)
+            metrics.REQUESTS.labels("generated").inc(len(batch) - cancelled)
+            metrics.REQUESTS.labels("cancelled").inc(cancelled)
+            for item, output in zip(batch, outputs):
+                item.request.finished_at = finished_at
+                if not item.future.done():
+                    item.future.set_result(output)
+
+    def _expired(self, item: _PendingRequest) -> bool:
+        """Fails a request whose timeout expired while it was queued."""
+        if not item.cancel.expired:
+            return False
+        metrics.REQUESTS.labels("cancelled").inc()
+        item.future.set_exception(TimeoutError(f"Request timed out after {item.request.timeout}s in the queue"))
+        if item.chunks is not None:
+            item.chunks.put_nowait(None)
+        return True
+
+    def _load_prompt(self, audio_prompt: str | bytes | torch.Tensor | None) -> str | torch.Tensor | None:
+        if isinstance(audio_prompt, bytes):
+            return self.model.load_audio(io.BytesIO(audio_prompt))
+        return audio_prompt
+
+    def _generate_batch(self, batch: list[_PendingRequest]) -> list[np.ndarray | None]:
+        """Runs one batched `generate` call. Executes on the model thread."""
+        requests = [item.request for item in batch]
+        first = requests[0]
+        start_time = time.perf_counter()
+        # With a result cache, generate codes so they can be stored before decoding.
+        outputs = self.model.generate(
+            [r.text for r in requests],
+            max_tokens=first.max_tokens,
+            cfg_scale=first.cfg_scale,
+            temperature=first.temperature,
+            top_p=first.top_p,
+            cfg_filter_top_k=first.cfg_filter_top_k,
+            audio_prompt=[self._load_prompt(r.audio_prompt) for r in requests],
+            return_codes=self.result_cache is not None,
+            on_step=cancel_rows([item.cancel for item in batch]),
+            seed=[r.seed for r in requests],
+        )
+        if len(requests) == 1:
+            outputs = [outputs]
+        if self.result_cache is not None:
+            codes = outputs
+            outputs = [self.model.decode_codes(c) if c is not None and len(c) else None for c in codes]
+            for item, c, audio in zip(batch, codes, outputs):
+                if c is not None and not item.cancel.cancelled:
+                    self._store_result(item.request, c, audio)
+        logger.info(f"Generated batch of {len(requests)} in {time.perf_counter() - start_time:.2f}s")
+        return outputs
+
+    def _stream_batch(self, batch: list[_PendingRequest], loop: asyncio.AbstractEventLoop) -> list[np.ndarray | None]:
+        """Runs one batched `generate_stream` call, forwarding chunks as they are decoded.
+
+        Executes on the model thread. Streaming rows receive their chunks through their
+        queue (and None once the row is final); non-streaming rows that share the batch
+        get their concatenated audio as the return value.
+        """
+        requests = [item.request for item in batch]
+        first = requests[0]
+        start_time = time.perf_counter()
+        pieces: list[list[np.ndarray]] = [[] for _ in batch]
+        for chunk in self.model.generate_stream(
+            [r.text for r in requests],
+            max_tokens=first.max_tokens,
+            cfg_scale=first.cfg_scale,
+            temperature=first.temperature,
+            top_p=first.top_p,
+            cfg_filter_top_k=first.cfg_filter_top_k,
+            audio_prompt=[self._load_prompt(r.audio_prompt) for r in requests],
+            on_step=cancel_rows([item.cancel for item in batch]),
+            seed=[r.seed for r in requests],
+        ):
+            item = batch[chunk.row]
+            if chunk.codes is not None and not item.cancel.cancelled:
+                self._store_result(item.request, chunk.codes)
+            if item.chunks is None:
+                pieces[chunk.row].append(chunk.audio)
+                continue
+            if len(chunk.audio):
+                loop.call_soon_threadsafe(item.chunks.put_nowait, chunk.audio)
+            if chunk.is_final:
+                loop.call_soon_threadsafe(item.chunks.put_nowait, None)
+        logger.info(f"Streamed batch of {len(requests)} in {time.perf_counter() - start_time:.2f}s")
+        return [np.concatenate(p) if p and batch[i].chunks is None else None for i, p in enumerate(pieces)]
@@ -49,16 +49,28 @@ class EncoderInferenceState:
     attn_mask: torch.Tensor
 
     @classmethod
-    def new(cls, config: DiaConfig, cond_src: torch.Tensor) -> "EncoderInferenceState":
-        """Creates EtorchrInferenceParams from DiaConfig and a device."""
+    def new(
+        cls, config: DiaConfig, cond_src: torch.Tensor, lengths: torch.Tensor | None = None
+    ) -> "EncoderInferenceState":
+        """Creates EncoderInferenceParams for `cond_src` of shape [B, 1, T_text].
+
+        T_text may be shorter than `config.data.text_length`; the encoder runs at that length.
+        If `lengths` ([B]) is given, the padding mask is derived from it instead of from the
+        pad value.
+        """
         device = cond_src.device
+        seq_len = cond_src.shape[-1]
 
-        positions = torch.arange(config.data.text_length, dtype=torch.float32, device=device).unsqueeze(0)
-        padding_mask = (cond_src.squeeze(1) != config.data.text_pad_value).to(device).repeat_interleave(2, dim=0)
+        positions = torch.arange(seq_len, dtype=torch.float32, device=device).unsqueeze(0)
+        if lengths is not None:
+            padding_mask = torch.arange(seq_len, device=device).unsqueeze(0) < lengths.to(device).unsqueeze(1)
+        else:
+            padding_mask = cond_src.squeeze(1) != config.data.text_pad_value
+        padding_mask = padding_mask.to(device).repeat_interleave(2, dim=0)
         attn_mask = create_attn_mask(padding_mask, padding_mask, device, is_causal=False)
 
         return cls(
-            max_seq_len=config.data.text_length,
+            max_seq_len=seq_len,
             device=device,
             positions=positions,
             padding_mask=padding_mask,
@@ -113,10 +125,31 @@ class KVCache(torch.nn.Module):
         self.v[:, :, :prefill_len, :] = v
         self.current_idx = prefill_len - 1
 
+    def select_rows(self, index: torch.Tensor) -> "KVCache":
+        """A new cache holding the given rows of this one (CFG rows, so two per batch row)."""
+        return KVCache.from_kv(self.k.index_select(0, index), self.v.index_select(0, index))
+
+    def grow(self, max_len: int) -> None:
+        """Reallocates the cache with room for `max_len` positions, keeping its contents."""
+        old_len = self.k.shape[2]
+        for name in ("k", "v"):
+            old = getattr(self, name)
+            new = old.new_zeros((*old.shape[:2], max_len, old.shape[3]))
+            new[:, :, :old_len] = old
+            setattr(self, name, new)
+
 
 @dataclass
 class DecoderInferenceState:
-    """Parameters specifically for decoder inference."""
+    """Parameters specifically for decoder inference.
+
+    `cross_attn_mask` hides padded text positions from cross-attention, so a text gives the
+    same output whatever length bucket it is padded to. This intentionally deviates from
+    the reference checkpoint, which was trained and originally run with every text padded
+    to `text_length` and cross-attention over all positions, padding included. Outputs
+    therefore differ slightly from the original implementation, most for short texts,
+    whose keys were mostly padding.
+    """
 
     device: torch.device
     dtype: torch.dtype
@@ -126,6 +159,7 @@ class DecoderInferenceState:
     self_attn_cache: list[KVCache]
     cross_attn_cache: list[KVCache]
     casual_attn_mask: torch.Tensor
+    cross_attn_mask: torch.Tensor
 
     @classmethod
     def new(
@@ -135,14 +169,23 @@ class DecoderInferenceState:
         enc_out: torch.Tensor,
         dec_cross_attn_cache: list[KVCache],
         compute_dtype: torch.dtype,
+        max_len: int | None = None,
     ) -> "DecoderInferenceState":
-        """Creates DecoderInferenceParams from DiaConfig and a device."""
+        """Creates DecoderInferenceParams from DiaConfig and a device.
+
+        The self-attention caches and the causal mask hold `max_len` steps (default:
+        `config.data.audio_length`); `grow` enlarges them.
+        """
         device = enc_out.device
-        max_audio_len = config.data.audio_length
+        max_audio_len = config.data.audio_length if max_len is None else max_len
         batch_size = enc_out.shape[0] // 2
 
         dec_positions = torch.full((2 * batch_size, 1), fill_value=0, dtype=torch.int32, device=device)
         causal_mask = torch.tril(torch.ones(max_audio_len, max_audio_len, dtype=torch.bool, device=device))
+        # Decoder queries may only attend to non-padded text positions. Rows without any
+        # text keep attending everywhere so the softmax stays defined.
+        key_mask = enc_state.padding_mask | ~enc_state.padding_mask.any(dim=-1, keepdim=True)
+        cross_attn_mask = key_mask[:, None, None, :]  # [2B, 1, 1, T_text]
 
         self_attn_cache = [
             KVCache(
@@ -165,8 +208,37 @@ class DecoderInferenceState:
             self_attn_cache=self_attn_cache,
             cross_attn_cache=dec_cross_attn_cache,
             casual_attn_mask=causal_mask,
+            cross_attn_mask=cross_attn_mask,
         )
 
+    @property
+    def max_len(self) -> int:
+        """Number of steps the self-attention caches can hold."""
+        return self.casual_attn_mask.shape[0]
+
+    def grow(self, max_len: int) -> None:
+        """Enlarges the self-attention caches and the causal mask to `max_len` steps."""
+        for cache in self.self_attn_cache:
+            cache.grow(max_len)
+        self.casual_attn_mask = torch.tril(torch.ones(max_len, max_len, dtype=torch.bool, device=self.device))
+
+    def repeat_rows(self, num_samples: int) -> None:
+        """Repeats every batch row `num_samples` times, keeping each row's CFG pair together.
+
+        Used after prefill to sample several takes of the same text: the encoder output,
+        cross-attention K/V and prefilled self-attention caches are copied rather than
+        recomputed, and each copy's self-attention cache is then written independently.
+        """
+        batch_size = self.enc_out.shape[0] // 2
+        rows = torch.arange(batch_size, device=self.device).repeat_interleave(num_samples)
+        pair_idx = torch.stack([2 * rows, 2 * rows + 1], dim=1).view(-1)
+        self.enc_out = self.enc_out.index_select(0, pair_idx)
+        self.cross_attn_mask = self.cross_attn_mask.index_select(0, pair_idx)
+        self.self_attn_cache = [cache.select_rows(pair_idx) for cache in self.self_attn_cache]
+        self.cross_attn_cache = [cache.select_rows(pair_idx) for cache in self.cross_attn_cache]
+        if self.dec_positions.shape[0] == 2 * batch_size:
+            self.dec_positions = self.dec_positions.index_select(0, pair_idx)
+
     def prepare_step(self, step_from: int, step_to: int | None = None) -> None:
         if step_to is None:
             step_to = step_from + 1
@@ -179,8 +251,10 @@ class DecoderOutput:
     prefill_steps: list[int]
 
     @classmethod
-    def new(cls, batch_size: int, config: DiaConfig, device: torch.device) -> "DecoderOutput":
-        max_audio_len = config.data.audio_length
+    def new(
+        cls, batch_size: int, config: DiaConfig, device: torch.device, max_len: int | None = None
+    ) -> "DecoderOutput":
+        max_audio_len = config.data.audio_length if max_len is None else max_len
         return cls(
             generated_tokens=torch.full(
                 (batch_size, max_audio_len, config.data.channels),
@@ -191,6 +265,17 @@ class DecoderOutput:
             prefill_steps=[],
         )
 
+    def grow(self, max_len: int) -> None:
+        """Enlarges the token buffer to `max_len` steps; new steps are unwritten (-1)."""
+        old = self.generated_tokens
+        self.generated_tokens = old.new_full((old.shape[0], max_len, old.shape[2]), -1)
+        self.generated_tokens[:, : old.shape[1]] = old
+
+    def repeat_rows(self, num_samples: int) -> None:
+        """Repeats every row (and its prefill length) `num_samples` times; see `DecoderInferenceState.repeat_rows`."""
+        self.generated_tokens = self.generated_tokens.repeat_interleave(num_samples, dim=0)
+        self.prefill_steps = [steps for steps in self.prefill_steps for _ in range(num_samples)]
+
     def get_tokens_at(self, step_from: int, step_to: int | None = None) -> torch.Tensor:
         if step_to is None:
             step_to = step_from + 1
@@ -0,0 +1,171 @@
+"""A tiny random-weight Dia model and a local stand-in for the DAC codec.
+
+Everything here runs offline and in seconds on a CPU: no checkpoint download and no
+`dac.utils.download()`. The tiny model keeps the real architecture, vocabulary, codebook
+count and delay pattern, only with few, narrow layers and a short `audio_length`, so the
+whole generate / stream / serve path (batching, EOS handling, delay revert, DAC decode)
+runs unchanged. Its output is noise; use it for benchmarks and regression tests of the
+machinery, not of audio quality.
+
+Example:
+    from dia.testing import StubDAC, tiny_config, tiny_dia
+
+    model = tiny_dia()  # random weights and a StubDAC, on CPU
+    audio = model.generate("[S1] Hello there.", max_tokens=64)
+
+    # Or plug the codec into a model built some other way
+    model = Dia(tiny_config(), load_dac=StubDAC())
+"""
+
+import math
+
+import torch
+import torch.nn as nn
+
+from .config import DataConfig, DecoderConfig, DiaConfig, EncoderConfig, ModelConfig
+from .layers import DenseGeneral
+from .model import DEFAULT_SAMPLE_RATE, SAMPLE_RATE_RATIO, Dia
+
+
+def tiny_config(
+    num_layers: int = 2,
+    embed_dim: int = 64,
+    num_heads: int = 4,
+    text_length: int = 128,
+    audio_length: int = 1024,
+) -> DiaConfig:
+    """A `DiaConfig` with the real vocabularies and delay pattern but a small transformer.
+
+    Args:
+        num_layers: Encoder and decoder layers.
+        embed_dim: Encoder and decoder width; the MLPs are 2x wider.
+        num_heads: Attention heads (the decoder uses half as many K/V heads).
+        text_length: Maximum text length in bytes (rounded up to a multiple of 128).
+        audio_length: Maximum audio frames (rounded up to a multiple of 128).
+    """
+    head_dim = embed_dim // num_heads
+    return DiaConfig(
+        model=ModelConfig(
+            encoder=EncoderConfig(
+                n_layer=num_layers, n_embd=embed_dim, n_hidden=2 * embed_dim, n_head=num_heads, head_dim=head_dim
+            ),
+            decoder=DecoderConfig(
+                n_layer=num_layers,
+                n_embd=embed_dim,
+                n_hidden=2 * embed_dim,
+                gqa_query_heads=num_heads,
+                kv_heads=max(1, num_heads // 2),
+                gqa_head_dim=head_dim,
+                cross_query_heads=num_heads,
+                cross_head_dim=head_dim,
+            ),
+        ),
+        data=DataConfig(text_length=text_length, audio_length=audio_length),
+    )
+
+
+class _StubQuantizer(nn.Module):
+    """Looks codes up in fixed random codebooks and sums them, like DAC's residual quantizer."""
+
+    def __init__(self, codebooks: torch.Tensor):
+        super().__init__()
+        self.register_buffer("codebooks", codebooks)  # [N, codebook_size, D]
+
+    def from_codes(self, codes: torch.Tensor) -> tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+        """Codes [B, N, T] -> (latents [B, D, T], per-codebook latents [B, N*D, T], codes)."""
+        index = torch.arange(codes.shape[1], device=codes.device)[None, :, None]
+        z_p = self.codebooks[index, codes.long()]  # [B, N, T, D]
+        z_q = z_p.sum(dim=1).transpose(1, 2)
+        return z_q, z_p.permute(0, 1, 3, 2).flatten(1, 2), codes
+
+
+class StubDAC(nn.Module):
+    """A deterministic stand-in for `dac.DAC` with the interface Dia uses.
+
+    `preprocess`, `encode`, `quantizer.from_codes` and `decode` take and return the same
+    shapes as the real 44.1 kHz codec (512 samples per frame, 9 codebooks of 1024
+    entries), computed with a few small fixed random projections. Encoding then decoding
+    does not reproduce the input.
+
+    Args:
+        n_codebooks: Codebooks per frame; must match the model's `channels`.
+        codebook_size: Entries per codebook.
+        latent_dim: Width of the latent between quantizer and decoder.
+        seed: Seed of the random projections.
+    """
+
+    def __init__(self, n_codebooks: int = 9, codebook_size: int = 1024, latent_dim: int = 8, seed: int = 0):
+        super().__init__()
+        self.sample_rate = DEFAULT_SAMPLE_RATE
+        self.hop_length = SAMPLE_RATE_RATIO
+        self.n_codebooks = n_codebooks
+        self.codebook_size = codebook_size
+        generator = torch.Generator().manual_seed(seed)
+        self.quantizer = _StubQuantizer(torch.randn(n_codebooks, codebook_size, latent_dim, generator=generator))
+        analysis = torch.randn(self.hop_length, n_codebooks, generator=generator) / math.sqrt(self.hop_length)
+        synthesis = torch.randn(latent_dim, self.hop_length, generator=generator) / math.sqrt(latent_dim)
+        self.register_buffer("analysis", analysis)
+        self.register_buffer("synthesis", synthesis)
+
+    def preprocess(self, audio_data: torch.Tensor, sample_rate: int | None) -> torch.Tensor:
+        """Right-pads [B, 1, T] audio to a whole number of frames."""
+        if sample_rate is not None and sample_rate != self.sample_rate:
+            raise ValueError(f"StubDAC expects {self.sample_rate} Hz audio, got {sample_rate}")
+        padding = -audio_data.shape[-1] % self.hop_length
+        return nn.functional.pad(audio_data, (0, padding))
+
+    def encode(self, audio_data: torch.Tensor) -> tuple:
+        """Audio [B, 1, T] -> (z [B, D, F], codes [B, N, F], latents, commitment loss, codebook loss)."""
+        frames = audio_data.shape[-1] // self.hop_length
+        windows = audio_data[:, 0, : frames * self.hop_length].reshape(audio_data.shape[0], frames, self.hop_length)
+        features = torch.tanh(windows.float() @ self.analysis)  # [B, F, N] in (-1, 1)
+        codes = ((features + 1) / 2 * (self.codebook_size - 1)).round().long().transpose(1, 2)
+        z, latents, _ = self.quantizer.from_codes(codes)
+        zero = torch.zeros((), device=audio_data.device)
+        return z, codes, latents, zero, zero
+
+    def decode(self, z: torch.Tensor) -> torch.Tensor:
+        """Latents [B, D, F] -> audio [B, 1, F * 512] in (-1, 1)."""
+        audio = torch.tanh(z.transpose(1, 2) @ self.synthesis)  # [B, F, hop]
+        return audio.reshape(z.shape[0], 1, -1)
+
+
+def init_random_weights(model: nn.Module) -> None:
+    """Fills every `DenseGeneral` (allocated uninitialized) with scaled normal weights."""
+    with torch.no_grad():
+        for module in model.modules():
+            if isinstance(module, DenseGeneral):
+                fan_in = math.prod(module.in_shapes)
+                module.weight.normal_(0.0, fan_in**-0.5)
+
+
+def tiny_dia(
+    config: DiaConfig | None = None,
+    compute_dtype: str = "float32",
+    device: torch.device | str | None = "cpu",
+    seed: int = 0,
+    load_dac: bool = True,
+) -> Dia:
+    """Builds a `Dia` with random weights and (by default) a `StubDAC`, without any download.
+
+    Args:
+        config: Model configuration (default: `tiny_config()`).
+        compute_dtype: The computation dtype to use.
+        device: Device to run on (default: CPU; None selects the best available device).
+        seed: Seed of the weights and the codec, so two calls build identical models.
+        load_dac: Attach a `StubDAC`; if False, `generate` returns codes.
+
+    Returns:
+        A model in eval mode.
+    """
+    config = config or tiny_config()
+    device = torch.device(device) if isinstance(device, str) else device
+    codec = StubDAC(config.data.channels, seed=seed) if load_dac else False
+    with torch.random.fork_rng(devices=[]):
+        torch.manual_seed(seed)
+        dia = Dia(config, compute_dtype, device, load_dac=codec)
+        init_random_weights(dia.model)
+    dia._weights_info["weights"] = ("tiny_dia", seed, repr(config))
+    dia.model.to(dia.device)
+    dia.model.eval()
+    return dia
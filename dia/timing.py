@@ -0,0 +1,104 @@
+"""Per-stage timings of a generation, for results, profiling and timing hooks.
+
+`Dia` reports every stage of a batched generation as `(stage, seconds)`:
+
+    tokenize      text to byte tokens
+    encoder       text encoder (conditional and unconditional rows)
+    cross_attn    cross-attention K/V precompute (eager mode only; under torch.compile
+                  it is included in `encoder`)
+    prefill       decoder state setup and audio prompt prefill
+    decode_step   one decoder step for the whole batch (once per step)
+    sampling      token sampling within a step (eager mode only)
+    delay_revert  reverting the delay pattern of the generated codes
+    dac_decode    DAC decode of one row (once per row) or streaming window
+    generation    the whole batched generation
+
+Stages are always recorded in `dia.metrics`. `Dia.add_timing_hook` forwards them to any
+callable (e.g. a server's own metrics client), `Dia.profile_stages()` collects a
+`StageTimings` per generation, and `generate(..., return_result=True)` attaches one to
+every `GenerationResult`.
+
+Example:
+    remove = model.add_timing_hook(lambda stage, seconds: statsd.timing(f"dia.{stage}", seconds))
+
+    with model.profile_stages() as profiles:
+        model.generate(texts)
+    print(profiles[0].summary())
+"""
+
+from dataclasses import dataclass, field
+from typing import Callable
+
+import numpy as np
+
+
+STAGES = (
+    "tokenize",
+    "encoder",
+    "cross_attn",
+    "prefill",
+    "decode_step",
+    "sampling",
+    "delay_revert",
+    "dac_decode",
+    "generation",
+)
+
+TimingHook = Callable[[str, float], None]
+
+# Stages recorded once per step or row, stored as lists.
+_REPEATED_STAGES = {"decode_step": "decode_steps", "sampling": "sampling", "dac_decode": "dac_decode"}
+
+
+@dataclass
+class StageTimings:
+    """Seconds spent in each stage of one batched generation, shared by all of its rows.
+
+    Attributes:
+        tokenize: Tokenization time.
+        encoder: Text encoder time (including cross-attention K/V under torch.compile).
+        cross_attn: Cross-attention K/V precompute time, or None under torch.compile.
+        prefill: Decoder setup and audio prompt prefill time.
+        decode_steps: Wall time of every decoder step, in order.
+        sampling: Sampling time of every decoder step (empty under torch.compile).
+        delay_revert: Time to revert the delay pattern.
+        dac_decode: DAC decode time of every row, in row order.
+        total: Wall time of the whole generation.
+    """
+
+    tokenize: float = 0.0
+    encoder: float = 0.0
+    cross_attn: float | None = None
+    prefill: float = 0.0
+    decode_steps: list[float] = field(default_factory=list)
+    sampling: list[float] = field(default_factory=list)
+    delay_revert: float = 0.0
+    dac_decode: list[float] = field(default_factory=list)
+    total: float = 0.0
+
+    def add(self, stage: str, seconds: float) -> None:
+        """Adds one measurement of `stage` (one of `STAGES`)."""
+        if stage in _REPEATED_STAGES:
+            getattr(self, _REPEATED_STAGES[stage]).append(seconds)
+        elif stage == "generation":
+            self.total = seconds
+        else:
+            setattr(self, stage, (getattr(self, stage) or 0.0) + seconds)
+
+    def summary(self) -> dict[str, float | None]:
+        """Total seconds per stage, plus the decode step count and p50/p95 latency."""
+        steps = np.asarray(self.decode_steps, dtype=np.float64)
+        return {
+            "tokenize": self.tokenize,
+            "encoder": self.encoder,
+            "cross_attn": self.cross_attn,
+            "prefill": self.prefill,
+            "decode": float(steps.sum()),
+            "decode_steps": len(steps),
+            "decode_step_p50": float(np.percentile(steps, 50)) if len(steps) else None,
+            "decode_step_p95": float(np.percentile(steps, 95)) if len(steps) else None,
+            "sampling": sum(self.sampling) if self.sampling else None,
+            "delay_revert": self.delay_revert,
+            "dac_decode": sum(self.dac_decode),
+            "total": self.total,
+        }
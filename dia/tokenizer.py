@@ -0,0 +1,95 @@
+"""Byte-level text tokenization for the Dia encoder.
+
+Texts are UTF-8 encoded with the speaker tags `[S1]` and `[S2]` replaced by the
+bytes `0x01` and `0x02`. A whole batch is turned into one padded tensor with a single
+`np.frombuffer` call and one host-to-device copy.
+"""
+
+from dataclasses import dataclass
+
+import numpy as np
+import torch
+
+
+MIN_TEXT_BUCKET = 128
+SPEAKER_TOKENS = ((b"[S1]", b"\x01"), (b"[S2]", b"\x02"))
+
+
+def text_to_bytes(text: str) -> bytes:
+    """Encodes text into encoder byte tokens, without truncation."""
+    byte_text = text.encode("utf-8")
+    for tag, token in SPEAKER_TOKENS:
+        byte_text = byte_text.replace(tag, token)
+    return byte_text
+
+
+def bucket_text_length(length: int, max_len: int) -> int:
+    """Rounds a text length up to the next power-of-two bucket (128, 256, ...), capped at `max_len`.
+
+    Bucketing keeps the number of distinct encoder shapes small (for torch.compile) while
+    letting encoder and cross-attention cost follow the actual text length.
+    """
+    bucket = MIN_TEXT_BUCKET
+    while bucket < length:
+        bucket *= 2
+    return min(bucket, max_len)
+
+
+@dataclass
+class TextBatch:
+    """A tokenized, padded batch of texts.
+
+    Attributes:
+        tokens: Padded token IDs, shape [B, 1, T_text].
+        lengths: Number of valid (non-padded) tokens per row, shape [B].
+        byte_texts: The (truncated) byte token sequence of each row.
+        original_lengths: Byte length of each row before truncation.
+        truncated: Indices of the rows that were longer than the maximum text length.
+    """
+
+    tokens: torch.Tensor
+    lengths: torch.Tensor
+    byte_texts: list[bytes]
+    original_lengths: list[int]
+    truncated: list[int]
+
+
+def tokenize_batch(
+    texts: list[str] | list[bytes],
+    max_len: int,
+    pad_value: int = 0,
+    device: torch.device | str | None = None,
+    bucket: bool = True,
+) -> TextBatch:
+    """Tokenizes and pads a batch of texts in one pass.
+
+    Args:
+        texts: Input texts, or byte sequences already produced by `text_to_bytes`.
+        max_len: The maximum text length; longer rows are truncated and reported.
+        pad_value: The padding token.
+        device: Device for the returned tensors.
+        bucket: Pad to the length bucket of the longest row instead of `max_len`.
+
+    Returns:
+        The tokenized batch.
+    """
+    byte_texts = [t if isinstance(t, bytes) else text_to_bytes(t) for t in texts]
+    original_lengths = np.fromiter((len(b) for b in byte_texts), dtype=np.int64, count=len(byte_texts))
+    lengths = np.minimum(original_lengths, max_len)
+    truncated = np.flatnonzero(original_lengths > max_len).tolist()
+    for i in truncated:
+        byte_texts[i] = byte_texts[i][:max_len]
+
+    seq_len = bucket_text_length(int(lengths.max(initial=0)), max_len) if bucket else max_len
+    flat = np.frombuffer(b"".join(byte_texts), dtype=np.uint8)
+    tokens = np.full((len(byte_texts), seq_len), pad_value, dtype=np.int64)
+    # Row-major order of the valid positions matches the concatenation order of `flat`.
+    tokens[np.arange(seq_len)[None, :] < lengths[:, None]] = flat
+
+    return TextBatch(
+        tokens=torch.from_numpy(tokens).unsqueeze(1).to(device),
+        lengths=torch.from_numpy(lengths).to(device),
+        byte_texts=byte_texts,
+        original_lengths=original_lengths.tolist(),
+        truncated=truncated,
+    )
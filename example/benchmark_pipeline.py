@@ -0,0 +1,106 @@
+"""Benchmark how `dia pipeline` scales with the number of CPU worker processes.
+
+Every run generates the same synthetic manifest with a fixed total number of cores,
+split evenly between the workers (1 x 16 threads, 2 x 8, 4 x 4, ...). The report lists
+rows/s, audio seconds per wall second, the speedup over a single worker, and each
+worker's resident memory split into anonymous and file-backed pages; with memory-mapped
+weights the file-backed part is shared between workers.
+
+Usage:
+    dia convert --output ./dia-f32 --dtype float32
+    python example/benchmark_pipeline.py --bundle ./dia-f32 --workers 1 2 4 8 --cores 16 --output pipeline.json
+"""
+
+import argparse
+import json
+import os
+import tempfile
+
+from dia.batch import ManifestEntry, ProgressLog
+from dia.pipeline import run_pipeline
+
+
+test_cases = [
+    "[S1] Dia is an open weights text to dialogue model.",
+    "[S1] Dia is an open weights text to dialogue model. [S2] You get full control over scripts and voices.",
+    "[S1] Wow. Amazing. (laughs) [S2] Try it now on GitHub or Hugging Face.",
+]
+
+
+def make_entries(args, output_dir: str) -> list[ManifestEntry]:
+    return [
+        ManifestEntry(
+            id=str(i),
+            text=test_cases[i % len(test_cases)],
+            output=os.path.join(output_dir, f"{i}.wav"),
+            seed=args.seed,
+            max_tokens=args.max_tokens,
+        )
+        for i in range(args.rows)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark dia pipeline scaling across worker counts.")
+    parser.add_argument("--bundle", type=str, required=True, help="Inference bundle written by `dia convert`.")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--cores", type=int, default=os.cpu_count(), help="Total cores shared by the workers.")
+    parser.add_argument("--rows", type=int, default=32, help="Rows to generate per run.")
+    parser.add_argument("--max-tokens", type=int, default=172, help="Audio tokens per row (~86 per second).")
+    parser.add_argument("--batch-size", type=int, default=4)
+    parser.add_argument("--pin-cores", action="store_true", help="Pin each worker to its own cores.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=str, default=None, help="Write the JSON report here.")
+    args = parser.parse_args()
+
+    report = {"rows": args.rows, "max_tokens": args.max_tokens, "cores": args.cores, "runs": []}
+    baseline = None
+    for num_workers in args.workers:
+        threads = max(1, args.cores // num_workers)
+        with tempfile.TemporaryDirectory() as output_dir:
+            progress = ProgressLog(os.path.join(output_dir, "progress.jsonl"))
+            stats = run_pipeline(
+                make_entries(args, output_dir),
+                args.bundle,
+                progress,
+                num_workers,
+                threads,
+                args.batch_size,
+                pin_cores=args.pin_cores,
+                verbose=False,
+            )
+        # Model loading is included in wall time; report it separately so it can be subtracted.
+        rows_per_second = stats.rows / stats.wall_seconds
+        baseline = baseline or rows_per_second
+        rss = list(stats.worker_rss.values())
+        run = {
+            "workers": num_workers,
+            "threads_per_worker": threads,
+            "rows": stats.rows,
+            "failed": stats.failed,
+            "wall_seconds": stats.wall_seconds,
+            "first_load_seconds": stats.load_seconds,
+            "rows_per_second": rows_per_second,
+            "audio_seconds_per_second": stats.audio_seconds / stats.wall_seconds,
+            "speedup": rows_per_second / baseline,
+            "worker_rss_mb": sum(r.get("VmRSS", 0) for r in rss) / max(len(rss), 1) / 2**20,
+            "worker_anon_mb": sum(r.get("RssAnon", 0) for r in rss) / max(len(rss), 1) / 2**20,
+            "worker_file_mb": sum(r.get("RssFile", 0) for r in rss) / max(len(rss), 1) / 2**20,
+            "errors": stats.errors,
+        }
+        report["runs"].append(run)
+        print(
+            f"{num_workers:>2} workers x {threads:>2} threads: {run['rows_per_second']:6.2f} rows/s, "
+            f"{run['audio_seconds_per_second']:6.2f} audio s/s, speedup {run['speedup']:.2f}x, "
+            f"per-worker RSS {run['worker_rss_mb']:.0f} MB (anon {run['worker_anon_mb']:.0f} MB, "
+            f"file {run['worker_file_mb']:.0f} MB)"
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote report to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
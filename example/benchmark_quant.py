@@ -0,0 +1,116 @@
+"""Benchmark weight-only quantization on CPU and report token agreement against fp32.
+
+Generation is greedy (temperature=0) with DAC disabled, so every mode returns raw
+codebook indices that can be compared frame by frame with the fp32 reference.
+
+Usage:
+    python example/benchmark_quant.py --max-tokens 344 --output quant_report.json
+"""
+
+import argparse
+import gc
+import json
+import time
+
+import numpy as np
+import torch
+
+from dia.model import Dia
+
+
+test_cases = [
+    "[S1] Dia is an open weights text to dialogue model.",
+    "[S1] Dia is an open weights text to dialogue model. [S2] You get full control over scripts and voices. [S1] Wow. Amazing. (laughs)",
+]
+
+
+def token_agreement(reference: np.ndarray, candidate: np.ndarray) -> dict:
+    """Compares two `[T, C]` code arrays over their common length."""
+    common = min(len(reference), len(candidate))
+    if common == 0:
+        return {"frames_compared": 0, "frame_agreement": 0.0, "channel0_agreement": 0.0, "first_divergence": 0}
+    ref, cand = reference[:common], candidate[:common]
+    frame_match = (ref == cand).all(axis=1)
+    mismatches = np.flatnonzero(~frame_match)
+    return {
+        "frames_compared": int(common),
+        "reference_frames": int(len(reference)),
+        "candidate_frames": int(len(candidate)),
+        "frame_agreement": float(frame_match.mean()),
+        "channel0_agreement": float((ref[:, 0] == cand[:, 0]).mean()),
+        "token_agreement": float((ref == cand).mean()),
+        "first_divergence": int(mismatches[0]) if len(mismatches) else None,
+    }
+
+
+def run_mode(args, weight_quant: str | None) -> dict:
+    model = Dia.from_pretrained(
+        args.repo_id, compute_dtype="float32", device=torch.device("cpu"), load_dac=False, weight_quant=weight_quant
+    )
+    # Warm up
+    model.generate(test_cases[0], max_tokens=32, temperature=0.0)
+
+    codes, timings = [], []
+    for text in test_cases:
+        torch.manual_seed(args.seed)
+        start = time.perf_counter()
+        output = model.generate(text, max_tokens=args.max_tokens, temperature=0.0)
+        timings.append(time.perf_counter() - start)
+        codes.append(output)
+
+    weight_bytes = sum(t.numel() * t.element_size() for t in model.model.state_dict().values())
+    del model
+    gc.collect()
+
+    total_frames = sum(len(c) for c in codes)
+    return {
+        "weight_quant": weight_quant or "none",
+        "weight_bytes": weight_bytes,
+        "seconds": sum(timings),
+        "tokens_per_second": total_frames / sum(timings),
+        "codes": codes,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark weight-only quantization against fp32 on CPU.")
+    parser.add_argument("--repo-id", type=str, default="nari-labs/Dia-1.6B")
+    parser.add_argument("--max-tokens", type=int, default=344, help="Audio tokens per case (~86 per second).")
+    parser.add_argument("--modes", type=str, nargs="+", default=["int8", "int4"])
+    parser.add_argument("--threads", type=int, default=None, help="torch intra-op threads.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=str, default=None, help="Write the JSON report here.")
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    reference = run_mode(args, None)
+    report = {"max_tokens": args.max_tokens, "threads": torch.get_num_threads(), "modes": []}
+    for result in [reference] + [run_mode(args, mode) for mode in args.modes]:
+        agreement = [token_agreement(ref, cand) for ref, cand in zip(reference["codes"], result["codes"])]
+        report["modes"].append(
+            {
+                "weight_quant": result["weight_quant"],
+                "weight_mb": result["weight_bytes"] / 2**20,
+                "tokens_per_second": result["tokens_per_second"],
+                "speedup_vs_fp32": result["tokens_per_second"] / reference["tokens_per_second"],
+                "agreement": agreement,
+            }
+        )
+
+    for entry in report["modes"]:
+        mean_frame = np.mean([a["frame_agreement"] for a in entry["agreement"]])
+        print(
+            f"{entry['weight_quant']:>5}: {entry['weight_mb']:8.1f} MB, {entry['tokens_per_second']:6.2f} tokens/s "
+            f"({entry['speedup_vs_fp32']:.2f}x), frame agreement vs fp32 {mean_frame:.3f}"
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote report to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+"""Shared fixtures. Every test runs offline on CPU with the random-weight model of `dia.testing`."""
+
+import pytest
+import torch
+
+from dia.testing import tiny_dia
+
+
+@pytest.fixture
+def model():
+    """A fresh tiny model, so tests that enable caches or detectors do not leak state."""
+    return tiny_dia()
+
+
+@pytest.fixture
+def decoder_logits():
+    """Returns a function computing the first decode step's logits, shape [2B, C, V].
+
+    The first step sees the text only through cross-attention, so these logits compare the
+    whole encode path (tokenize, encoder, cross K/V, masks) between two setups.
+    """
+
+    def run(model, texts: list[str]) -> torch.Tensor:
+        with torch.inference_mode():
+            loop = model._start_generation(texts, None, 32)
+            loop.dec_state.prepare_step(loop.dec_step)
+            tokens = loop.dec_output.get_tokens_at(loop.dec_step).repeat_interleave(2, dim=0)
+            return model.model.decoder.decode_step(tokens, loop.dec_state, loop.current_idx)[:, -1].float()
+
+    return run
@@ -0,0 +1,20 @@
+import numpy as np
+
+from dia.batch import ManifestEntry, generate_batch, plan_batches
+
+
+def entry(row_id: str, text: str, seed: int | None = None) -> ManifestEntry:
+    return ManifestEntry(id=row_id, text=text, output=f"{row_id}.wav", seed=seed, max_tokens=48)
+
+
+def test_seeded_row_independent_of_batch(model):
+    seeded = entry("a", "[S1] Hello there.", seed=11)
+    alone = generate_batch(model, [seeded])[0]
+    batched = generate_batch(model, [entry("b", "[S1] Another line.", 2), seeded, entry("c", "[S2] Third.")])[1]
+    np.testing.assert_array_equal(batched, alone)
+
+
+def test_seeds_do_not_split_batches():
+    entries = [entry(str(i), "[S1] Hello there.", seed=i) for i in range(4)]
+    batches = plan_batches(entries, batch_size=8, max_frames=1024)
+    assert [len(b) for b in batches] == [4]
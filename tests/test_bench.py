@@ -0,0 +1,22 @@
+from dia.bench import SCENARIOS, run_scenario, scenario_texts
+
+
+def test_batched_scenarios_use_distinct_texts():
+    for scenario in SCENARIOS.values():
+        if scenario.batch_size > 1:
+            assert len(set(scenario_texts(scenario))) == scenario.batch_size
+
+
+def test_batched_scenario_encodes_every_row(model, monkeypatch):
+    encoded_rows = []
+    run_encoder = model._run_encoder
+
+    def counting_run_encoder(tokens, lengths):
+        encoded_rows.append(tokens.shape[0])
+        return run_encoder(tokens, lengths)
+
+    monkeypatch.setattr(model, "_run_encoder", counting_run_encoder)
+    report = run_scenario(model, SCENARIOS["short-b4"], "float32", warmup=0, repeats=1, max_tokens=32)
+
+    assert encoded_rows == [4]
+    assert report["frames_per_run"] > 0
@@ -0,0 +1,44 @@
+import torch
+
+from dia.testing import tiny_config, tiny_dia
+from dia.tokenizer import bucket_text_length, tokenize_batch
+
+
+SHORT = "[S1] Hello there."
+LONG = "[S1] " + "a much longer line " * 16
+
+
+def test_bucket_lengths():
+    assert bucket_text_length(1, 1024) == 128
+    assert bucket_text_length(129, 1024) == 256
+    assert bucket_text_length(300, 1024) == 512
+    assert bucket_text_length(2000, 1024) == 1024
+
+
+def test_short_text_invariant_to_batch_bucket(decoder_logits):
+    model = tiny_dia(tiny_config(text_length=512))
+    assert len(LONG) > 256
+
+    alone = decoder_logits(model, [SHORT])  # 128-byte bucket
+    batched = decoder_logits(model, [SHORT, LONG])  # 512-byte bucket
+
+    torch.testing.assert_close(batched[:2], alone, atol=1e-5, rtol=1e-5)
+
+
+def test_bucketed_matches_unbucketed(decoder_logits, monkeypatch):
+    model = tiny_dia(tiny_config(text_length=512))
+    bucketed = decoder_logits(model, [SHORT, "[S1] Hi."])
+
+    # Pad every text to the full `text_length`, as before length buckets existed.
+    shapes = []
+
+    def tokenize_full(texts):
+        batch = tokenize_batch(texts, model.config.data.text_length, model.config.data.text_pad_value, bucket=False)
+        shapes.append(batch.tokens.shape[-1])
+        return batch
+
+    monkeypatch.setattr(model, "_tokenize", tokenize_full)
+    unbucketed = decoder_logits(model, [SHORT, "[S1] Hi."])
+
+    assert shapes == [512]
+    torch.testing.assert_close(unbucketed, bucketed, atol=1e-5, rtol=1e-5)
@@ -0,0 +1,84 @@
+import pytest
+import torch
+
+from dia.convert import convert_checkpoint, find_bundle_dir, read_manifest
+from dia.model import Dia
+from dia.testing import StubDAC
+
+
+TEXTS = ["[S1] Hello there.", "[S1] A different line."]
+CPU = torch.device("cpu")
+
+
+@pytest.fixture
+def checkpoint(model, tmp_path):
+    config_path = tmp_path / "config.json"
+    checkpoint_path = tmp_path / "model.pth"
+    model.config.save(str(config_path))
+    torch.save(model.model.state_dict(), checkpoint_path)
+    return str(config_path), str(checkpoint_path)
+
+
+def relative_error(actual: torch.Tensor, expected: torch.Tensor) -> float:
+    return ((actual - expected).norm() / expected.norm()).item()
+
+
+@pytest.mark.parametrize(("weight_quant", "tolerance"), [(None, 1e-6), ("int8", 0.05), ("int4", 0.5)])
+def test_bundle_round_trip(model, checkpoint, tmp_path, decoder_logits, weight_quant, tolerance):
+    config_path, checkpoint_path = checkpoint
+    bundle_dir = convert_checkpoint(
+        str(tmp_path / "bundle"), config_path=config_path, checkpoint_path=checkpoint_path, weight_quant=weight_quant
+    )
+    assert read_manifest(bundle_dir)["weight_quant"] == weight_quant
+
+    loaded = Dia.from_local(None, bundle_dir, device=CPU, load_dac=StubDAC())
+    in_memory = Dia.from_local(config_path, checkpoint_path, device=CPU, load_dac=StubDAC(), weight_quant=weight_quant)
+    actual = decoder_logits(loaded, TEXTS)
+
+    # The bundle stores exactly what quantizing at load time computes.
+    torch.testing.assert_close(actual, decoder_logits(in_memory, TEXTS), atol=1e-5, rtol=1e-5)
+    assert relative_error(actual, decoder_logits(model, TEXTS)) < tolerance
+    assert loaded.generate(TEXTS[0], max_tokens=32, return_codes=True).ndim == 2
+
+
+def test_int4_group_size_from_manifest(model, checkpoint, tmp_path, decoder_logits):
+    config_path, checkpoint_path = checkpoint
+    bundle_dir = convert_checkpoint(
+        str(tmp_path / "bundle"),
+        config_path=config_path,
+        checkpoint_path=checkpoint_path,
+        weight_quant="int4",
+        group_size=32,
+    )
+    assert read_manifest(bundle_dir)["group_size"] == 32
+
+    loaded = Dia.from_local(None, bundle_dir, device=CPU, load_dac=StubDAC())
+    assert relative_error(decoder_logits(loaded, TEXTS), decoder_logits(model, TEXTS)) < 0.5
+
+
+def test_mmap_bundle_matches(model, checkpoint, tmp_path, decoder_logits):
+    config_path, checkpoint_path = checkpoint
+    bundle_dir = convert_checkpoint(str(tmp_path / "bundle"), config_path=config_path, checkpoint_path=checkpoint_path)
+    loaded = Dia.from_local(None, bundle_dir, device=CPU, load_dac=StubDAC(), mmap_weights=True)
+    torch.testing.assert_close(decoder_logits(loaded, TEXTS), decoder_logits(model, TEXTS), atol=1e-5, rtol=1e-5)
+
+
+def test_checkpoint_next_to_bundle_is_loaded_as_checkpoint(model, tmp_path, decoder_logits):
+    # `dia convert --output` into the checkpoint's own directory.
+    config_path, checkpoint_path = str(tmp_path / "config.json"), str(tmp_path / "model.pth")
+    model.config.save(config_path)
+    torch.save(model.model.state_dict(), checkpoint_path)
+    convert_checkpoint(str(tmp_path), config_path=config_path, checkpoint_path=checkpoint_path, weight_quant="int8")
+
+    assert find_bundle_dir(checkpoint_path) is None
+    assert find_bundle_dir(str(tmp_path / "model.safetensors")) == str(tmp_path)
+    assert find_bundle_dir(str(tmp_path)) == str(tmp_path)
+    loaded = Dia.from_local(config_path, checkpoint_path, device=CPU, load_dac=StubDAC())
+    torch.testing.assert_close(decoder_logits(loaded, TEXTS), decoder_logits(model, TEXTS), atol=1e-5, rtol=1e-5)
+
+
+def test_foreign_manifest_is_not_a_bundle(tmp_path):
+    (tmp_path / "manifest.json").write_text('{"format": "something-else"}')
+    (tmp_path / "model.safetensors").write_bytes(b"")
+    assert find_bundle_dir(str(tmp_path)) is None
+    assert find_bundle_dir(str(tmp_path / "model.safetensors")) is None
@@ -0,0 +1,41 @@
+import torch
+
+from dia.control import CancellationToken, cancel_rows
+
+
+TEXTS = ["[S1] Hello there.", "[S1] A different line."]
+
+
+def test_on_step_stops_all_rows(model):
+    torch.manual_seed(0)
+    steps = []
+
+    def on_step(info):
+        steps.append(info.step)
+        return info.step >= 20
+
+    results = model.generate(TEXTS, max_tokens=256, on_step=on_step, return_result=True)
+
+    assert steps[-1] == 20
+    for result in results:
+        assert result.finish_reason == "stopped"
+        assert result.length <= 21
+        assert result.codes.shape == (result.length, model.config.data.channels)
+
+
+def test_on_step_stops_one_row(model):
+    torch.manual_seed(0)
+    results = model.generate(TEXTS, max_tokens=64, on_step=lambda info: [info.step >= 10, False], return_result=True)
+
+    assert results[0].finish_reason == "stopped"
+    assert results[1].finish_reason in ("eos", "max_tokens")
+    assert results[0].length < results[1].length
+
+
+def test_cancelled_token_ends_stream(model):
+    token = CancellationToken()
+    token.cancel()
+    chunks = list(model.generate_stream(TEXTS[0], max_tokens=256, on_step=cancel_rows([token])))
+
+    assert chunks[-1].is_final
+    assert len(chunks[-1].codes) == 0
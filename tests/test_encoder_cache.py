@@ -0,0 +1,31 @@
+import torch
+
+
+TEXTS = ["[S1] Hello there.", "[S1] A different line. [S2] And a reply.", "[S1] Hello there."]
+
+
+def test_dedup_matches_separate_encodes(model, decoder_logits):
+    batch = decoder_logits(model, TEXTS)
+    for i, text in enumerate(TEXTS):
+        alone = decoder_logits(model, [text])
+        torch.testing.assert_close(batch[2 * i : 2 * i + 2], alone, atol=1e-5, rtol=1e-5)
+
+
+def test_cache_hits_match_uncached(model, decoder_logits):
+    uncached = decoder_logits(model, TEXTS)
+    cache = model.enable_encoder_cache(64 * 2**20)
+
+    missed = decoder_logits(model, TEXTS)
+    assert cache.stats()["misses"] == 2 and cache.stats()["hits"] == 0
+    hit = decoder_logits(model, TEXTS)
+    assert cache.stats()["hits"] == 2
+
+    torch.testing.assert_close(missed, uncached, atol=1e-5, rtol=1e-5)
+    torch.testing.assert_close(hit, uncached, atol=1e-5, rtol=1e-5)
+
+
+def test_cached_text_reused_in_other_bucket(model, decoder_logits):
+    model.enable_encoder_cache(64 * 2**20)
+    alone = decoder_logits(model, [TEXTS[0]])
+    with_long = decoder_logits(model, [TEXTS[0], "[S1] " + "word " * 40])
+    torch.testing.assert_close(with_long[:2], alone, atol=1e-5, rtol=1e-5)
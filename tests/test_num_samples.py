@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+import torch
+
+
+TEXTS = ["[S1] Hello there.", "[S1] A different line."]
+
+
+def test_generate_returns_takes_per_text(model):
+    torch.manual_seed(0)
+    outputs = model.generate(TEXTS, max_tokens=48, num_samples=3, return_result=True)
+
+    assert len(outputs) == 2
+    for takes in outputs:
+        assert len(takes) == 3
+        for take in takes:
+            assert take.codes.shape == (take.length, model.config.data.channels)
+    # Takes sample independently from one shared prefill.
+    assert not np.array_equal(outputs[0][0].codes, outputs[0][1].codes)
+
+
+def test_single_text_returns_list_of_takes(model):
+    torch.manual_seed(0)
+    takes = model.generate(TEXTS[0], max_tokens=32, num_samples=2)
+
+    assert isinstance(takes, list) and len(takes) == 2
+    assert all(audio.ndim == 1 for audio in takes)
+
+
+def test_stream_tags_text_and_take(model):
+    torch.manual_seed(0)
+    final = [(c.row, c.sample) for c in model.generate_stream(TEXTS, max_tokens=32, num_samples=2) if c.is_final]
+    assert sorted(final) == [(0, 0), (0, 1), (1, 0), (1, 1)]
+
+
+def test_on_step_sees_text_rows(model):
+    seen = []
+    model.generate(TEXTS, max_tokens=32, num_samples=2, on_step=lambda info: seen.append(info.rows))
+    assert seen[0] == [0, 0, 1, 1]
+
+
+def test_num_samples_must_be_positive(model):
+    with pytest.raises(ValueError):
+        model.generate(TEXTS[0], num_samples=0)
@@ -0,0 +1,51 @@
+import functools
+import queue
+
+import pytest
+import torch
+
+from dia.batch import ManifestEntry
+from dia.convert import convert_checkpoint
+from dia.model import Dia
+from dia.pipeline import WorkerConfig, _worker_main
+from dia.testing import StubDAC
+
+
+pytest.importorskip("soundfile")
+
+
+@pytest.fixture
+def bundle(model, tmp_path):
+    config_path, checkpoint_path = str(tmp_path / "config.json"), str(tmp_path / "model.pth")
+    model.config.save(config_path)
+    torch.save(model.model.state_dict(), checkpoint_path)
+    return convert_checkpoint(str(tmp_path / "bundle"), config_path=config_path, checkpoint_path=checkpoint_path)
+
+
+def run_worker(bundle: str, batches: list[list[ManifestEntry]], monkeypatch) -> list[tuple]:
+    """Runs one pipeline worker in this process (with a stub codec) over the batches."""
+    monkeypatch.setattr(Dia, "from_local", functools.partial(Dia.from_local, load_dac=StubDAC()))
+    tasks, results = queue.Queue(), queue.Queue()
+    for index, batch in enumerate(batches):
+        tasks.put((index, batch))
+    tasks.put(None)
+    threads = torch.get_num_threads()
+    try:
+        _worker_main(0, WorkerConfig(bundle, threads=threads), tasks, results)
+    finally:
+        torch.set_num_threads(threads)
+    return [results.get_nowait() for _ in range(results.qsize())]
+
+
+def test_seeded_row_renders_the_same_in_any_batch(bundle, tmp_path, monkeypatch):
+    def entry(row_id: str, text: str, seed: int | None) -> ManifestEntry:
+        return ManifestEntry(id=row_id, text=text, output=str(tmp_path / f"{row_id}.wav"), seed=seed, max_tokens=48)
+
+    alone = entry("alone", "[S1] Hello there.", 11)
+    batched = entry("batched", "[S1] Hello there.", 11)
+    others = [entry("b", "[S1] Another line.", 2), entry("c", "[S2] A third, longer line of dialogue.", None)]
+    messages = run_worker(bundle, [[alone], [others[0], batched, others[1]]], monkeypatch)
+
+    rows = {m[3]: m[4] for m in messages if m[0] == "row"}
+    assert rows == {"alone": "ok", "batched": "ok", "b": "ok", "c": "ok"}
+    assert (tmp_path / "alone.wav").read_bytes() == (tmp_path / "batched.wav").read_bytes()
@@ -0,0 +1,75 @@
+import asyncio
+
+import numpy as np
+import torch
+
+from dia.cache import ResultCache
+from dia.convert import convert_checkpoint
+from dia.model import Dia
+from dia.serving import BatchingWorker, GenerationRequest
+from dia.testing import StubDAC, tiny_dia
+
+
+TEXT = "[S1] Hello there."
+
+
+def run(worker: BatchingWorker, request: GenerationRequest) -> np.ndarray:
+    async def submit():
+        try:
+            return await worker.submit(request)
+        finally:
+            await worker.stop()
+
+    return asyncio.run(submit())
+
+
+def test_fingerprint_tracks_weights_and_numerics(model, tmp_path):
+    assert model.fingerprint() == tiny_dia().fingerprint()
+    assert model.fingerprint() != tiny_dia(seed=1).fingerprint()
+
+    quantized = tiny_dia()
+    quantized._quantize_weights("int8")
+    assert quantized.fingerprint() != model.fingerprint()
+
+    detecting = tiny_dia()
+    detecting.set_runaway_detection(True)
+    assert detecting.fingerprint() != model.fingerprint()
+
+    config_path, checkpoint_path = str(tmp_path / "config.json"), str(tmp_path / "model.pth")
+    model.config.save(config_path)
+    torch.save(model.model.state_dict(), checkpoint_path)
+    bundles = {
+        quant: convert_checkpoint(
+            str(tmp_path / f"bundle-{quant}"),
+            config_path=config_path,
+            checkpoint_path=checkpoint_path,
+            weight_quant=quant,
+        )
+        for quant in (None, "int8")
+    }
+    cpu = torch.device("cpu")
+    fingerprints = {
+        Dia.from_local(config_path, checkpoint_path, device=cpu, load_dac=StubDAC()).fingerprint(),
+        Dia.from_local(
+            config_path, checkpoint_path, device=cpu, load_dac=StubDAC(), weight_quant="int8"
+        ).fingerprint(),
+        *(Dia.from_local(None, path, device=cpu, load_dac=StubDAC()).fingerprint() for path in bundles.values()),
+    }
+    assert len(fingerprints) == 4
+
+
+def test_result_cache_is_keyed_by_model(model, tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    request = {"text": TEXT, "max_tokens": 48, "seed": 3}
+
+    first = run(BatchingWorker(model, result_cache=ResultCache(cache_dir)), GenerationRequest(**request))
+
+    # A different model sharing the directory misses; the same model hits, even after a restart.
+    other = GenerationRequest(**request)
+    run(BatchingWorker(tiny_dia(seed=1), result_cache=ResultCache(cache_dir)), other)
+    assert not other.cached
+
+    again = GenerationRequest(**request)
+    audio = run(BatchingWorker(tiny_dia(), result_cache=ResultCache(cache_dir)), again)
+    assert again.cached
+    np.testing.assert_allclose(audio, first, atol=1e-6)
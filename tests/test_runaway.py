@@ -0,0 +1,80 @@
+import torch
+
+from dia.runaway import BUDGET, REPEAT, SILENCE, RunawayConfig, RunawayDetector
+
+
+TEXT = "[S1] Hello there."
+QUIET = RunawayConfig(silence_frames=None, repeat_frames=None, budget_factor=None)
+
+
+def feed(detector: RunawayDetector, codes: list[int]) -> tuple[int | None, int, int | None]:
+    """Feeds one row's channel-0 codes; returns the first flagged step, its reason and end step."""
+    for step, code in enumerate(codes):
+        reason, end = detector.update(torch.tensor([code]), step)
+        if reason.item():
+            return step, reason.item(), end.item()
+    return None, 0, None
+
+
+def test_detects_silence():
+    config = RunawayConfig(silence_frames=10, repeat_frames=None, budget_factor=None, trim_silence_frames=2)
+    detector = RunawayDetector(config, prefill_steps=[0], predicted_frames=[100.0], device=torch.device("cpu"))
+    step, reason, end = feed(detector, [1, 2, 3, 4, 5] + [7] * 20)
+
+    assert reason == SILENCE
+    assert step == 15  # the 10th frame equal to the one before
+    assert end == 6 + 2  # the silent run starts at step 6; two frames of it are kept
+
+
+def test_detects_repeat():
+    config = RunawayConfig(silence_frames=None, repeat_frames=12, budget_factor=None)
+    detector = RunawayDetector(config, prefill_steps=[0], predicted_frames=[100.0], device=torch.device("cpu"))
+    step, reason, end = feed(detector, [9, 8] + [1, 2, 3] * 10)
+
+    assert reason == REPEAT
+    assert step == 2 + 3 + 12 - 1
+    assert end == 2 + 3  # one period of the pattern is kept
+
+
+def test_detects_budget_and_ignores_prompt():
+    config = RunawayConfig(silence_frames=3, repeat_frames=None, budget_factor=1.0, budget_headroom=5)
+    detector = RunawayDetector(config, prefill_steps=[10], predicted_frames=[4.0], device=torch.device("cpu"))
+    # Constant codes inside the prompt do not count as silence.
+    step, reason, _ = feed(detector, [0] * 10 + list(range(100, 130)))
+
+    assert reason == BUDGET
+    assert step == 10 + 4 + 5
+
+
+def test_generation_ends_on_budget(model):
+    torch.manual_seed(0)
+    config = RunawayConfig(silence_frames=None, repeat_frames=None, budget_factor=0.0, budget_headroom=20)
+    result = model.generate(TEXT, max_tokens=512, runaway=config, return_result=True)
+
+    assert result.finish_reason == "budget"
+    assert result.length <= 21
+
+
+def test_generation_ends_on_silence_and_trims(model):
+    torch.manual_seed(0)
+    config = RunawayConfig(
+        silence_frames=30,
+        silence_codes=tuple(range(1024)),
+        repeat_frames=None,
+        budget_factor=None,
+        trim_silence_frames=5,
+    )
+    result = model.generate(TEXT, max_tokens=512, runaway=config, return_result=True)
+
+    assert result.finish_reason == "silence"
+    assert result.length <= 5
+
+
+def test_detection_off_by_default(model):
+    torch.manual_seed(0)
+    result = model.generate(TEXT, max_tokens=64, return_result=True)
+    assert result.finish_reason in ("eos", "max_tokens")
+
+    model.set_runaway_detection(QUIET)
+    torch.manual_seed(0)
+    assert model.generate(TEXT, max_tokens=64, return_result=True).length == result.length
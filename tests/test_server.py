@@ -0,0 +1,133 @@
+import base64
+import io
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+import torchaudio
+
+
+pytest.importorskip("fastapi")
+pytest.importorskip("httpx")
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+from dia.cache import ResultCache  # noqa: E402
+from dia.server import create_app, wav_bytes  # noqa: E402
+
+
+SPEECH = "/v1/audio/speech"
+BODY = {"input": "[S1] Hello there.", "max_tokens": 32}
+
+
+def can_decode_audio() -> bool:
+    """Whether torchaudio has a backend that decodes in-memory audio files."""
+    try:
+        torchaudio.load(io.BytesIO(wav_bytes(np.zeros(441, dtype=np.float32), 44100)))
+    except ImportError:
+        return False
+    return True
+
+
+def post_together(client: TestClient, bodies: list[dict]) -> list:
+    """Posts the bodies concurrently so the worker can batch or coalesce them."""
+    with ThreadPoolExecutor(len(bodies)) as pool:
+        return list(pool.map(lambda body: client.post(SPEECH, json=body), bodies))
+
+
+def test_speech_returns_wav(model):
+    with TestClient(create_app(model)) as client:
+        response = client.post(SPEECH, json=BODY)
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "audio/wav"
+    assert response.content[:4] == b"RIFF" and len(response.content) > 44
+    assert response.headers["X-Batch-Size"] == "1"
+    assert response.headers["X-Cache"] == "miss"
+    assert float(response.headers["X-Generation-Time-Ms"]) > 0
+
+
+def test_speech_streams_pcm(model):
+    with TestClient(create_app(model)) as client:
+        response = client.post(SPEECH, json={**BODY, "stream": True, "response_format": "pcm"})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "audio/pcm"
+    assert len(response.content) > 0 and len(response.content) % 2 == 0
+    assert "X-Time-To-First-Chunk-Ms" in response.headers
+
+
+def test_concurrent_requests_share_a_batch(model):
+    bodies = [BODY, {**BODY, "input": "[S1] A different line."}]
+    with TestClient(create_app(model, max_wait_ms=500)) as client:
+        responses = post_together(client, bodies)
+
+    assert [r.status_code for r in responses] == [200, 200]
+    assert [r.headers["X-Batch-Size"] for r in responses] == ["2", "2"]
+
+
+def test_identical_seeded_requests_coalesce(model):
+    body = {**BODY, "seed": 3}
+    with TestClient(create_app(model, max_wait_ms=500)) as client:
+        responses = post_together(client, [body, body])
+        health = client.get("/health").json()
+
+    assert [r.status_code for r in responses] == [200, 200]
+    assert sorted(r.headers["X-Coalesced"] for r in responses) == ["false", "true"]
+    assert responses[0].content == responses[1].content
+    assert health["coalescing"]["hits"] == 1
+
+
+def test_seeded_request_served_from_cache(model, tmp_path):
+    body = {**BODY, "seed": 3}
+    with TestClient(create_app(model, result_cache=ResultCache(str(tmp_path)))) as client:
+        first = client.post(SPEECH, json=body)
+        second = client.post(SPEECH, json=body)
+        unseeded = client.post(SPEECH, json=BODY)
+        health = client.get("/health").json()
+
+    assert first.headers["X-Cache"] == "miss"
+    assert second.headers["X-Cache"] == "hit"
+    assert second.content == first.content
+    assert unseeded.headers["X-Cache"] == "miss"
+    assert health["result_cache"]["codes"]["entries"] == 1
+
+
+@pytest.mark.parametrize(
+    ("body", "status"),
+    [
+        ({"input": ""}, 422),
+        ({**BODY, "response_format": "mp3"}, 422),
+        ({**BODY, "top_p": 0}, 422),
+        ({**BODY, "max_tokens": 0}, 422),
+        ({**BODY, "speed": 10}, 422),
+        ({**BODY, "audio_prompt": "not base64!"}, 400),
+    ],
+)
+def test_invalid_requests_are_rejected(model, body, status):
+    with TestClient(create_app(model)) as client:
+        assert client.post(SPEECH, json=body).status_code == status
+
+
+def test_health_and_metrics(model):
+    with TestClient(create_app(model)) as client:
+        health = client.get("/health")
+        client.post(SPEECH, json=BODY)
+        response = client.get("/metrics")
+
+    assert health.status_code == 200
+    assert health.json()["status"] == "ok" and health.json()["queue_depth"] == 0
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert 'dia_requests_total{outcome="generated"}' in response.text
+
+
+@pytest.mark.skipif(not can_decode_audio(), reason="torchaudio has no audio decoding backend")
+def test_undecodable_audio_prompt_is_rejected(model):
+    prompt = base64.b64encode(b"RIFF but not a WAV file").decode()
+    with TestClient(create_app(model)) as client:
+        response = client.post(SPEECH, json={**BODY, "audio_prompt": prompt})
+        streamed = client.post(SPEECH, json={**BODY, "audio_prompt": prompt, "stream": True})
+    assert response.status_code == 400
+    assert "audio_prompt" in response.json()["detail"]
+    assert streamed.status_code == 400
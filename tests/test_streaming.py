@@ -0,0 +1,34 @@
+import numpy as np
+import torch
+
+
+TEXT = "[S1] Hello there. [S2] Hi!"
+
+
+def test_stream_matches_generate(model):
+    torch.manual_seed(0)
+    result = model.generate(TEXT, max_tokens=96, return_result=True)
+
+    torch.manual_seed(0)
+    chunks = list(model.generate_stream(TEXT, max_tokens=96, chunk_frames=8))
+
+    assert [c.is_final for c in chunks].count(True) == 1 and chunks[-1].is_final
+    np.testing.assert_array_equal(chunks[-1].codes, result.codes)
+    starts = [c.start_sample for c in chunks]
+    assert starts == sorted(starts)
+    audio = np.concatenate([c.audio for c in chunks])
+    assert audio.shape == result.waveform.shape
+    np.testing.assert_allclose(audio, result.waveform, atol=1e-5)
+
+
+def test_stream_batch_rows_match_generate(model):
+    texts = [TEXT, "[S1] A second, longer line of dialogue."]
+    torch.manual_seed(1)
+    results = model.generate(texts, max_tokens=64, return_result=True)
+
+    torch.manual_seed(1)
+    final = {c.row: c for c in model.generate_stream(texts, max_tokens=64) if c.is_final}
+
+    assert sorted(final) == [0, 1]
+    for row, result in enumerate(results):
+        np.testing.assert_array_equal(final[row].codes, result.codes)